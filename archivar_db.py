@@ -0,0 +1,15 @@
+from sqlmodel import Session
+from utils.db import engine
+from utils.archivo import archivar_eliminados, ARCHIVO_RETENCION_DIAS
+from utils import bus
+
+# Avisa a los workers en marcha para que desalojen lo archivado de su caché
+bus.iniciar(engine, escuchar=False)
+
+# Pensado para ejecutarse periódicamente (p. ej. un Cron Job de Render)
+print(f"Archivando filas eliminadas hace más de {ARCHIVO_RETENCION_DIAS} días...")
+
+with Session(engine) as session:
+    movidas = archivar_eliminados(session)
+
+print(f"Filas archivadas: {movidas}")
@@ -0,0 +1,41 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import shutil
+from pathlib import Path
+from utils.compresion import TIPOS_COMPRIMIBLES, brotli
+
+# Copia cada archivo de static/ a static/dist con el hash del contenido en el nombre
+# (css/style.css -> css/style.3f2a9c1b7d.css) y genera sus variantes .br/.gz.
+# Las plantillas lo resuelven con static_url() leyendo static/dist/manifest.json.
+# Pensado para el paso de build del despliegue: python build_static.py
+
+ORIGEN = Path("static")
+DESTINO = ORIGEN / "dist"
+
+if DESTINO.exists():
+    shutil.rmtree(DESTINO)
+DESTINO.mkdir(parents=True)
+
+manifiesto = {}
+for archivo in sorted(ORIGEN.rglob("*")):
+    if not archivo.is_file() or DESTINO in archivo.parents:
+        continue
+    relativa = archivo.relative_to(ORIGEN)
+    datos = archivo.read_bytes()
+    huella = hashlib.sha256(datos).hexdigest()[:10]
+    versionada = relativa.with_name(f"{relativa.stem}.{huella}{relativa.suffix}")
+
+    salida = DESTINO / versionada
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_bytes(datos)
+    if mimetypes.guess_type(archivo.name)[0] in TIPOS_COMPRIMIBLES:
+        salida.with_name(salida.name + ".gz").write_bytes(gzip.compress(datos, 9, mtime=0))
+        if brotli:
+            salida.with_name(salida.name + ".br").write_bytes(brotli.compress(datos, quality=11))
+
+    manifiesto[relativa.as_posix()] = f"dist/{versionada.as_posix()}"
+
+(DESTINO / "manifest.json").write_text(json.dumps(manifiesto, indent=2), encoding="utf-8")
+print(f"Archivos estáticos versionados: {len(manifiesto)}")
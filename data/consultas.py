@@ -0,0 +1,55 @@
+from typing import Optional
+from sqlmodel import Session, select
+from sqlalchemy import func
+from data.models import Usuario, PeliculaSerie, Valoracion, Rutina
+from utils.cache import cache
+from utils.ranking import ranking
+from utils import tendencias
+
+DEFAULT_MOVIE_IMG = '/static/img/placeholder_movie.jpg'
+
+
+def contar_activos(session: Session):
+    """Conteo de filas activas de cada modelo en una sola consulta."""
+    def calcular():
+        fila = session.exec(select(
+            select(func.count(Usuario.id_usuario)).where(Usuario.is_active == True).scalar_subquery(),
+            select(func.count(PeliculaSerie.id_titulo)).where(PeliculaSerie.is_active == True).scalar_subquery(),
+            select(func.count(Valoracion.id_valoracion)).where(Valoracion.is_active == True).scalar_subquery(),
+            select(func.count(Rutina.id_rutina)).where(Rutina.is_active == True).scalar_subquery(),
+        )).one()
+        return {
+            "n_usuarios": fila[0],
+            "n_titulos": fila[1],
+            "n_valoraciones": fila[2],
+            "n_rutinas": fila[3],
+        }
+
+    return cache.obtener("conteos_activos", calcular,
+                         dependencias=("usuario", "peliculaserie", "valoracion", "rutina"))
+
+
+
+def img_titulo(session: Session, id_titulo: int):
+    """Imagen de un título (activo o no) para /img/{id}; "" si no tiene y None si no existe."""
+    def calcular():
+        fila = session.exec(select(PeliculaSerie.id_titulo, PeliculaSerie.img)
+                            .where(PeliculaSerie.id_titulo == id_titulo)).first()
+        return None if fila is None else (fila[1] or "")
+
+    return cache.obtener(("img_titulo", id_titulo), calcular, dependencias=(f"peliculaserie:{id_titulo}",))
+
+def top_titulos(session: Session, limite: int = 5, id_genero: Optional[int] = None):
+    """Títulos activos con mejor promedio ponderado (ver utils/ranking.py)."""
+    top = ranking.top(limite, id_genero)
+    for titulo in top:
+        titulo["img_url"] = titulo.pop("img") or DEFAULT_MOVIE_IMG
+    return top
+
+
+def titulos_en_tendencia(session: Session, ventana: int, limite: int = 5, id_genero: Optional[int] = None):
+    """Títulos con más valoraciones recientes; `ventana` es la vida media en días (ver utils/tendencias.py)."""
+    titulos = tendencias.tendencias(session, ventana, limite, id_genero)
+    for titulo in titulos:
+        titulo["img_url"] = titulo.pop("img") or DEFAULT_MOVIE_IMG
+    return titulos
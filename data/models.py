@@ -1,21 +1,30 @@
 ﻿from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, func, literal_column
 from typing import Optional, List
 from datetime import date, datetime
 
+# Las filas archivadas (ver utils/archivo.py) conservan su id: en SQLite, sin AUTOINCREMENT, una fila
+# nueva podría reutilizar el id de la última archivada. PostgreSQL nunca reutiliza los de la secuencia.
+SIN_REUTILIZAR_IDS = {"sqlite_autoincrement": True}
+
 
 class Usuario(SQLModel, table=True):
+    __table_args__ = SIN_REUTILIZAR_IDS
     id_usuario: Optional[int] = Field(default=None, primary_key=True, index=True)
     nombre: str
     correo: str = Field(unique=True, index=True)
     clave: str
     is_active: bool = Field(default=True)
-    deleted_at: Optional[datetime] = Field(default=None, nullable=True)
+    deleted_at: Optional[datetime] = Field(default=None, nullable=True, index=True)
     img: Optional[str] = Field(default=None, description="User image")
+    # Entra en el token de la URL del calendario (utils/auth.py): incrementarla revoca la URL anterior
+    version_calendario: int = Field(default=0)
     valoraciones: List["Valoracion"] = Relationship(back_populates="usuario")
     rutinas: List["Rutina"] = Relationship(back_populates="usuario")
 
 
 class PeliculaSerie(SQLModel, table=True):
+    __table_args__ = SIN_REUTILIZAR_IDS
     id_titulo: Optional[int] = Field(default=None, primary_key=True, index=True)
     titulo: str = Field(unique=True, index=True)
     genero: str
@@ -23,20 +32,37 @@ class PeliculaSerie(SQLModel, table=True):
     duracion: int
     descripcion: str
     is_active: bool = Field(default=True)
-    deleted_at: Optional[datetime] = Field(default=None, nullable=True)
+    deleted_at: Optional[datetime] = Field(default=None, nullable=True, index=True)
     img: Optional[str] = Field(default=None, description="User image")
 
     valoraciones: List["Valoracion"] = Relationship(back_populates="titulo")
     rutinas: List["Rutina"] = Relationship(back_populates="titulo")
 
 
+# Géneros normalizados: `clave` es el nombre sin tildes ni mayúsculas ("Acción" y "accion" son el mismo).
+# PeliculaSerie.genero se conserva como etiqueta de presentación ("Acción, Drama") y se
+# escribe siempre junto con sus filas de TituloGenero (ver utils/generos.py).
+
+class Genero(SQLModel, table=True):
+    id_genero: Optional[int] = Field(default=None, primary_key=True)
+    nombre: str
+    clave: str = Field(unique=True)
+
+
+class TituloGenero(SQLModel, table=True):
+    __tablename__ = "titulo_genero"
+    id_titulo_FK: int = Field(foreign_key="peliculaserie.id_titulo", primary_key=True)
+    id_genero_FK: int = Field(foreign_key="genero.id_genero", primary_key=True, index=True)
+
+
 class Valoracion(SQLModel, table=True):
+    __table_args__ = SIN_REUTILIZAR_IDS
     id_valoracion: Optional[int] = Field(default=None, primary_key=True, index=True)
     puntuacion: float
     comentario: str
     fecha: date
     is_active: bool = Field(default=True)
-    deleted_at: Optional[datetime] = Field(default=None, nullable=True)
+    deleted_at: Optional[datetime] = Field(default=None, nullable=True, index=True)
 
     id_usuario_FK: int = Field(foreign_key="usuario.id_usuario")
     id_titulo_FK: int = Field(foreign_key="peliculaserie.id_titulo")
@@ -46,12 +72,17 @@ class Valoracion(SQLModel, table=True):
 
 
 class Rutina(SQLModel, table=True):
+    __table_args__ = SIN_REUTILIZAR_IDS
     id_rutina: Optional[int] = Field(default=None, primary_key=True, index=True)
     nombre: str = Field(index=True)
     fecha_inicio: date
     fecha_fin: date
     is_active: bool = Field(default=True)
-    deleted_at: Optional[datetime] = Field(default=None, nullable=True)
+    deleted_at: Optional[datetime] = Field(default=None, nullable=True, index=True)
+    # Cambian con cada UPDATE: DTSTAMP/LAST-MODIFIED y SEQUENCE del evento en el calendario (utils/ical.py)
+    modificada: Optional[datetime] = Field(default_factory=datetime.now, nullable=True,
+                                           sa_column_kwargs={"onupdate": datetime.now})
+    secuencia: int = Field(default=0, sa_column_kwargs={"onupdate": literal_column("secuencia + 1")})
 
     id_usuario_FK: int = Field(foreign_key="usuario.id_usuario")
     id_titulo_FK: int = Field(foreign_key="peliculaserie.id_titulo")
@@ -60,6 +91,145 @@ class Rutina(SQLModel, table=True):
     titulo: Optional["PeliculaSerie"] = Relationship(back_populates="rutinas")
 
 
+# Índices de prefijo para el autocompletado: lower(col) LIKE 'texto%'.
+# En PostgreSQL text_pattern_ops permite usarlos con LIKE aunque la collation no sea "C".
+def _indice_prefijo(nombre: str, columna):
+    etiqueta = f"{columna.name}_lower"
+    return Index(nombre, func.lower(columna).label(etiqueta), postgresql_ops={etiqueta: "text_pattern_ops"})
+
+
+_indice_prefijo("ix_usuario_nombre_prefijo", Usuario.__table__.c.nombre)
+_indice_prefijo("ix_usuario_correo_prefijo", Usuario.__table__.c.correo)
+_indice_prefijo("ix_peliculaserie_titulo_prefijo", PeliculaSerie.__table__.c.titulo)
+
+# Una sola valoración activa por usuario y título (las inactivas pueden repetirse).
+# Lo usan los INSERT ... ON CONFLICT de utils/valoraciones.py.
+VALORACION_ACTIVA = Valoracion.__table__.c.is_active == True
+Index("ux_valoracion_activa", Valoracion.__table__.c.id_usuario_FK, Valoracion.__table__.c.id_titulo_FK,
+      unique=True, postgresql_where=VALORACION_ACTIVA, sqlite_where=VALORACION_ACTIVA)
+
+# Periodos de las rutinas activas, para las consultas de solapamiento de utils/agenda.py.
+# En PostgreSQL además un GiST sobre daterange(inicio, fin, '[]'), que sirve al operador &&.
+RUTINA_ACTIVA = Rutina.__table__.c.is_active == True
+RUTINA_PERIODO = func.daterange(Rutina.__table__.c.fecha_inicio, Rutina.__table__.c.fecha_fin, literal_column("'[]'"))
+Index("ix_rutina_usuario_periodo", Rutina.__table__.c.id_usuario_FK, Rutina.__table__.c.fecha_inicio,
+      Rutina.__table__.c.fecha_fin, postgresql_where=RUTINA_ACTIVA, sqlite_where=RUTINA_ACTIVA)
+Index("ix_rutina_periodo", RUTINA_PERIODO, postgresql_using="gist",
+      postgresql_where=RUTINA_ACTIVA).ddl_if(dialect="postgresql")
+
+
+# --- Archivo: filas eliminadas hace más de ARCHIVO_RETENCION_DIAS (ver utils/archivo.py) ---
+# Misma forma que las tablas activas, sin llaves foráneas para poder archivar en cualquier orden.
+
+class UsuarioArchivo(SQLModel, table=True):
+    __tablename__ = "usuario_archivo"
+    id_usuario: int = Field(primary_key=True)
+    nombre: str
+    correo: str
+    clave: str
+    is_active: bool = Field(default=False)
+    deleted_at: Optional[datetime] = Field(default=None, nullable=True, index=True)
+    img: Optional[str] = Field(default=None)
+    version_calendario: int = Field(default=0)
+    archived_at: datetime
+
+
+class PeliculaSerieArchivo(SQLModel, table=True):
+    __tablename__ = "peliculaserie_archivo"
+    id_titulo: int = Field(primary_key=True)
+    titulo: str
+    genero: str
+    anio_estreno: int
+    duracion: int
+    descripcion: str
+    is_active: bool = Field(default=False)
+    deleted_at: Optional[datetime] = Field(default=None, nullable=True, index=True)
+    img: Optional[str] = Field(default=None)
+    archived_at: datetime
+
+
+class ValoracionArchivo(SQLModel, table=True):
+    __tablename__ = "valoracion_archivo"
+    id_valoracion: int = Field(primary_key=True)
+    puntuacion: float
+    comentario: str
+    fecha: date
+    is_active: bool = Field(default=False)
+    deleted_at: Optional[datetime] = Field(default=None, nullable=True, index=True)
+    id_usuario_FK: int = Field(index=True)
+    id_titulo_FK: int = Field(index=True)
+    archived_at: datetime
+
+
+class RutinaArchivo(SQLModel, table=True):
+    __tablename__ = "rutina_archivo"
+    id_rutina: int = Field(primary_key=True)
+    nombre: str
+    fecha_inicio: date
+    fecha_fin: date
+    is_active: bool = Field(default=False)
+    deleted_at: Optional[datetime] = Field(default=None, nullable=True, index=True)
+    modificada: Optional[datetime] = Field(default=None, nullable=True)
+    secuencia: int = Field(default=0)
+    id_usuario_FK: int = Field(index=True)
+    id_titulo_FK: int = Field(index=True)
+    archived_at: datetime
+
+
+
+# --- Imágenes subidas al bucket, guardadas por el hash de su contenido (ver supa/almacen.py) ---
+# Hace de índice hash -> URL para no volver a subir lo mismo; `referencias` cuenta las filas de
+# usuario/peliculaserie que la usan y las que llegan a 0 se borran en lote (limpiar_imagenes.py).
+
+class Imagen(SQLModel, table=True):
+    hash: str = Field(primary_key=True)
+    ruta: str
+    url: str = Field(unique=True, index=True)
+    tipo: Optional[str] = Field(default=None)
+    tamano: int
+    referencias: int = Field(default=0)
+    ultimo_uso: datetime = Field(index=True)
+
+
+# --- Tendencias: actividad de valoraciones por título con decaimiento exponencial (ver utils/tendencias.py) ---
+# `puntaje` es la suma de 2^((fecha - origen) / vida_media) de sus valoraciones activas: el decaimiento
+# se aplica al leer y todas las filas de una vida media comparten `origen`, así que ordenar por
+# `puntaje` ya es ordenar por actividad reciente.
+
+class Tendencia(SQLModel, table=True):
+    id_titulo_FK: int = Field(foreign_key="peliculaserie.id_titulo", primary_key=True)
+    vida_media: int = Field(primary_key=True)  # días
+    puntaje: float = Field(default=0.0)
+    origen: date
+
+
+Index("ix_tendencia_puntaje", Tendencia.__table__.c.vida_media, Tendencia.__table__.c.puntaje)
+
+
+# --- Series de valoraciones: conteo, suma y suma de cuadrados por periodo (ver utils/series.py) ---
+# `periodo` es el primer día del día/semana/mes. id_titulo = 0 e id_genero = 0 son "todos"; una fila
+# tiene a lo sumo uno de los dos. Se mantienen al escribir valoraciones, igual que las tendencias.
+
+class ResumenValoracion(SQLModel, table=True):
+    __tablename__ = "resumen_valoracion"
+    # Orden de la llave: una serie (grano, título, género) se lee como un rango de periodos
+    grano: str = Field(primary_key=True)  # "dia", "semana" o "mes"
+    id_titulo: int = Field(default=0, primary_key=True)
+    id_genero: int = Field(default=0, primary_key=True)
+    periodo: date = Field(primary_key=True)
+    total: int = Field(default=0)
+    suma: float = Field(default=0.0)
+    suma_cuadrados: float = Field(default=0.0)
+
+
+# --- Tokens de refresco ya usados (ver utils/auth.py) ---
+# La llave primaria hace que solo un worker pueda consumir cada jti; las filas caducadas se borran solas.
+
+class TokenUsado(SQLModel, table=True):
+    __tablename__ = "token_usado"
+    jti: str = Field(primary_key=True)
+    exp: int = Field(index=True)
+
 
 class UsuarioCreate(SQLModel):
     nombre: str
@@ -69,14 +239,15 @@ class UsuarioCreate(SQLModel):
 
 class PeliculaSerieCreate(SQLModel):
     titulo: str
-    genero: str
+    genero: str = Field(description="Uno o varios géneros separados por comas")
     anio_estreno: int
     duracion: int
     descripcion: str
+    img: Optional[str] = Field(default=None, description="URL de una imagen subida al almacén")
 
 
 class ValoracionCreate(SQLModel):
-    puntuacion: float
+    puntuacion: float = Field(ge=0, le=5)
     comentario: str
     fecha: date
     id_usuario_FK: int
@@ -89,3 +260,75 @@ class RutinaCreate(SQLModel):
     fecha_fin: date
     id_usuario_FK: int
     id_titulo_FK: int
+
+
+# --- Esquemas de lectura: lo que devuelve la API (sin `clave` ni relaciones) ---
+
+class UsuarioRead(SQLModel):
+    id_usuario: int
+    nombre: str
+    correo: str
+    img: Optional[str] = None
+    is_active: bool
+    deleted_at: Optional[datetime] = None
+
+
+class PeliculaSerieRead(SQLModel):
+    id_titulo: int
+    titulo: str
+    genero: str
+    anio_estreno: int
+    duracion: int
+    descripcion: str
+    img: Optional[str] = None
+    is_active: bool
+    deleted_at: Optional[datetime] = None
+
+
+class ValoracionRead(SQLModel):
+    id_valoracion: int
+    puntuacion: float
+    comentario: str
+    fecha: date
+    id_usuario_FK: int
+    id_titulo_FK: int
+    is_active: bool
+    deleted_at: Optional[datetime] = None
+
+
+class RutinaRead(SQLModel):
+    id_rutina: int
+    nombre: str
+    fecha_inicio: date
+    fecha_fin: date
+    id_usuario_FK: int
+    id_titulo_FK: int
+    is_active: bool
+    deleted_at: Optional[datetime] = None
+
+
+class ValoracionDatos(SQLModel):
+    puntuacion: float = Field(ge=0, le=5)
+    comentario: str
+    fecha: date
+
+
+class LoteIds(SQLModel):
+    ids: List[int]
+    cascada: bool = False
+
+
+class Credenciales(SQLModel):
+    correo: str
+    clave: str
+
+
+class TokenRefresco(SQLModel):
+    refresh_token: str
+
+
+class Tokens(SQLModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
@@ -0,0 +1,132 @@
+from datetime import date
+from typing import NamedTuple, Optional
+from sqlmodel import Session, select
+from sqlalchemy import func, or_
+from data.models import Usuario, PeliculaSerie, Valoracion, Rutina
+from utils.agenda import solapa
+
+# Modelos de lectura con solo las columnas que necesita cada vista.
+# Cada consulta es select(columnas...) y sus filas se convierten directamente en la tupla.
+
+LARGO_RESUMEN = 60
+
+
+class UsuarioCard(NamedTuple):
+    id_usuario: int
+    nombre: str
+    correo: str
+    img: Optional[str]
+
+
+class UsuarioOption(NamedTuple):
+    id_usuario: int
+    nombre: str
+    correo: str
+
+
+class TituloCard(NamedTuple):
+    id_titulo: int
+    titulo: str
+    genero: str
+    anio_estreno: int
+    img: Optional[str]
+    resumen: str  # Primeros LARGO_RESUMEN caracteres de la descripción
+
+
+class TituloOption(NamedTuple):
+    id_titulo: int
+    titulo: str
+
+
+class ValoracionDetalle(NamedTuple):
+    id_valoracion: int
+    puntuacion: float
+    comentario: str
+    fecha: date
+    id_titulo_FK: int
+    id_usuario_FK: int
+    usuario_nombre: str
+    usuario_img: Optional[str]
+
+
+class RutinaCalendario(NamedTuple):
+    id_rutina: int
+    id_titulo_FK: int
+    fecha_inicio: date
+    fecha_fin: date
+    titulo: Optional[str]  # None si el título está inactivo
+
+
+def _proyectar(session: Session, tipo, query):
+    return [tipo(*fila) for fila in session.exec(query).all()]
+
+
+def tarjetas_usuarios(session: Session):
+    return _proyectar(session, UsuarioCard, select(
+        Usuario.id_usuario, Usuario.nombre, Usuario.correo, Usuario.img
+    ).where(Usuario.is_active == True))
+
+
+def tarjetas_titulos(session: Session, ids):
+    """Tarjetas de los títulos `ids`, en ese mismo orden (la página que devuelve utils/catalogo.py)."""
+    tarjetas = {t.id_titulo: t for t in _proyectar(session, TituloCard, select(
+        PeliculaSerie.id_titulo, PeliculaSerie.titulo, PeliculaSerie.genero, PeliculaSerie.anio_estreno,
+        PeliculaSerie.img, func.substr(PeliculaSerie.descripcion, 1, LARGO_RESUMEN)
+    ).where(PeliculaSerie.id_titulo.in_(ids)))}
+    return [tarjetas[i] for i in ids if i in tarjetas]
+
+
+def _prefijo(columna, texto: str):
+    # lower(col) LIKE 'texto%' usa los índices *_prefijo declarados en data/models.py
+    texto = texto.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return func.lower(columna).like(texto + "%", escape="\\")
+
+
+def buscar_usuarios(session: Session, texto: str, limite: int = 10):
+    """Usuarios activos cuyo nombre o correo empieza por `texto` (autocompletado)."""
+    return _proyectar(session, UsuarioOption, select(
+        Usuario.id_usuario, Usuario.nombre, Usuario.correo
+    ).where(Usuario.is_active == True, or_(_prefijo(Usuario.nombre, texto), _prefijo(Usuario.correo, texto)))
+     .order_by(Usuario.nombre).limit(limite))
+
+
+def buscar_titulos(session: Session, texto: str, limite: int = 10):
+    """Títulos activos cuyo nombre empieza por `texto` (autocompletado)."""
+    return _proyectar(session, TituloOption, select(
+        PeliculaSerie.id_titulo, PeliculaSerie.titulo
+    ).where(PeliculaSerie.is_active == True, _prefijo(PeliculaSerie.titulo, texto))
+     .order_by(PeliculaSerie.titulo).limit(limite))
+
+
+def opcion_usuario(session: Session, id_usuario: Optional[int]):
+    """Opción ya elegida en un formulario (para mostrar su nombre sin cargar la lista)."""
+    if not id_usuario:
+        return None
+    fila = session.exec(select(Usuario.id_usuario, Usuario.nombre, Usuario.correo)
+                        .where(Usuario.id_usuario == id_usuario)).first()
+    return UsuarioOption(*fila) if fila else None
+
+
+def opcion_titulo(session: Session, id_titulo: Optional[int]):
+    if not id_titulo:
+        return None
+    fila = session.exec(select(PeliculaSerie.id_titulo, PeliculaSerie.titulo)
+                        .where(PeliculaSerie.id_titulo == id_titulo)).first()
+    return TituloOption(*fila) if fila else None
+
+
+def valoraciones_activas(session: Session):
+    """Valoraciones activas con el nombre e imagen de su usuario (un solo JOIN)."""
+    return _proyectar(session, ValoracionDetalle, select(
+        Valoracion.id_valoracion, Valoracion.puntuacion, Valoracion.comentario, Valoracion.fecha,
+        Valoracion.id_titulo_FK, Valoracion.id_usuario_FK, Usuario.nombre, Usuario.img
+    ).join(Usuario, Usuario.id_usuario == Valoracion.id_usuario_FK).where(Valoracion.is_active == True))
+
+
+def rutinas_calendario(session: Session, id_usuario: int, desde: date, hasta: date):
+    """Rutinas activas del usuario que tocan algún día entre `desde` y `hasta`."""
+    return _proyectar(session, RutinaCalendario, select(
+        Rutina.id_rutina, Rutina.id_titulo_FK, Rutina.fecha_inicio, Rutina.fecha_fin, PeliculaSerie.titulo
+    ).outerjoin(PeliculaSerie, (PeliculaSerie.id_titulo == Rutina.id_titulo_FK) & (PeliculaSerie.is_active == True))
+     .where(Rutina.is_active == True, Rutina.id_usuario_FK == id_usuario,
+            solapa(session.get_bind().dialect.name, desde, hasta)))
@@ -1,24 +1,14 @@
-import os
-import uuid
-from pathlib import Path
 from fastapi import UploadFile
-
-STORE_IMG = "upload"
-
-Path(STORE_IMG).mkdir(parents=True, exist_ok=True)
+from supa import almacen
 
 async def upload_file(file: UploadFile):
-    content = await file.read()
-    filename_org = file.filename
-    filename = f"{uuid.uuid4()}_{filename_org}"
-    file_path = os.path.join(STORE_IMG, filename)
-
-    with open(file_path, "wb") as f:
-        f.write(content)
+    # Se sube al almacén (deduplicado por contenido). La imagen queda sin referencias hasta que
+    # una fila guarda la URL con almacen.cambiar_referencia; si nadie la usa, se recoge tras la gracia.
+    url = await almacen.guardar_imagen(file)
 
     return {
-        "filename": filename_org,
-        "url": f"{os.getcwd()}{file_path}",
-        "original name": filename_org,
-        "size": os.path.getsize(file_path),
-    }
\ No newline at end of file
+        "filename": file.filename,
+        "url": url,
+        "original name": file.filename,
+        "size": file.size,
+    }
@@ -1,9 +1,10 @@
 ﻿
 from utils.db import engine
-from sqlmodel import SQLModel
+from utils import esquema
+import data.models
 
 print("Creando tablas en la base de datos...")
 
-SQLModel.metadata.create_all(engine)
+esquema.migrar(engine)
 
 print("Â¡Tablas creadas correctamente!")
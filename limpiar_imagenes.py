@@ -0,0 +1,11 @@
+from sqlmodel import Session
+from utils.db import engine
+from supa.almacen import recolectar_huerfanas, IMAGENES_GRACIA_HORAS
+
+# Pensado para ejecutarse periódicamente, igual que archivar_db.py
+print(f"Borrando imágenes sin referencias desde hace más de {IMAGENES_GRACIA_HORAS} horas...")
+
+with Session(engine) as session:
+    borradas = recolectar_huerfanas(session)
+
+print(f"Imágenes borradas: {borradas}")
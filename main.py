@@ -1,74 +1,188 @@
-﻿from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+﻿import time
+_inicio_arranque = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException, Depends
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, RedirectResponse
 from sqlmodel import Session, select
-from utils.db import crear_db, get_session
-from data.models import Usuario, PeliculaSerie, Valoracion, Rutina
-from routers import usuario, peliculaSerie, valoracion, rutina, web
+from utils.db import crear_db, get_session, engine, replicas_lectura, DB_POOL_SIZE
+from utils.replicas import COOKIE_PRIMARIA, LECTURA_PRIMARIA_SEGUNDOS
+from utils.templates import templates
+from data import consultas
+from routers import usuario, peliculaSerie, valoracion, rutina, web, admin, auth, eventos, imagenes
+from utils import slow_queries, bus
+from utils.auth import SesionRequerida
+from utils import eventos as eventos_en_vivo
+from utils.compresion import Compresion, Estaticos
+from utils.admision import Admision
+from utils.catalogo import catalogo
+from utils.tendencias import TENDENCIA_VIDAS_MEDIAS
 import images
-from sqlalchemy import func, desc
+import logging
+import os
+import threading
+from dotenv import load_dotenv
+from urllib.parse import urlencode
+from sqlalchemy import text
+
+_fin_imports = time.perf_counter()
+
+load_dotenv()
+
+# Intentos de calentamiento antes de declarar el worker fallido (la espera se duplica en cada uno)
+CALENTAR_INTENTOS = int(os.getenv("CALENTAR_INTENTOS", "3"))
+CALENTAR_ESPERA_SEGUNDOS = float(os.getenv("CALENTAR_ESPERA_SEGUNDOS", "2"))
+
+# Los mensajes de la aplicación (cinehub.*) van a la salida estándar, como los de uvicorn
+if not logging.getLogger("cinehub").handlers:
+    _salida = logging.StreamHandler()
+    _salida.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logging.getLogger("cinehub").addHandler(_salida)
+    logging.getLogger("cinehub").setLevel(logging.INFO)
+
+logger = logging.getLogger("cinehub.arranque")
 
 app = FastAPI(
     title="CineHub API",
     description="Sistema de Gestión de Películas",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+app.mount("/static", Estaticos(directory="static"), name="static")
+app.add_middleware(Compresion)
+# Va por fuera de la compresión: rechazar una petición no debe costar nada
+app.add_middleware(Admision)
+app.state.listo = False
+app.state.fallido = False
+
+
+# Páginas de /web sin sesión: al formulario de inicio de sesión, volviendo después a la página pedida
+@app.exception_handler(SesionRequerida)
+async def pedir_sesion(request: Request, error: SesionRequerida):
+    return RedirectResponse(url=f"/web/login?{urlencode({'siguiente': error.siguiente})}", status_code=303)
+
+@app.middleware("http")
+async def registrar_ruta(request: Request, call_next):
+    # Permite asociar cada consulta lenta con la ruta que la originó
+    token = slow_queries.ruta_actual.set(f"{request.method} {request.url.path}")
+    try:
+        respuesta = await call_next(request)
+    finally:
+        slow_queries.ruta_actual.reset(token)
+    # Lee lo que acaba de escribir: sus lecturas van a la primaria durante un rato (ver utils/db.py)
+    if getattr(request.state, "escribio", False):
+        respuesta.set_cookie(COOKIE_PRIMARIA, "1", max_age=LECTURA_PRIMARIA_SEGUNDOS, httponly=True, samesite="lax")
+    return respuesta
+
+def _calentar():
+    # 1. Abrir las conexiones del pool (quedan disponibles al devolverlas)
+    conexiones = []
+    try:
+        for _ in range(DB_POOL_SIZE):
+            conexiones.append(engine.connect())
+            conexiones[-1].execute(text("SELECT 1"))
+    finally:
+        for conexion in conexiones:
+            conexion.close()
+
+    # 2. Compilar todas las plantillas
+    for nombre in templates.env.list_templates():
+        templates.env.get_template(nombre)
+
+    # 3. Precargar las consultas de la página de inicio
+    with Session(engine) as session:
+        consultas.contar_activos(session)
+        consultas.top_titulos(session, 5)
+
+    # 4. Cargar el catálogo en memoria de /web/titulos
+    catalogo.instantanea()
+
+
+def calentar():
+    """Prepara el worker antes de declararlo listo en /health/ready.
+
+    Si falla se reintenta; agotados los intentos el worker queda fallido y /health/live
+    responde 503 para que el orquestador lo reinicie.
+    """
+    inicio = time.perf_counter()
+    for intento in range(1, CALENTAR_INTENTOS + 1):
+        try:
+            _calentar()
+            break
+        except Exception:
+            logger.exception("Calentamiento fallido (intento %s de %s)", intento, CALENTAR_INTENTOS)
+            if intento < CALENTAR_INTENTOS:
+                time.sleep(CALENTAR_ESPERA_SEGUNDOS * 2 ** (intento - 1))
+    else:
+        app.state.fallido = True
+        return
+
+    app.state.tiempos_arranque["calentamiento_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    app.state.listo = True
+    logger.info("Worker listo: %s", app.state.tiempos_arranque)
+
 
 @app.on_event("startup")
 def startup():
+    inicio_db = time.perf_counter()
     crear_db()
+    bus.iniciar(engine)
+    eventos_en_vivo.iniciar()
+    replicas_lectura.iniciar()
+    fin = time.perf_counter()
+
+    # Desglose del arranque en milisegundos
+    app.state.tiempos_arranque = {
+        "imports_ms": round((_fin_imports - _inicio_arranque) * 1000, 1),
+        "esquema_ms": round((fin - inicio_db) * 1000, 1),
+        "total_ms": round((fin - _inicio_arranque) * 1000, 1),
+    }
+    logger.info("Arranque completado: %s", app.state.tiempos_arranque)
+
+    # El calentamiento corre en segundo plano: /health/live responde desde ya
+    threading.Thread(target=calentar, name="calentamiento", daemon=True).start()
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request, session: Session = Depends(get_session)):
-    n_usuarios = len(session.exec(select(Usuario).where(Usuario.is_active == True)).all())
-    n_titulos = len(session.exec(select(PeliculaSerie).where(PeliculaSerie.is_active == True)).all())
-    n_valoraciones = len(session.exec(select(Valoracion).where(Valoracion.is_active == True)).all())
-    n_rutinas = len(session.exec(select(Rutina).where(Rutina.is_active == True)).all())
+    conteos = consultas.contar_activos(session)
 
     # --- Lógica: Obtener 5 Títulos Mejor Valorados ---
-    ratings_grouped_by_title_query = (
-        select(
-            PeliculaSerie.id_titulo,
-            PeliculaSerie.titulo,
-            PeliculaSerie.img.label("img_url"),
-            func.avg(Valoracion.puntuacion).label("promedio_puntuacion"),
-        )
-        .join(Valoracion, PeliculaSerie.id_titulo == Valoracion.id_titulo_FK)
-        .where(PeliculaSerie.is_active == True, Valoracion.is_active == True)
-        .group_by(PeliculaSerie.id_titulo, PeliculaSerie.titulo, PeliculaSerie.img)
-        .order_by(desc("promedio_puntuacion"))
-        .limit(5)
-    )
-
-    top_rated_results = session.exec(ratings_grouped_by_title_query).all()
-
-    top_titles = []
-    for row in top_rated_results:
-        # Redondeo en Python
-        promedio_puntuacion_rounded = round(row[3], 1) if row[3] is not None else 0.0
-
-        top_titles.append({
-            "titulo": row[1],
-            "img_url": row[2] if row[2] else '/static/img/placeholder_movie.jpg',
-            "promedio_puntuacion": promedio_puntuacion_rounded,
-        })
+    top_titles = consultas.top_titulos(session, 5)
     # --- FIN Lógica ---
 
+    # Lo más valorado de los últimos días (vida media de una semana si está configurada)
+    ventana = 7 if 7 in TENDENCIA_VIDAS_MEDIAS else TENDENCIA_VIDAS_MEDIAS[0]
+    tendencia = consultas.titulos_en_tendencia(session, ventana, 5)
+
     return templates.TemplateResponse("index.html", {
         "request": request,
-        "n_usuarios": n_usuarios,
-        "n_titulos": n_titulos,
-        "n_valoraciones": n_valoraciones,
-        "n_rutinas": n_rutinas,
-        "top_titles": top_titles
+        **conteos,
+        "top_titles": top_titles,
+        "tendencia": tendencia,
+        "tendencia_ventana": ventana,
     })
 
+
+@app.get("/health/live", tags=["Salud"], summary="El proceso está vivo")
+async def health_live():
+    if app.state.fallido:
+        return JSONResponse(status_code=503, content={"status": "fallido"})
+    return {"status": "ok"}
+
+
+@app.get("/health/ready", tags=["Salud"], summary="El worker terminó el calentamiento")
+async def health_ready():
+    if not getattr(app.state, "listo", False):
+        return JSONResponse(status_code=503, content={"status": "fallido" if app.state.fallido else "calentando"})
+    return {"status": "ok"}
+
+app.include_router(web.publico)
 app.include_router(web.router)
 app.include_router(usuario.router)
 app.include_router(peliculaSerie.router)
 app.include_router(valoracion.router)
-app.include_router(rutina.router)
\ No newline at end of file
+app.include_router(rutina.router)
+app.include_router(admin.router)
+app.include_router(auth.router)
+app.include_router(eventos.router)
+app.include_router(imagenes.router)
\ No newline at end of file
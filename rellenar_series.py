@@ -0,0 +1,11 @@
+from utils.db import engine
+from utils.series import rellenar, SERIES_LOTE
+
+# Recalcula las series de valoraciones desde cero (normalmente se mantienen solas al escribir).
+# Confirma cada lote: mejor ejecutarlo sin escrituras de valoraciones en curso.
+print(f"Rellenando las series de valoraciones en lotes de {SERIES_LOTE}...")
+
+with engine.connect() as conn:
+    procesadas = rellenar(conn, confirmar=True)
+
+print(f"Valoraciones procesadas: {procesadas}")
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import HTMLResponse
+from utils import slow_queries, bus, admision, auth
+from utils.posters import posters
+from utils.catalogo import catalogo
+from utils.ranking import ranking
+from utils.templates import templates
+from utils.db import replicas_lectura
+
+router = APIRouter(
+    prefix="/web/admin",
+    tags=["Administración"],
+    dependencies=[Depends(auth.sesion_web)]
+)
+
+
+# def normal: lee los archivos del registro, así que va al threadpool y no bloquea el bucle
+@router.get("/consultas-lentas", response_class=HTMLResponse)
+def pagina_consultas_lentas(request: Request, limite: int = 20):
+    consultas = slow_queries.peores_consultas(limite)
+    return templates.TemplateResponse("consultas_lentas.html", {
+        "request": request,
+        "consultas": consultas,
+        "umbral_ms": slow_queries.SLOW_QUERY_MS,
+    })
+
+
+@router.get("/arranque", summary="Desglose de tiempos del último arranque")
+async def tiempos_arranque(request: Request):
+    return getattr(request.app.state, "tiempos_arranque", {})
+
+
+@router.get("/replicas", summary="Retraso y disponibilidad de las réplicas de lectura")
+def estado_replicas():
+    return replicas_lectura.estado()
+
+
+@router.get("/bus", summary="Eventos de invalidación enviados/recibidos y latencia de entrega")
+async def estado_bus():
+    return bus.metricas.resumen()
+
+
+@router.get("/admision", summary="Peticiones activas, en cola y rechazadas por cada límite")
+async def estado_admision():
+    return admision.metricas()
+
+
+@router.get("/posters", summary="Aciertos, descargas y tamaño del caché de pósters en disco")
+async def estado_posters():
+    return posters.metricas()
+
+
+@router.get("/catalogo", summary="Tamaño y recargas del catálogo en memoria")
+async def estado_catalogo():
+    return catalogo.metricas()
+
+
+@router.get("/ranking", summary="Parámetros, tamaño y recargas del ranking de títulos")
+async def estado_ranking():
+    return ranking.metricas()
@@ -0,0 +1,41 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session, select
+from utils.db import get_session
+from utils import auth
+from data.models import Usuario, Credenciales, TokenRefresco, Tokens
+
+router = APIRouter(
+    prefix="/auth",
+    tags=["Autenticación"]
+)
+
+@router.post("/login", response_model=Tokens, summary="Iniciar sesión (devuelve token de acceso y de refresco)")
+def login(credenciales: Credenciales, session: Session = Depends(get_session)):
+    usuario = auth.autenticar(session, credenciales.correo, credenciales.clave)
+    if not usuario:
+        raise HTTPException(status_code=401, detail="Correo o clave incorrectos")
+    return auth.emitir_tokens(usuario.id_usuario, usuario.clave)
+
+
+@router.post("/refrescar", response_model=Tokens, summary="Cambiar un token de refresco por un par nuevo")
+def refrescar(datos: TokenRefresco, session: Session = Depends(get_session)):
+    claims = auth.verificar(datos.refresh_token, "refresco")
+    # Único punto que consulta la base de datos: el usuario sigue activo y no cambió su clave
+    clave = session.exec(select(Usuario.clave)
+                         .where(Usuario.id_usuario == int(claims["sub"]), Usuario.is_active == True)).first()
+    if clave is None or auth.huella_clave(clave) != claims.get("clv"):
+        raise HTTPException(status_code=401, detail="Token inválido", headers={"WWW-Authenticate": "Bearer"})
+    # Cada token de refresco se usa una sola vez (en todos los workers)
+    if not auth.consumir_refresco(session, claims):
+        raise HTTPException(status_code=401, detail="Token inválido", headers={"WWW-Authenticate": "Bearer"})
+    return auth.emitir_tokens(int(claims["sub"]), clave)
+
+
+@router.post("/logout", response_model=dict, summary="Revocar el token de acceso (y el de refresco si se envía)")
+def logout(datos: Optional[TokenRefresco] = None, claims: dict = Depends(auth.token_actual),
+           session: Session = Depends(get_session)):
+    auth.revocar(claims)
+    if datos:
+        auth.consumir_refresco(session, auth.verificar(datos.refresh_token, "refresco"))
+    return {"mensaje": "Sesión cerrada"}
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from utils import auth
+from utils.eventos import difusor
+
+# Lleva comentarios y nombres de usuario: misma sesión que las páginas /web que lo consumen
+router = APIRouter(
+    prefix="/eventos",
+    tags=["Eventos"],
+    dependencies=[Depends(auth.sesion_web)]
+)
+
+
+@router.get("/valoraciones", summary="Eventos en vivo (SSE): valoraciones guardadas/eliminadas y top de títulos")
+async def eventos_valoraciones():
+    suscriptor = difusor.suscribir()
+
+    async def tramas():
+        try:
+            async for trama in suscriptor.tramas():
+                yield trama
+        finally:
+            difusor.cancelar(suscriptor)
+
+    return StreamingResponse(tramas(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # sin buffer en proxies tipo nginx
+    })
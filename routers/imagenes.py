@@ -0,0 +1,54 @@
+import logging
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from sqlmodel import Session
+from data import consultas
+from utils.db import get_session
+from utils.posters import posters, es_remota, version
+from utils.respuestas import sin_cambios
+
+logger = logging.getLogger("cinehub.imagenes")
+
+router = APIRouter(
+    tags=["Imágenes"]
+)
+
+CACHE_VERSIONADA = "public, max-age=31536000, immutable"
+# Sin ?v= (o con una versión vieja) la imagen del título puede cambiar: se revalida con el ETag
+CACHE_SIN_VERSION = "public, max-age=300"
+TROZO = 64 * 1024
+
+
+def _trozos(archivo):
+    # Generador normal: StreamingResponse lo recorre en el threadpool
+    with archivo:
+        while trozo := archivo.read(TROZO):
+            yield trozo
+
+
+@router.get("/img/{id_titulo}", summary="Póster de un título servido desde el caché local")
+async def poster_titulo(id_titulo: int, request: Request, v: Optional[str] = None,
+                        session: Session = Depends(get_session)):
+    img = consultas.img_titulo(session, id_titulo)
+    if img is None:
+        raise HTTPException(status_code=404, detail="Título no encontrado")
+    if not es_remota(img) or not posters.permitida(img):
+        # Locales y de otros sitios: el navegador las pide directamente, el servidor no las descarga
+        return RedirectResponse(url=img or consultas.DEFAULT_MOVIE_IMG, status_code=302)
+
+    try:
+        # Ya abierta: si otra petición la desaloja mientras se envía, esta respuesta no se corta
+        poster, archivo = await posters.abrir(img)
+    except Exception as error:
+        # Sin caché (bucket caído, respuesta inválida): el navegador la pide directamente
+        logger.warning("Error descargando el póster %s: %s", id_titulo, error)
+        return RedirectResponse(url=img, status_code=302)
+
+    cabeceras = {"ETag": poster.etag, "Cache-Control": CACHE_VERSIONADA if v == version(img) else CACHE_SIN_VERSION}
+    if sin_cambios(request, poster.etag):
+        archivo.close()
+        return Response(status_code=304, headers=cabeceras)
+    return StreamingResponse(_trozos(archivo), media_type=poster.tipo,
+                             headers={**cabeceras, "Content-Length": str(os.fstat(archivo.fileno()).st_size)})
@@ -1,9 +1,16 @@
-﻿from fastapi import APIRouter, Depends, HTTPException
+﻿from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from sqlmodel import Session, select
-from typing import List
+from typing import List, Optional
+import math
 from datetime import datetime
 from utils.db import get_session
-from data.models import PeliculaSerie, PeliculaSerieCreate
+from utils.auth import usuario_actual
+from utils import lotes, respuestas, generos, tendencias
+from supa import almacen
+from utils.catalogo import catalogo
+from data import proyecciones, consultas
+from data.models import PeliculaSerie, PeliculaSerieRead, PeliculaSerieCreate, LoteIds
 
 router = APIRouter(
     prefix="/titulos",
@@ -11,32 +18,74 @@ router = APIRouter(
 )
 
 
-@router.post("/", response_model=PeliculaSerie, summary="Crear una nueva pelÃ­cula o serie")
+@router.post("/", response_model=PeliculaSerieRead, summary="Crear una nueva pelÃ­cula o serie", dependencies=[Depends(usuario_actual)])
 def crear_titulo(titulo: PeliculaSerieCreate, session: Session = Depends(get_session)):
     existente = session.exec(select(PeliculaSerie).where(PeliculaSerie.titulo == titulo.titulo)).first()
     if existente:
         raise HTTPException(status_code=400, detail=f"Ya existe un tÃ­tulo con el nombre {titulo.titulo}")
 
+    seleccion = generos.resolver(session, generos.separar(titulo.genero))
+    if not seleccion:
+        raise HTTPException(status_code=400, detail="Indique al menos un género")
+
     titulo_obj = PeliculaSerie(**titulo.dict())
     session.add(titulo_obj)
+    generos.asignar(session, titulo_obj, seleccion)
+    almacen.cambiar_referencia(session, None, titulo_obj.img)
     session.commit()
     session.refresh(titulo_obj)
     return titulo_obj
 
 
-@router.get("/", response_model=List[PeliculaSerie], summary="Listar todas las pelÃ­culas/series")
+@router.get("/", response_model=List[PeliculaSerieRead], summary="Listar todas las pelÃ­culas/series")
 def listar_titulos(session: Session = Depends(get_session)):
-    titulos = session.exec(select(PeliculaSerie).where(PeliculaSerie.is_active == True)).all()
-    return titulos or []
+    return respuestas.listar(session, PeliculaSerie, PeliculaSerieRead, PeliculaSerie.is_active == True)
 
 
-@router.get("/eliminados", response_model=List[PeliculaSerie], summary="Listar pelÃ­culas/series eliminadas")
+@router.get("/eliminados", response_model=List[PeliculaSerieRead], summary="Listar pelÃ­culas/series eliminadas")
 def listar_titulos_eliminados(session: Session = Depends(get_session)):
-    eliminados = session.exec(select(PeliculaSerie).where(PeliculaSerie.is_active == False)).all()
-    return eliminados or []
+    return respuestas.listar(session, PeliculaSerie, PeliculaSerieRead, PeliculaSerie.is_active == False)
+
+
+@router.get("/buscar", summary="Autocompletar títulos por nombre")
+def buscar_titulos(q: str = Query(..., min_length=1), limite: int = Query(10, ge=1, le=50),
+                   session: Session = Depends(get_session)):
+    return ORJSONResponse([t._asdict() for t in proyecciones.buscar_titulos(session, q, limite)])
+
+
+@router.get("/explorar", summary="Filtrar títulos por género, año, duración y valoración, con el conteo de cada faceta")
+def explorar_titulos(genero: List[int] = Query([]), anio_min: Optional[int] = None, anio_max: Optional[int] = None,
+                     duracion_min: Optional[int] = None, duracion_max: Optional[int] = None,
+                     promedio_min: Optional[float] = Query(None, ge=0, le=5), orden: str = "id",
+                     pagina: int = Query(1, ge=1), por_pagina: int = Query(20, ge=1, le=100),
+                     session: Session = Depends(get_session)):
+    resultado = catalogo.explorar(generos=genero, anio_min=anio_min, anio_max=anio_max, duracion_min=duracion_min,
+                                  duracion_max=duracion_max, promedio_min=promedio_min, orden=orden,
+                                  pagina=pagina, por_pagina=por_pagina)
+    return ORJSONResponse({
+        "total": resultado["total"],
+        "pagina": pagina,
+        "paginas": math.ceil(resultado["total"] / por_pagina),
+        "titulos": [t._asdict() for t in proyecciones.tarjetas_titulos(session, resultado["ids"])],
+        "facetas": resultado["facetas"],
+    })
+
+
+@router.get("/ranking", summary="Mejores títulos por promedio ponderado, en total o de un género")
+def ranking_titulos(genero: Optional[int] = None, limite: int = Query(10, ge=1, le=100),
+                    session: Session = Depends(get_session)):
+    return ORJSONResponse(consultas.top_titulos(session, limite, id_genero=genero))
 
 
-@router.get("/nombre/{titulo_nombre}", response_model=PeliculaSerie, summary="Obtener pelÃ­cula o serie por nombre")
+@router.get("/trending", summary="Títulos con más valoraciones recientes (decaimiento exponencial)")
+def titulos_en_tendencia(ventana: int = Query(7, description="Vida media en días"), genero: Optional[int] = None,
+                         limite: int = Query(10, ge=1, le=100), session: Session = Depends(get_session)):
+    if ventana not in tendencias.TENDENCIA_VIDAS_MEDIAS:
+        raise HTTPException(status_code=400, detail=f"Ventanas disponibles (días): {tendencias.TENDENCIA_VIDAS_MEDIAS}")
+    return ORJSONResponse(consultas.titulos_en_tendencia(session, ventana, limite, id_genero=genero))
+
+
+@router.get("/nombre/{titulo_nombre}", response_model=PeliculaSerieRead, summary="Obtener pelÃ­cula o serie por nombre")
 def buscar_titulo_por_nombre(titulo_nombre: str, session: Session = Depends(get_session)):
     titulo = session.exec(select(PeliculaSerie).where(PeliculaSerie.titulo == titulo_nombre, PeliculaSerie.is_active == True)).first()
     if not titulo:
@@ -44,35 +93,40 @@ def buscar_titulo_por_nombre(titulo_nombre: str, session: Session = Depends(get_
     return titulo
 
 
-@router.get("/{id_titulo}", response_model=PeliculaSerie, summary="Obtener pelÃ­cula o serie por ID")
+@router.get("/{id_titulo}", response_model=PeliculaSerieRead, summary="Obtener pelÃ­cula o serie por ID")
 def ver_titulo(id_titulo: int, session: Session = Depends(get_session)):
     titulo = session.get(PeliculaSerie, id_titulo)
     if not titulo or not titulo.is_active:
         raise HTTPException(status_code=404, detail=f"TÃ­tulo con ID {id_titulo} no encontrado o inactivo")
-
-    _ = titulo.valoraciones
-    _ = titulo.rutinas
     return titulo
 
 
-@router.put("/{id_titulo}", response_model=PeliculaSerie, summary="Actualizar una pelÃ­cula o serie")
+@router.put("/{id_titulo}", response_model=PeliculaSerieRead, summary="Actualizar una pelÃ­cula o serie", dependencies=[Depends(usuario_actual)])
 def actualizar_titulo(id_titulo: int, datos: PeliculaSerieCreate, session: Session = Depends(get_session)):
     titulo = session.get(PeliculaSerie, id_titulo)
     if not titulo or not titulo.is_active:
         raise HTTPException(status_code=404, detail=f"TÃ­tulo con ID {id_titulo} no encontrado o inactivo")
 
+    seleccion = generos.resolver(session, generos.separar(datos.genero))
+    if not seleccion:
+        raise HTTPException(status_code=400, detail="Indique al menos un género")
+
     titulo.titulo = datos.titulo
-    titulo.genero = datos.genero
+    generos.asignar(session, titulo, seleccion)
     titulo.anio_estreno = datos.anio_estreno
     titulo.duracion = datos.duracion
     titulo.descripcion = datos.descripcion
+    # Sin img en el cuerpo se conserva la imagen actual; img: null la quita
+    if "img" in datos.dict(exclude_unset=True):
+        almacen.cambiar_referencia(session, titulo.img, datos.img)
+        titulo.img = datos.img
 
     session.commit()
     session.refresh(titulo)
     return titulo
 
 
-@router.delete("/{id_titulo}", response_model=dict, summary="Eliminar una pelÃ­cula o serie (lÃ³gico)")
+@router.delete("/{id_titulo}", response_model=dict, summary="Eliminar una pelÃ­cula o serie (lÃ³gico)", dependencies=[Depends(usuario_actual)])
 def eliminar_titulo(id_titulo: int, session: Session = Depends(get_session)):
     titulo = session.get(PeliculaSerie, id_titulo)
     if not titulo:
@@ -81,3 +135,13 @@ def eliminar_titulo(id_titulo: int, session: Session = Depends(get_session)):
     titulo.deleted_at = datetime.now()
     session.commit()
     return {"mensaje": f"TÃ­tulo con ID {id_titulo} desactivado correctamente"}
+
+@router.post("/eliminar-lote", response_model=dict, summary="Eliminar varios títulos (lógico) (con cascada a sus valoraciones y rutinas)", dependencies=[Depends(usuario_actual)])
+def eliminar_lote(lote: LoteIds, session: Session = Depends(get_session)):
+    afectados = lotes.eliminar_lote(session, PeliculaSerie, lote.ids, lote.cascada)
+    return {"mensaje": f"{afectados['peliculaserie']} títulos desactivados", "afectados": afectados}
+
+@router.post("/restaurar-lote", response_model=dict, summary="Restaurar varios títulos (con cascada a sus valoraciones y rutinas)", dependencies=[Depends(usuario_actual)])
+def restaurar_lote(lote: LoteIds, session: Session = Depends(get_session)):
+    afectados = lotes.restaurar_lote(session, PeliculaSerie, lote.ids, lote.cascada)
+    return {"mensaje": f"{afectados['peliculaserie']} títulos restaurados", "afectados": afectados}
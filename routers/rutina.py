@@ -1,9 +1,12 @@
 ﻿from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlmodel import Session, select
-from typing import List
-from datetime import datetime
+from typing import List, Optional
+from datetime import date, datetime, timedelta
 from utils.db import get_session
-from data.models import Rutina, RutinaCreate, Usuario, PeliculaSerie
+from utils.auth import usuario_actual, comprobar_propietario
+from utils import lotes, respuestas, agenda
+from data.models import Rutina, RutinaRead, RutinaCreate, Usuario, PeliculaSerie, LoteIds
 
 router = APIRouter(
     prefix="/rutinas",
@@ -11,8 +14,9 @@ router = APIRouter(
 )
 
 
-@router.post("/", response_model=Rutina, summary="Crear una nueva rutina")
-def crear_rutina(rutina: RutinaCreate, session: Session = Depends(get_session)):
+@router.post("/", response_model=RutinaRead, summary="Crear una nueva rutina")
+def crear_rutina(rutina: RutinaCreate, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, [rutina.id_usuario_FK])
     usuario = session.get(Usuario, rutina.id_usuario_FK)
     titulo = session.get(PeliculaSerie, rutina.id_titulo_FK)
 
@@ -20,6 +24,11 @@ def crear_rutina(rutina: RutinaCreate, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail=f"Usuario con ID {rutina.id_usuario_FK} no encontrado o inactivo")
     if not titulo or not titulo.is_active:
         raise HTTPException(status_code=404, detail=f"TÃ­tulo con ID {rutina.id_titulo_FK} no encontrado o inactivo")
+    if rutina.fecha_inicio > rutina.fecha_fin:
+        raise HTTPException(status_code=400, detail="La fecha de inicio no puede ser posterior a la fecha de fin")
+    error = agenda.exceso(session, rutina.id_usuario_FK, rutina.fecha_inicio, rutina.fecha_fin, titulo.duracion)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
 
     rutina_obj = Rutina(**rutina.dict())
     session.add(rutina_obj)
@@ -28,19 +37,34 @@ def crear_rutina(rutina: RutinaCreate, session: Session = Depends(get_session)):
     return rutina_obj
 
 
-@router.get("/", response_model=List[Rutina], summary="Listar todas las rutinas")
+@router.get("/", response_model=List[RutinaRead], summary="Listar todas las rutinas")
 def listar_rutinas(session: Session = Depends(get_session)):
-    rutinas = session.exec(select(Rutina).where(Rutina.is_active == True)).all()
-    return rutinas or []
+    return respuestas.listar(session, Rutina, RutinaRead, Rutina.is_active == True)
 
 
-@router.get("/eliminadas", response_model=List[Rutina], summary="Listar rutinas eliminadas")
+@router.get("/eliminadas", response_model=List[RutinaRead], summary="Listar rutinas eliminadas")
 def listar_rutinas_eliminadas(session: Session = Depends(get_session)):
-    eliminadas = session.exec(select(Rutina).where(Rutina.is_active == False)).all()
-    return eliminadas or []
-
-
-@router.get("/nombre/{nombre}", response_model=Rutina, summary="Obtener rutina por nombre")
+    return respuestas.listar(session, Rutina, RutinaRead, Rutina.is_active == False)
+
+
+@router.get("/carga", summary="Minutos planeados por día y rutinas que se solapan en un periodo")
+def ver_carga(usuario: int, desde: Optional[date] = None, hasta: Optional[date] = None,
+              session: Session = Depends(get_session)):
+    desde = desde or date.today()
+    hasta = hasta or desde + timedelta(days=30)
+    if not 0 <= (hasta - desde).days <= 366:
+        raise HTTPException(status_code=400, detail="El periodo debe ir de 'desde' a 'hasta' y durar como mucho un año")
+    rutinas = agenda.solapadas(session, usuario, desde, hasta)
+    por_dia = agenda.carga([(r.fecha_inicio, r.fecha_fin, r.duracion) for r in rutinas], desde, hasta)
+    return ORJSONResponse({
+        "maximo": agenda.RUTINA_MAX_MINUTOS_DIA or None,
+        "dias": [{"fecha": (desde + timedelta(days=i)).isoformat(), "minutos": round(float(m), 1)}
+                 for i, m in enumerate(por_dia)],
+        "rutinas": [r._asdict() for r in rutinas],
+    })
+
+
+@router.get("/nombre/{nombre}", response_model=RutinaRead, summary="Obtener rutina por nombre")
 def buscar_rutina_por_nombre(nombre: str, session: Session = Depends(get_session)):
     rutina = session.exec(select(Rutina).where(Rutina.nombre == nombre, Rutina.is_active == True)).first()
     if not rutina:
@@ -48,7 +72,7 @@ def buscar_rutina_por_nombre(nombre: str, session: Session = Depends(get_session
     return rutina
 
 
-@router.get("/{id_rutina}", response_model=Rutina, summary="Obtener rutina por ID")
+@router.get("/{id_rutina}", response_model=RutinaRead, summary="Obtener rutina por ID")
 def ver_rutina(id_rutina: int, session: Session = Depends(get_session)):
     rutina = session.get(Rutina, id_rutina)
     if not rutina or not rutina.is_active:
@@ -56,11 +80,19 @@ def ver_rutina(id_rutina: int, session: Session = Depends(get_session)):
     return rutina
 
 
-@router.put("/{id_rutina}", response_model=Rutina, summary="Actualizar una rutina")
-def actualizar_rutina(id_rutina: int, datos: RutinaCreate, session: Session = Depends(get_session)):
+@router.put("/{id_rutina}", response_model=RutinaRead, summary="Actualizar una rutina")
+def actualizar_rutina(id_rutina: int, datos: RutinaCreate, session: Session = Depends(get_session),
+                      id_actual: int = Depends(usuario_actual)):
     rutina = session.get(Rutina, id_rutina)
     if not rutina or not rutina.is_active:
         raise HTTPException(status_code=404, detail=f"Rutina con ID {id_rutina} no encontrada o inactiva")
+    comprobar_propietario(id_actual, [rutina.id_usuario_FK])
+    if datos.fecha_inicio > datos.fecha_fin:
+        raise HTTPException(status_code=400, detail="La fecha de inicio no puede ser posterior a la fecha de fin")
+    titulo = session.get(PeliculaSerie, rutina.id_titulo_FK)
+    error = agenda.exceso(session, rutina.id_usuario_FK, datos.fecha_inicio, datos.fecha_fin, titulo.duracion, rutina.id_rutina)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
 
     rutina.nombre = datos.nombre
     rutina.fecha_inicio = datos.fecha_inicio
@@ -72,11 +104,24 @@ def actualizar_rutina(id_rutina: int, datos: RutinaCreate, session: Session = De
 
 
 @router.delete("/{id_rutina}", response_model=dict, summary="Eliminar una rutina (lÃ³gica)")
-def eliminar_rutina(id_rutina: int, session: Session = Depends(get_session)):
+def eliminar_rutina(id_rutina: int, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
     rutina = session.get(Rutina, id_rutina)
     if not rutina:
         raise HTTPException(status_code=404, detail=f"Rutina con ID {id_rutina} no encontrada")
+    comprobar_propietario(id_actual, [rutina.id_usuario_FK])
     rutina.is_active = False
     rutina.deleted_at = datetime.now()
     session.commit()
     return {"mensaje": f"Rutina con ID {id_rutina} desactivada correctamente"}
+
+@router.post("/eliminar-lote", response_model=dict, summary="Eliminar varias rutinas (lógico)")
+def eliminar_lote(lote: LoteIds, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, lotes.propietarios(session, Rutina, lote.ids))
+    afectados = lotes.eliminar_lote(session, Rutina, lote.ids, lote.cascada)
+    return {"mensaje": f"{afectados['rutina']} rutinas desactivadas", "afectados": afectados}
+
+@router.post("/restaurar-lote", response_model=dict, summary="Restaurar varias rutinas")
+def restaurar_lote(lote: LoteIds, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, lotes.propietarios(session, Rutina, lote.ids))
+    afectados = lotes.restaurar_lote(session, Rutina, lote.ids, lote.cascada)
+    return {"mensaje": f"{afectados['rutina']} rutinas restauradas", "afectados": afectados}
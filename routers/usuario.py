@@ -1,9 +1,13 @@
-﻿from fastapi import APIRouter, Depends, HTTPException
+﻿from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from sqlmodel import Session, select
 from typing import List
 from datetime import datetime
 from utils.db import get_session
-from data.models import Usuario, UsuarioCreate
+from utils.auth import usuario_actual, comprobar_propietario, token_calendario, verificar_calendario
+from utils import lotes, respuestas, habitos, ical
+from data import proyecciones
+from data.models import Usuario, UsuarioRead, UsuarioCreate, LoteIds
 from utils.security import get_password_hash # Seguridad restaurada
 
 router = APIRouter(
@@ -11,7 +15,7 @@ router = APIRouter(
     tags=["Usuarios"]
 )
 
-@router.post("/", response_model=Usuario, summary="Crear un nuevo usuario")
+@router.post("/", response_model=UsuarioRead, summary="Crear un nuevo usuario")
 def crear_nuevo_usuario(usuario: UsuarioCreate, session: Session = Depends(get_session)):
     existente = session.exec(select(Usuario).where(Usuario.correo == usuario.correo)).first()
     if existente:
@@ -26,34 +30,83 @@ def crear_nuevo_usuario(usuario: UsuarioCreate, session: Session = Depends(get_s
     session.refresh(usuario_obj)
     return usuario_obj
 
-@router.get("/", response_model=List[Usuario], summary="Listar todos los usuarios")
+@router.get("/", response_model=List[UsuarioRead], summary="Listar todos los usuarios")
 def listar_usuarios(session: Session = Depends(get_session)):
-    usuarios = session.exec(select(Usuario).where(Usuario.is_active == True)).all()
-    return usuarios or []
+    return respuestas.listar(session, Usuario, UsuarioRead, Usuario.is_active == True)
 
-@router.get("/eliminados", response_model=List[Usuario], summary="Listar usuarios eliminados")
+@router.get("/eliminados", response_model=List[UsuarioRead], summary="Listar usuarios eliminados")
 def listar_usuarios_eliminados(session: Session = Depends(get_session)):
-    eliminados = session.exec(select(Usuario).where(Usuario.is_active == False)).all()
-    return eliminados or []
+    return respuestas.listar(session, Usuario, UsuarioRead, Usuario.is_active == False)
 
-@router.get("/correo/{correo}", response_model=Usuario, summary="Obtener usuario por correo")
+@router.get("/buscar", summary="Autocompletar usuarios por nombre o correo")
+def buscar_usuarios(q: str = Query(..., min_length=1), limite: int = Query(10, ge=1, le=50),
+                    session: Session = Depends(get_session)):
+    return ORJSONResponse([u._asdict() for u in proyecciones.buscar_usuarios(session, q, limite)])
+
+@router.get("/correo/{correo}", response_model=UsuarioRead, summary="Obtener usuario por correo")
 def buscar_usuario_por_correo(correo: str, session: Session = Depends(get_session)):
     usuario = session.exec(select(Usuario).where(Usuario.correo == correo, Usuario.is_active == True)).first()
     if not usuario:
         raise HTTPException(status_code=404, detail=f"No se encontró usuario con correo {correo}")
     return usuario
 
-@router.get("/{id_usuario}", response_model=Usuario, summary="Obtener un usuario por ID")
+@router.get("/{id_usuario}", response_model=UsuarioRead, summary="Obtener un usuario por ID")
 def ver_usuario(id_usuario: int, session: Session = Depends(get_session)):
     usuario = session.get(Usuario, id_usuario)
     if not usuario or not usuario.is_active:
         raise HTTPException(status_code=404, detail=f"Usuario con ID {id_usuario} no encontrado o inactivo")
-    _ = usuario.valoraciones
-    _ = usuario.rutinas
     return usuario
 
-@router.put("/{id_usuario}", response_model=Usuario, summary="Actualizar un usuario")
-def actualizar_usuario(id_usuario: int, datos: UsuarioCreate, session: Session = Depends(get_session)):
+@router.get("/{id_usuario}/habitos", summary="Informe de hábitos de un usuario (minutos planeados, géneros, puntuación y rachas)")
+def ver_habitos(id_usuario: int, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, [id_usuario])
+    usuario = session.get(Usuario, id_usuario)
+    if not usuario or not usuario.is_active:
+        raise HTTPException(status_code=404, detail=f"Usuario con ID {id_usuario} no encontrado o inactivo")
+    return ORJSONResponse(habitos.informe(session, id_usuario))
+
+def _url_calendario(request: Request, usuario: Usuario) -> dict:
+    token = token_calendario(usuario.id_usuario, usuario.version_calendario)
+    return {"url": f"{request.url_for('rutinas_ics', id_usuario=usuario.id_usuario)}?token={token}"}
+
+@router.get("/{id_usuario}/calendario", summary="URL privada del calendario de rutinas (para suscribirse)")
+def ver_url_calendario(id_usuario: int, request: Request, session: Session = Depends(get_session),
+                       id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, [id_usuario])
+    usuario = session.get(Usuario, id_usuario)
+    if not usuario or not usuario.is_active:
+        raise HTTPException(status_code=404, detail=f"Usuario con ID {id_usuario} no encontrado o inactivo")
+    return _url_calendario(request, usuario)
+
+@router.post("/{id_usuario}/calendario/renovar", summary="Revocar la URL del calendario y generar otra")
+def renovar_url_calendario(id_usuario: int, request: Request, session: Session = Depends(get_session),
+                           id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, [id_usuario])
+    usuario = session.get(Usuario, id_usuario)
+    if not usuario or not usuario.is_active:
+        raise HTTPException(status_code=404, detail=f"Usuario con ID {id_usuario} no encontrado o inactivo")
+    usuario.version_calendario += 1
+    session.commit()
+    session.refresh(usuario)
+    return _url_calendario(request, usuario)
+
+@router.get("/{id_usuario}/rutinas.ics", summary="Rutinas del usuario en formato iCalendar (suscripción desde apps de calendario)")
+def rutinas_ics(id_usuario: int, request: Request, token: str = "", session: Session = Depends(get_session)):
+    feed = ical.feed(session, id_usuario)
+    # Un token que no vale responde igual que un usuario inexistente: no se pueden enumerar
+    if feed is None or not verificar_calendario(token, id_usuario, feed.version):
+        raise HTTPException(status_code=404, detail=f"Usuario con ID {id_usuario} no encontrado o inactivo")
+    # Sin max-age: el cliente revalida siempre y, si nada cambió, recibe un 304 sin cuerpo
+    cabeceras = {"ETag": feed.etag, "Cache-Control": "no-cache"}
+    if respuestas.sin_cambios(request, feed.etag):
+        return Response(status_code=304, headers=cabeceras)
+    return StreamingResponse(iter(feed.partes), media_type="text/calendar; charset=utf-8", headers={
+        **cabeceras, "Content-Disposition": f'inline; filename="rutinas-{id_usuario}.ics"'})
+
+@router.put("/{id_usuario}", response_model=UsuarioRead, summary="Actualizar un usuario")
+def actualizar_usuario(id_usuario: int, datos: UsuarioCreate, session: Session = Depends(get_session),
+                       id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, [id_usuario])
     usuario = session.get(Usuario, id_usuario)
     if not usuario or not usuario.is_active:
         raise HTTPException(status_code=404, detail=f"Usuario con ID {id_usuario} no encontrado o inactivo")
@@ -75,7 +128,8 @@ def actualizar_usuario(id_usuario: int, datos: UsuarioCreate, session: Session =
     return usuario
 
 @router.delete("/{id_usuario}", response_model=dict, summary="Eliminar un usuario (lógico)")
-def eliminar_usuario(id_usuario: int, session: Session = Depends(get_session)):
+def eliminar_usuario(id_usuario: int, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, [id_usuario])
     usuario = session.get(Usuario, id_usuario)
     if not usuario:
         raise HTTPException(status_code=404, detail=f"Usuario con ID {id_usuario} no encontrado")
@@ -83,3 +137,15 @@ def eliminar_usuario(id_usuario: int, session: Session = Depends(get_session)):
     usuario.deleted_at = datetime.now()
     session.commit()
     return {"mensaje": f"Usuario con ID {id_usuario} desactivado correctamente"}
+
+@router.post("/eliminar-lote", response_model=dict, summary="Eliminar varios usuarios (lógico) (con cascada a sus valoraciones y rutinas)")
+def eliminar_lote(lote: LoteIds, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, lote.ids)
+    afectados = lotes.eliminar_lote(session, Usuario, lote.ids, lote.cascada)
+    return {"mensaje": f"{afectados['usuario']} usuarios desactivados", "afectados": afectados}
+
+@router.post("/restaurar-lote", response_model=dict, summary="Restaurar varios usuarios (con cascada a sus valoraciones y rutinas)")
+def restaurar_lote(lote: LoteIds, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, lote.ids)
+    afectados = lotes.restaurar_lote(session, Usuario, lote.ids, lote.cascada)
+    return {"mensaje": f"{afectados['usuario']} usuarios restaurados", "afectados": afectados}
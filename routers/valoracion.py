@@ -1,9 +1,12 @@
 ﻿from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlmodel import Session, select
-from typing import List
-from datetime import datetime
+from typing import List, Optional
+from datetime import date, datetime, timedelta
 from utils.db import get_session
-from data.models import Valoracion, ValoracionCreate, Usuario, PeliculaSerie
+from utils.auth import usuario_actual, comprobar_propietario
+from utils import lotes, respuestas, valoraciones, series
+from data.models import Valoracion, ValoracionRead, ValoracionCreate, ValoracionDatos, Usuario, PeliculaSerie, LoteIds
 
 router = APIRouter(
     prefix="/valoraciones",
@@ -11,8 +14,10 @@ router = APIRouter(
 )
 
 
-@router.post("/", response_model=Valoracion, summary="Crear una nueva valoraciÃ³n")
-def crear_valoracion(valoracion: ValoracionCreate, session: Session = Depends(get_session)):
+@router.post("/", response_model=ValoracionRead, summary="Crear una nueva valoraciÃ³n")
+def crear_valoracion(valoracion: ValoracionCreate, session: Session = Depends(get_session),
+                     id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, [valoracion.id_usuario_FK])
     usuario = session.get(Usuario, valoracion.id_usuario_FK)
     titulo = session.get(PeliculaSerie, valoracion.id_titulo_FK)
 
@@ -21,26 +26,51 @@ def crear_valoracion(valoracion: ValoracionCreate, session: Session = Depends(ge
     if not titulo or not titulo.is_active:
         raise HTTPException(status_code=404, detail=f"TÃ­tulo con ID {valoracion.id_titulo_FK} no encontrado o inactivo")
 
-    valoracion_obj = Valoracion(**valoracion.dict())
-    session.add(valoracion_obj)
-    session.commit()
-    session.refresh(valoracion_obj)
-    return valoracion_obj
+    id_valoracion = valoraciones.crear_valoracion(session, valoracion.id_usuario_FK, valoracion.id_titulo_FK,
+                                                  valoracion.puntuacion, valoracion.comentario, valoracion.fecha)
+    if id_valoracion is None:
+        raise HTTPException(status_code=409, detail="Ya existe una valoración activa de este usuario para este título")
+    return session.get(Valoracion, id_valoracion)
 
 
-@router.get("/", response_model=List[Valoracion], summary="Listar todas las valoraciones")
-def listar_valoraciones(session: Session = Depends(get_session)):
-    valoraciones = session.exec(select(Valoracion).where(Valoracion.is_active == True)).all()
-    return valoraciones or []
+@router.put("/usuario/{id_usuario}/titulo/{id_titulo}", response_model=ValoracionRead,
+            summary="Crear o actualizar la valoración activa de un usuario para un título")
+def guardar_valoracion(id_usuario: int, id_titulo: int, datos: ValoracionDatos, session: Session = Depends(get_session),
+                       id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, [id_usuario])
+    fila = valoraciones.guardar_valoracion(session, id_usuario, id_titulo, datos.puntuacion, datos.comentario, datos.fecha)
+    if fila is None:
+        raise HTTPException(status_code=404, detail=f"Usuario {id_usuario} o título {id_titulo} no encontrado o inactivo")
+    return fila._asdict()
 
 
-@router.get("/eliminadas", response_model=List[Valoracion], summary="Listar valoraciones eliminadas")
-def listar_valoraciones_eliminadas(session: Session = Depends(get_session)):
-    eliminadas = session.exec(select(Valoracion).where(Valoracion.is_active == False)).all()
-    return eliminadas or []
+@router.get("/", response_model=List[ValoracionRead], summary="Listar todas las valoraciones")
+def listar_valoraciones(session: Session = Depends(get_session)):
+    return respuestas.listar(session, Valoracion, ValoracionRead, Valoracion.is_active == True)
 
 
-@router.get("/comentario/{comentario}", response_model=Valoracion, summary="Obtener valoraciÃ³n por comentario")
+@router.get("/eliminadas", response_model=List[ValoracionRead], summary="Listar valoraciones eliminadas")
+def listar_valoraciones_eliminadas(session: Session = Depends(get_session)):
+    return respuestas.listar(session, Valoracion, ValoracionRead, Valoracion.is_active == False)
+
+
+@router.get("/series", summary="Valoraciones por día, semana o mes (conteo, promedio y desviación)")
+def series_valoraciones(grano: str = "semana", desde: Optional[date] = None, hasta: Optional[date] = None,
+                        titulo: Optional[int] = None, genero: Optional[int] = None,
+                        session: Session = Depends(get_session)):
+    if grano not in series.GRANOS:
+        raise HTTPException(status_code=400, detail=f"Grano no válido, use uno de {list(series.GRANOS)}")
+    if titulo is not None and genero is not None:
+        raise HTTPException(status_code=400, detail="Filtre por título o por género, no por ambos")
+    hasta = hasta or date.today()
+    desde = desde or hasta - timedelta(days=365)
+    maximo = series.SERIES_MAX_ANIOS[grano]
+    if desde > hasta or (hasta - desde).days > maximo * 366:
+        raise HTTPException(status_code=400, detail=f"Rango de fechas no válido (máximo {maximo} años con grano {grano})")
+    return ORJSONResponse(series.serie(session, grano, desde, hasta, id_titulo=titulo, id_genero=genero))
+
+
+@router.get("/comentario/{comentario}", response_model=ValoracionRead, summary="Obtener valoraciÃ³n por comentario")
 def buscar_valoracion_por_comentario(comentario: str, session: Session = Depends(get_session)):
     valoracion = session.exec(select(Valoracion).where(Valoracion.comentario == comentario, Valoracion.is_active == True)).first()
     if not valoracion:
@@ -48,7 +78,7 @@ def buscar_valoracion_por_comentario(comentario: str, session: Session = Depends
     return valoracion
 
 
-@router.get("/{id_valoracion}", response_model=Valoracion, summary="Obtener valoraciÃ³n por ID")
+@router.get("/{id_valoracion}", response_model=ValoracionRead, summary="Obtener valoraciÃ³n por ID")
 def ver_valoracion(id_valoracion: int, session: Session = Depends(get_session)):
     valoracion = session.get(Valoracion, id_valoracion)
     if not valoracion or not valoracion.is_active:
@@ -56,15 +86,19 @@ def ver_valoracion(id_valoracion: int, session: Session = Depends(get_session)):
     return valoracion
 
 
-@router.put("/{id_valoracion}", response_model=Valoracion, summary="Actualizar una valoraciÃ³n")
-def actualizar_valoracion(id_valoracion: int, datos: ValoracionCreate, session: Session = Depends(get_session)):
+@router.put("/{id_valoracion}", response_model=ValoracionRead, summary="Actualizar una valoraciÃ³n")
+def actualizar_valoracion(id_valoracion: int, datos: ValoracionCreate, session: Session = Depends(get_session),
+                          id_actual: int = Depends(usuario_actual)):
     valoracion = session.get(Valoracion, id_valoracion)
     if not valoracion or not valoracion.is_active:
         raise HTTPException(status_code=404, detail=f"ValoraciÃ³n con ID {id_valoracion} no encontrada o inactiva")
+    comprobar_propietario(id_actual, [valoracion.id_usuario_FK])
 
+    anterior = (valoracion.id_titulo_FK, valoracion.fecha, valoracion.puntuacion)
     valoracion.puntuacion = datos.puntuacion
     valoracion.comentario = datos.comentario
     valoracion.fecha = datos.fecha
+    valoraciones.actualizar_agregados(session, [anterior], [(valoracion.id_titulo_FK, valoracion.fecha, valoracion.puntuacion)])
 
     session.commit()
     session.refresh(valoracion)
@@ -72,11 +106,26 @@ def actualizar_valoracion(id_valoracion: int, datos: ValoracionCreate, session:
 
 
 @router.delete("/{id_valoracion}", response_model=dict, summary="Eliminar una valoraciÃ³n (lÃ³gico)")
-def eliminar_valoracion(id_valoracion: int, session: Session = Depends(get_session)):
+def eliminar_valoracion(id_valoracion: int, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
     valoracion = session.get(Valoracion, id_valoracion)
     if not valoracion:
         raise HTTPException(status_code=404, detail=f"ValoraciÃ³n con ID {id_valoracion} no encontrada")
+    comprobar_propietario(id_actual, [valoracion.id_usuario_FK])
+    if valoracion.is_active:
+        valoraciones.actualizar_agregados(session, quitadas=[(valoracion.id_titulo_FK, valoracion.fecha, valoracion.puntuacion)])
     valoracion.is_active = False
     valoracion.deleted_at = datetime.now()
     session.commit()
     return {"mensaje": f"ValoraciÃ³n con ID {id_valoracion} desactivada correctamente"}
+
+@router.post("/eliminar-lote", response_model=dict, summary="Eliminar varias valoraciones (lógico)")
+def eliminar_lote(lote: LoteIds, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, lotes.propietarios(session, Valoracion, lote.ids))
+    afectados = lotes.eliminar_lote(session, Valoracion, lote.ids, lote.cascada)
+    return {"mensaje": f"{afectados['valoracion']} valoraciones desactivadas", "afectados": afectados}
+
+@router.post("/restaurar-lote", response_model=dict, summary="Restaurar varias valoraciones")
+def restaurar_lote(lote: LoteIds, session: Session = Depends(get_session), id_actual: int = Depends(usuario_actual)):
+    comprobar_propietario(id_actual, lotes.propietarios(session, Valoracion, lote.ids))
+    afectados = lotes.restaurar_lote(session, Valoracion, lote.ids, lote.cascada)
+    return {"mensaje": f"{afectados['valoracion']} valoraciones restauradas", "afectados": afectados}
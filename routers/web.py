@@ -1,41 +1,113 @@
-﻿from fastapi import APIRouter, Form, File, UploadFile, Depends, HTTPException, Request
+﻿from fastapi import APIRouter, Form, File, UploadFile, Depends, HTTPException, Request, Query
 from fastapi.responses import RedirectResponse, HTMLResponse
 from sqlmodel import Session, select
-from fastapi.templating import Jinja2Templates
 from utils.db import get_session
-from supa.supabase import upload_to_bucket
+from utils.templates import templates
+from data import consultas, proyecciones
+from utils import archivo, lotes, valoraciones, generos, series, habitos, agenda, auth
+from utils.catalogo import catalogo, TRAMOS_DURACION, ORDENES
+from supa import almacen
 from utils.security import get_password_hash
-from data.models import Usuario, PeliculaSerie, Valoracion, Rutina
+from data.models import Usuario, PeliculaSerie, Valoracion, Rutina, TituloGenero
 from datetime import date, datetime, timedelta
 import calendar
-from typing import Optional
+from typing import List, Optional
 
 # --- Importaciones añadidas para Paginación y Estadísticas ---
 from sqlalchemy import func, desc  # func para count y avg; desc para orden descendente
+from sqlalchemy.exc import IntegrityError
 import math  # Para la función math.ceil
 import re
+from urllib.parse import urlencode
 # -------------------------------------------------------------
 
 
+# Todas las páginas piden sesión (cookie); sin ella main.py redirige a /web/login
 router = APIRouter(
+    prefix="/web",
+    tags=["Web Interface"],
+    dependencies=[Depends(auth.sesion_web)]
+)
+
+# Inicio y cierre de sesión: lo único de /web accesible sin sesión
+publico = APIRouter(
     prefix="/web",
     tags=["Web Interface"]
 )
 
-templates = Jinja2Templates(directory="templates")
 DEFAULT_USER_IMG = '/static/img/user-placeholder.jpg'
 DEFAULT_MOVIE_IMG = '/static/img/placeholder_movie.jpg'
 
+
+def _mensaje_restaurar(afectados: dict, tabla: str, mensaje: str) -> str:
+    # Las archivadas que chocan con filas actuales se quedan en el archivo (ver utils/archivo.py)
+    omitidas = sum(len(ids) for ids in afectados.get("conflictos", {}).values())
+    # Las rutinas que pasarían del máximo diario se quedan en la papelera (ver utils/agenda.py)
+    excesos = len(afectados.get("excesos", {}).get("rutina", ()))
+    if excesos:
+        mensaje = f"{mensaje} ({excesos} rutinas siguen en la papelera: pasarían del máximo de minutos por día)"
+    if not omitidas:
+        return mensaje
+    if not afectados.get(tabla):
+        return "No se pudo restaurar: su correo, título o ID ya lo usa otro registro"
+    return f"{mensaje} ({omitidas} no se pudieron restaurar: su correo, título o ID ya lo usa otro registro)"
+
+# ==========================================
+# SESIÓN
+# ==========================================
+
+def _destino_seguro(siguiente: str) -> str:
+    # Solo rutas locales: evita redirigir fuera del sitio tras iniciar sesión
+    return siguiente if siguiente.startswith("/") and not siguiente.startswith("//") else "/"
+
+
+@publico.get("/login", response_class=HTMLResponse)
+async def pagina_login(request: Request, siguiente: str = "/"):
+    return templates.TemplateResponse("login.html", {"request": request, "siguiente": _destino_seguro(siguiente),
+                                                     "error_message": None, "correo": ""})
+
+
+@publico.post("/login")
+async def login_web(request: Request, correo: str = Form(...), clave: str = Form(...), siguiente: str = Form("/"),
+                    session: Session = Depends(get_session)):
+    usuario = auth.autenticar(session, correo, clave)
+    if not usuario:
+        return templates.TemplateResponse("login.html", {
+            "request": request, "siguiente": _destino_seguro(siguiente),
+            "error_message": "Correo o clave incorrectos.", "correo": correo
+        }, status_code=401)
+    respuesta = RedirectResponse(url=_destino_seguro(siguiente), status_code=303)
+    respuesta.set_cookie(auth.COOKIE_SESION, auth.emitir_sesion(usuario.id_usuario), max_age=auth.SESION_HORAS * 3600,
+                         httponly=True, samesite="lax", secure=request.url.scheme == "https")
+    return respuesta
+
+
+@publico.post("/logout")
+async def logout_web(request: Request):
+    token = request.cookies.get(auth.COOKIE_SESION)
+    if token:
+        try:
+            auth.revocar(auth.verificar(token, "sesion"))
+        except HTTPException:
+            pass  # Ya caducada o inválida: basta con borrar la cookie
+    respuesta = RedirectResponse(url="/web/login", status_code=303)
+    respuesta.delete_cookie(auth.COOKIE_SESION)
+    return respuesta
+
+
 # ==========================================
 # GESTIÓN DE USUARIOS
 # ==========================================
 
 @router.get("/usuarios", response_class=HTMLResponse)
-async def pagina_usuarios(request: Request, session: Session = Depends(get_session)):
-    activos = session.exec(select(Usuario).where(Usuario.is_active == True)).all()
-    inactivos = session.exec(select(Usuario).where(Usuario.is_active == False)).all()
+async def pagina_usuarios(request: Request, papelera: int = 1, session: Session = Depends(get_session)):
+    activos = proyecciones.tarjetas_usuarios(session)
+    # Papelera paginada: incluye las filas ya movidas al archivo
+    inactivos, papelera_pages = archivo.pagina_papelera(session, Usuario, ["id_usuario", "nombre", "correo"], papelera)
     return templates.TemplateResponse("usuarios.html", {"request": request, "usuarios_activos": activos,
-                                                        "usuarios_inactivos": inactivos})
+                                                        "usuarios_inactivos": inactivos,
+                                                        "papelera_page": papelera,
+                                                        "papelera_pages": papelera_pages})
 
 
 @router.get("/usuarios/crear", response_class=HTMLResponse)
@@ -81,10 +153,7 @@ async def crear_usuario_web(
     # 3. Manejo de imagen por defecto o subida
     if img and img.filename:
         try:
-            file_content = await img.read()
-            if file_content:
-                await img.seek(0)
-                img_url = await upload_to_bucket(img)
+            img_url = await almacen.guardar_imagen(img) or img_url
         except Exception as e:
             return templates.TemplateResponse("usuario_form.html", {
                 "request": request, "accion": "Crear", "usuario": None,
@@ -100,6 +169,7 @@ async def crear_usuario_web(
         )
 
         session.add(nuevo_usuario)
+        almacen.cambiar_referencia(session, None, img_url)
         session.commit()
     except Exception as e:
         # 4. Validación: Correo duplicado (Unique constraint)
@@ -125,6 +195,15 @@ async def pagina_editar_usuario(id_usuario: int, request: Request, session: Sess
                                                             "error_message": None, "form_data": {}})
 
 
+@router.get("/usuarios/habitos/{id_usuario}", response_class=HTMLResponse)
+async def pagina_habitos_usuario(id_usuario: int, request: Request, session: Session = Depends(get_session)):
+    usuario = session.get(Usuario, id_usuario)
+    if not usuario or not usuario.is_active:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    return templates.TemplateResponse("habitos.html", {"request": request, "usuario": usuario,
+                                                       "informe": habitos.informe(session, id_usuario)})
+
+
 @router.post("/usuarios/editar/{id_usuario}")
 async def editar_usuario_web(
         id_usuario: int,
@@ -162,7 +241,7 @@ async def editar_usuario_web(
     # 3. Validación: Correo duplicado (si el correo es modificado)
     if correo != usuario.correo:
         existente = session.exec(
-            select(Usuario).where(Usuario.correo == correo, Usuario.id_usuario != id_usuario)).first()
+            select(Usuario.id_usuario).where(Usuario.correo == correo, Usuario.id_usuario != id_usuario)).first()
         if existente:
             return templates.TemplateResponse("usuario_form.html", {
                 "request": request, "accion": "Editar", "usuario": usuario,
@@ -173,11 +252,8 @@ async def editar_usuario_web(
     img_url = usuario.img  # Conserva la imagen actual por defecto
     if img and img.filename:
         try:
-            file_content = await img.read()
-            if file_content:
-                await img.seek(0)
-                img_url = await upload_to_bucket(img)
             # Si el contenido es vacío, mantiene la imagen actual (img_url no se modifica)
+            img_url = await almacen.guardar_imagen(img) or img_url
         except Exception as e:
             return templates.TemplateResponse("usuario_form.html", {
                 "request": request, "accion": "Editar", "usuario": usuario,
@@ -185,6 +261,7 @@ async def editar_usuario_web(
             })
 
     # Actualizar datos
+    almacen.cambiar_referencia(session, usuario.img, img_url)
     usuario.nombre = nombre
     usuario.correo = correo
     usuario.img = img_url
@@ -196,24 +273,32 @@ async def editar_usuario_web(
     session.refresh(usuario)
     return RedirectResponse(url="/web/usuarios?mensaje=Usuario actualizado correctamente", status_code=303)
 
-@router.get("/usuarios/eliminar/{id_usuario}")
-async def eliminar_usuario_web(id_usuario: int, session: Session = Depends(get_session)):
-    usuario = session.get(Usuario, id_usuario)
-    if usuario:
-        usuario.is_active = False
-        usuario.deleted_at = datetime.now()
-        session.commit()
+@router.post("/usuarios/eliminar/{id_usuario}")
+async def eliminar_usuario_web(id_usuario: int, cascada: bool = Form(False), session: Session = Depends(get_session)):
+    lotes.eliminar_lote(session, Usuario, [id_usuario], cascada)
     return RedirectResponse(url="/web/usuarios?mensaje=Usuario movido a inactivos", status_code=303)
 
 
-@router.get("/usuarios/restaurar/{id_usuario}")
-async def restaurar_usuario_web(id_usuario: int, session: Session = Depends(get_session)):
-    usuario = session.get(Usuario, id_usuario)
-    if usuario:
-        usuario.is_active = True
-        usuario.deleted_at = None
-        session.commit()
-    return RedirectResponse(url="/web/usuarios?mensaje=Usuario reactivado correctamente", status_code=303)
+@router.post("/usuarios/restaurar/{id_usuario}")
+async def restaurar_usuario_web(id_usuario: int, cascada: bool = Form(False), session: Session = Depends(get_session)):
+    afectados = lotes.restaurar_lote(session, Usuario, [id_usuario], cascada)
+    mensaje = _mensaje_restaurar(afectados, "usuario", "Usuario reactivado correctamente")
+    return RedirectResponse(url=f"/web/usuarios?mensaje={mensaje}", status_code=303)
+
+
+@router.post("/usuarios/eliminar-seleccionados")
+async def eliminar_usuarios_lote_web(ids: List[int] = Form([]), cascada: bool = Form(False),
+                                     session: Session = Depends(get_session)):
+    afectados = lotes.eliminar_lote(session, Usuario, ids, cascada)
+    return RedirectResponse(url=f"/web/usuarios?mensaje={afectados['usuario']} usuarios movidos a inactivos", status_code=303)
+
+
+@router.post("/usuarios/restaurar-seleccionados")
+async def restaurar_usuarios_lote_web(ids: List[int] = Form([]), cascada: bool = Form(False),
+                                      session: Session = Depends(get_session)):
+    afectados = lotes.restaurar_lote(session, Usuario, ids, cascada)
+    mensaje = _mensaje_restaurar(afectados, "usuario", f"{afectados['usuario']} usuarios reactivados")
+    return RedirectResponse(url=f"/web/usuarios?mensaje={mensaje}", status_code=303)
 
 
 # ==========================================
@@ -224,44 +309,73 @@ async def restaurar_usuario_web(id_usuario: int, session: Session = Depends(get_
 async def pagina_titulos(
         request: Request,
         page: int = 1,  # Parámetro de página
+        papelera: int = 1,  # Página de la papelera
+        genero: List[int] = Query([]),  # ids de Genero
+        anio_min: Optional[int] = None,
+        anio_max: Optional[int] = None,
+        duracion: Optional[int] = None,  # Inicio del tramo de duración elegido
+        estrellas: Optional[int] = None,  # Promedio mínimo
+        orden: str = "id",
         session: Session = Depends(get_session)
 ):
     limit = 10  # Películas por página (10 por solicitud)
-    offset = (page - 1) * limit
+    page = max(1, page)
+
+    # 1. Filtros, total y facetas sobre el catálogo en memoria (ver utils/catalogo.py)
+    duracion_max = None
+    if duracion in TRAMOS_DURACION and duracion != TRAMOS_DURACION[-1]:
+        duracion_max = TRAMOS_DURACION[TRAMOS_DURACION.index(duracion) + 1] - 1
+    resultado = catalogo.explorar(generos=genero, anio_min=anio_min, anio_max=anio_max, duracion_min=duracion,
+                                  duracion_max=duracion_max, promedio_min=estrellas, orden=orden,
+                                  pagina=page, por_pagina=limit)
+    total_pages = math.ceil(resultado["total"] / limit)
 
-    # 1. Total de títulos activos para calcular el número de páginas
-    total_query = select(func.count(PeliculaSerie.id_titulo)).where(PeliculaSerie.is_active == True)
-    total_titulos = session.exec(total_query).one()
-    total_pages = math.ceil(total_titulos / limit)
+    # 2. Tarjetas de la página (solo las columnas de la tarjeta; la descripción completa la pide el modal)
+    activos = proyecciones.tarjetas_titulos(session, resultado["ids"])
 
-    # 2. Obtener títulos paginados
-    query = select(PeliculaSerie).where(PeliculaSerie.is_active == True).offset(offset).limit(limit)
-    activos = session.exec(query).all()
+    filtros = {"genero": genero, "anio_min": anio_min, "anio_max": anio_max, "duracion": duracion,
+               "estrellas": estrellas, "orden": orden}
+    # Para que la paginación conserve los filtros
+    filtros_qs = urlencode({k: v for k, v in filtros.items() if v not in (None, [], "id")}, doseq=True)
 
-    # Inactivos (Estos se mantienen igual, sin paginación)
-    inactivos = session.exec(select(PeliculaSerie).where(PeliculaSerie.is_active == False)).all()
+    # Inactivos paginados (incluye los archivados)
+    inactivos, papelera_pages = archivo.pagina_papelera(session, PeliculaSerie, ["id_titulo", "titulo"], papelera)
 
     return templates.TemplateResponse("titulos.html", {
         "request": request,
         "titulos_activos": activos,
         "titulos_inactivos": inactivos,
+        "total_titulos": resultado["total"],
+        "facetas": resultado["facetas"],
+        "filtros": filtros,
+        "filtros_qs": filtros_qs,
+        "ordenes": ORDENES,
         "current_page": page,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "papelera_page": papelera,
+        "papelera_pages": papelera_pages
     })
 
 
+def _generos_form(session: Session, titulo: Optional[PeliculaSerie]):
+    """Opciones de género del formulario y los que ya tiene el título."""
+    seleccionados = [] if titulo is None else session.exec(
+        select(TituloGenero.id_genero_FK).where(TituloGenero.id_titulo_FK == titulo.id_titulo)).all()
+    return {"generos": generos.listar(session), "generos_titulo": seleccionados}
+
+
 @router.get("/titulos/crear", response_class=HTMLResponse)
-async def pagina_crear_titulo(request: Request):
+async def pagina_crear_titulo(request: Request, session: Session = Depends(get_session)):
     return templates.TemplateResponse("titulo_form.html",
                                       {"request": request, "accion": "Crear", "titulo": None, "error_message": None,
-                                       "form_data": {}})
+                                       "form_data": {}, **_generos_form(session, None)})
 
 
 @router.post("/titulos/crear")
 async def crear_titulo_web(
         request: Request,
         titulo: str = Form(...),
-        genero: str = Form(...),
+        id_genero: List[int] = Form([]),
         anio_estreno: int = Form(...),
         duracion: int = Form(...),
         descripcion: str = Form(...),
@@ -270,7 +384,7 @@ async def crear_titulo_web(
 ):
     form_data = {
         "titulo": titulo,
-        "genero": genero,
+        "id_genero": id_genero,
         "anio_estreno": anio_estreno,
         "duracion": duracion,
         "descripcion": descripcion
@@ -280,7 +394,15 @@ async def crear_titulo_web(
     if duracion <= 0:
         return templates.TemplateResponse("titulo_form.html", {
             "request": request, "accion": "Crear", "titulo": None,
-            "error_message": "La duración debe ser un número positivo (mínimo 1).", "form_data": form_data
+            "error_message": "La duración debe ser un número positivo (mínimo 1).", "form_data": form_data, **_generos_form(session, None)
+        })
+
+    # 1b. Validación: al menos un género
+    seleccion = generos.por_ids(session, id_genero)
+    if not seleccion:
+        return templates.TemplateResponse("titulo_form.html", {
+            "request": request, "accion": "Crear", "titulo": None,
+            "error_message": "Seleccione al menos un género.", "form_data": form_data, **_generos_form(session, None)
         })
 
     img_url = DEFAULT_MOVIE_IMG
@@ -288,28 +410,24 @@ async def crear_titulo_web(
     # 2. Manejo de imagen por defecto o subida
     if img and img.filename:
         try:
-            file_content = await img.read()
-            if file_content:
-                await img.seek(0)
-                img_url = await upload_to_bucket(img)
+            img_url = await almacen.guardar_imagen(img) or img_url
         except Exception as e:
             return templates.TemplateResponse("titulo_form.html", {
                 "request": request, "accion": "Crear", "titulo": None,
-                "error_message": f"Error al subir la imagen: {str(e)}", "form_data": form_data
+                "error_message": f"Error al subir la imagen: {str(e)}", "form_data": form_data, **_generos_form(session, None)
             })
 
     try:
         # 3. Validación: Título duplicado (chequeo explícito antes de DB commit)
-        existente = session.exec(select(PeliculaSerie).where(PeliculaSerie.titulo == titulo)).first()
+        existente = session.exec(select(PeliculaSerie.id_titulo).where(PeliculaSerie.titulo == titulo)).first()
         if existente:
             return templates.TemplateResponse("titulo_form.html", {
                 "request": request, "accion": "Crear", "titulo": None,
-                "error_message": f"Ya existe un título con el nombre '{titulo}'.", "form_data": form_data
+                "error_message": f"Ya existe un título con el nombre '{titulo}'.", "form_data": form_data, **_generos_form(session, None)
             })
 
         nuevo_titulo = PeliculaSerie(
             titulo=titulo,
-            genero=genero,
             anio_estreno=anio_estreno,
             duracion=duracion,
             descripcion=descripcion,
@@ -317,13 +435,16 @@ async def crear_titulo_web(
         )
 
         session.add(nuevo_titulo)
+        generos.asignar(session, nuevo_titulo, seleccion)
+        almacen.cambiar_referencia(session, None, img_url)
         session.commit()
 
     except Exception as e:
         # Catch other potential DB errors
+        session.rollback()
         error_msg = f"Error de base de datos al crear título: {str(e)}"
         return templates.TemplateResponse("titulo_form.html", {
-            "request": request, "accion": "Crear", "titulo": None, "error_message": error_msg, "form_data": form_data
+            "request": request, "accion": "Crear", "titulo": None, "error_message": error_msg, "form_data": form_data, **_generos_form(session, None)
         })
 
     return RedirectResponse(
@@ -337,7 +458,7 @@ async def pagina_editar_titulo(id_titulo: int, request: Request, session: Sessio
     titulo = session.get(PeliculaSerie, id_titulo)
     return templates.TemplateResponse("titulo_form.html",
                                       {"request": request, "accion": "Editar", "titulo": titulo, "error_message": None,
-                                       "form_data": {}})
+                                       "form_data": {}, **_generos_form(session, titulo)})
 
 
 @router.post("/titulos/editar/{id_titulo}")
@@ -345,7 +466,7 @@ async def editar_titulo_web(
         id_titulo: int,
         request: Request,
         titulo: str = Form(...),
-        genero: str = Form(...),
+        id_genero: List[int] = Form([]),
         anio_estreno: int = Form(...),
         duracion: int = Form(...),
         descripcion: str = Form(...),
@@ -358,7 +479,7 @@ async def editar_titulo_web(
 
     form_data = {
         "titulo": titulo,
-        "genero": genero,
+        "id_genero": id_genero,
         "anio_estreno": anio_estreno,
         "duracion": duracion,
         "descripcion": descripcion
@@ -368,36 +489,42 @@ async def editar_titulo_web(
     if duracion <= 0:
         return templates.TemplateResponse("titulo_form.html", {
             "request": request, "accion": "Editar", "titulo": titulo_obj,
-            "error_message": "La duración debe ser un número positivo (mínimo 1).", "form_data": form_data
+            "error_message": "La duración debe ser un número positivo (mínimo 1).", "form_data": form_data, **_generos_form(session, titulo_obj)
+        })
+
+    # 1b. Validación: al menos un género
+    seleccion = generos.por_ids(session, id_genero)
+    if not seleccion:
+        return templates.TemplateResponse("titulo_form.html", {
+            "request": request, "accion": "Editar", "titulo": titulo_obj,
+            "error_message": "Seleccione al menos un género.", "form_data": form_data, **_generos_form(session, titulo_obj)
         })
 
     # 2. Validación: Título duplicado (si el título es modificado)
     if titulo != titulo_obj.titulo:
         existente = session.exec(
-            select(PeliculaSerie).where(PeliculaSerie.titulo == titulo, PeliculaSerie.id_titulo != id_titulo)).first()
+            select(PeliculaSerie.id_titulo).where(PeliculaSerie.titulo == titulo, PeliculaSerie.id_titulo != id_titulo)).first()
         if existente:
             return templates.TemplateResponse("titulo_form.html", {
                 "request": request, "accion": "Editar", "titulo": titulo_obj,
-                "error_message": f"Ya existe un título con el nombre '{titulo}'.", "form_data": form_data
+                "error_message": f"Ya existe un título con el nombre '{titulo}'.", "form_data": form_data, **_generos_form(session, titulo_obj)
             })
 
     # 3. Manejo de imagen
     img_url = titulo_obj.img  # Conserva la imagen actual por defecto
     if img and img.filename:
         try:
-            file_content = await img.read()
-            if file_content:
-                await img.seek(0)
-                img_url = await upload_to_bucket(img)
+            img_url = await almacen.guardar_imagen(img) or img_url
         except Exception as e:
             return templates.TemplateResponse("titulo_form.html", {
                 "request": request, "accion": "Editar", "titulo": titulo_obj,
-                "error_message": f"Error al subir la imagen: {str(e)}", "form_data": form_data
+                "error_message": f"Error al subir la imagen: {str(e)}", "form_data": form_data, **_generos_form(session, titulo_obj)
             })
 
     # Actualizar datos
+    almacen.cambiar_referencia(session, titulo_obj.img, img_url)
     titulo_obj.titulo = titulo
-    titulo_obj.genero = genero
+    generos.asignar(session, titulo_obj, seleccion)
     titulo_obj.anio_estreno = anio_estreno
     titulo_obj.duracion = duracion
     titulo_obj.descripcion = descripcion
@@ -407,45 +534,59 @@ async def editar_titulo_web(
     return RedirectResponse(url="/web/titulos?mensaje=Título actualizado correctamente", status_code=303)
 
 
-@router.get("/titulos/eliminar/{id_titulo}")
-async def eliminar_titulo_web(id_titulo: int, session: Session = Depends(get_session)):
-    titulo = session.get(PeliculaSerie, id_titulo)
-    if titulo:
-        titulo.is_active = False
-        titulo.deleted_at = datetime.now()
-        session.commit()
+@router.post("/titulos/eliminar/{id_titulo}")
+async def eliminar_titulo_web(id_titulo: int, cascada: bool = Form(False), session: Session = Depends(get_session)):
+    lotes.eliminar_lote(session, PeliculaSerie, [id_titulo], cascada)
     return RedirectResponse(url="/web/titulos?mensaje=Título movido a inactivos", status_code=303)
 
 
-@router.get("/titulos/restaurar/{id_titulo}")
-async def restaurar_titulo_web(id_titulo: int, session: Session = Depends(get_session)):
-    titulo = session.get(PeliculaSerie, id_titulo)
-    if titulo:
-        titulo.is_active = True
-        titulo.deleted_at = None
-        session.commit()
-    return RedirectResponse(url="/web/titulos?mensaje=Título reactivado correctamente", status_code=303)
+@router.post("/titulos/restaurar/{id_titulo}")
+async def restaurar_titulo_web(id_titulo: int, cascada: bool = Form(False), session: Session = Depends(get_session)):
+    afectados = lotes.restaurar_lote(session, PeliculaSerie, [id_titulo], cascada)
+    mensaje = _mensaje_restaurar(afectados, "peliculaserie", "Título reactivado correctamente")
+    return RedirectResponse(url=f"/web/titulos?mensaje={mensaje}", status_code=303)
+
+
+@router.post("/titulos/eliminar-seleccionados")
+async def eliminar_titulos_lote_web(ids: List[int] = Form([]), cascada: bool = Form(False),
+                                    session: Session = Depends(get_session)):
+    afectados = lotes.eliminar_lote(session, PeliculaSerie, ids, cascada)
+    return RedirectResponse(url=f"/web/titulos?mensaje={afectados['peliculaserie']} títulos movidos a inactivos", status_code=303)
+
+
+@router.post("/titulos/restaurar-seleccionados")
+async def restaurar_titulos_lote_web(ids: List[int] = Form([]), cascada: bool = Form(False),
+                                     session: Session = Depends(get_session)):
+    afectados = lotes.restaurar_lote(session, PeliculaSerie, ids, cascada)
+    mensaje = _mensaje_restaurar(afectados, "peliculaserie", f"{afectados['peliculaserie']} títulos reactivados")
+    return RedirectResponse(url=f"/web/titulos?mensaje={mensaje}", status_code=303)
 
 
 # ==========================================
 # GESTIÓN DE VALORACIONES
 # ==========================================
-def get_valoracion_form_data(session: Session, id_valoracion: Optional[int] = None):
-    usuarios = session.exec(select(Usuario).where(Usuario.is_active == True)).all()
-    titulos = session.exec(select(PeliculaSerie).where(PeliculaSerie.is_active == True)).all()
+def get_valoracion_form_data(session: Session, id_valoracion: Optional[int] = None,
+                             id_usuario: Optional[int] = None, id_titulo: Optional[int] = None):
+    # Solo se cargan las opciones ya elegidas; el resto las busca el autocompletado
     valoracion = session.get(Valoracion, id_valoracion) if id_valoracion else None
+    if valoracion:
+        id_usuario, id_titulo = valoracion.id_usuario_FK, valoracion.id_titulo_FK
 
     return {
-        "usuarios": usuarios,
-        "titulos": titulos,
+        "usuario_sel": proyecciones.opcion_usuario(session, id_usuario),
+        "titulo_sel": proyecciones.opcion_titulo(session, id_titulo),
         "valoracion": valoracion
     }
 @router.get("/valoraciones", response_class=HTMLResponse)
-async def pagina_valoraciones(request: Request, session: Session = Depends(get_session)):
-    # Se obtienen todos los usuarios y títulos para la "Papelera" y para mapear en el modal
-    inactivas = session.exec(select(Valoracion).where(Valoracion.is_active == False)).all()
-    usuarios_dict = {u.id_usuario: u for u in session.exec(select(Usuario)).all()}
-    titulos_dict = {t.id_titulo: t for t in session.exec(select(PeliculaSerie)).all()}
+async def pagina_valoraciones(request: Request, papelera: int = 1, session: Session = Depends(get_session)):
+    # Papelera paginada (incluye las archivadas); solo se buscan los nombres de la página visible
+    inactivas, papelera_pages = archivo.pagina_papelera(
+        session, Valoracion,
+        ["id_valoracion", "puntuacion", "comentario", "fecha", "id_usuario_FK", "id_titulo_FK"], papelera)
+    nombres_usuarios = dict(session.exec(select(Usuario.id_usuario, Usuario.nombre).where(
+        Usuario.id_usuario.in_({v.id_usuario_FK for v in inactivas}))).all())
+    nombres_titulos = dict(session.exec(select(PeliculaSerie.id_titulo, PeliculaSerie.titulo).where(
+        PeliculaSerie.id_titulo.in_({v.id_titulo_FK for v in inactivas}))).all())
 
     # --- 2. Títulos con Valoraciones Activas (Datos Agregados) ---
     # Consulta para obtener título, imagen y la puntuación promedio (SIN REDONDEAR AQUI)
@@ -480,7 +621,7 @@ async def pagina_valoraciones(request: Request, session: Session = Depends(get_s
         })
 
     # --- 3. Todas las Valoraciones Activas Agrupadas por Título (para el Modal) ---
-    all_active_valoraciones = session.exec(select(Valoracion).where(Valoracion.is_active == True)).all()
+    all_active_valoraciones = proyecciones.valoraciones_activas(session)
 
     # Agrupar las valoraciones por título en Python, inyectando datos de usuario para el modal
     valoraciones_por_titulo = {}
@@ -489,16 +630,13 @@ async def pagina_valoraciones(request: Request, session: Session = Depends(get_s
         if title_id not in valoraciones_por_titulo:
             valoraciones_por_titulo[title_id] = []
 
-        # Obtener información de usuario del diccionario (eficiente)
-        usuario_info = usuarios_dict.get(val.id_usuario_FK)
-
         valoraciones_por_titulo[title_id].append({
             "id_valoracion": val.id_valoracion,
             "puntuacion": val.puntuacion,
             "comentario": val.comentario,
             "fecha": val.fecha.strftime("%Y-%m-%d"),
-            "usuario_nombre": usuario_info.nombre if usuario_info else 'N/A',
-            "usuario_img": usuario_info.img if usuario_info and usuario_info.img else '/static/img/user-placeholder.png',
+            "usuario_nombre": val.usuario_nombre,
+            "usuario_img": val.usuario_img or '/static/img/user-placeholder.png',
             "id_usuario_FK": val.id_usuario_FK
         })
 
@@ -508,8 +646,10 @@ async def pagina_valoraciones(request: Request, session: Session = Depends(get_s
         "titulos_con_rating": titulos_con_rating,
         "valoraciones_por_titulo": valoraciones_por_titulo,
         "valoraciones_inactivas": inactivas,
-        "usuarios_dict": usuarios_dict,
-        "titulos_dict": titulos_dict,
+        "nombres_usuarios": nombres_usuarios,
+        "nombres_titulos": nombres_titulos,
+        "papelera_page": papelera,
+        "papelera_pages": papelera_pages,
         "placeholder_movie_img": '/static/img/placeholder_movie.jpg',
         "placeholder_user_img": '/static/img/user-placeholder.png'
     })
@@ -532,7 +672,10 @@ async def crear_valoracion_web(
         comentario: str = Form(...),
         fecha: str = Form(...),
         session: Session = Depends(get_session)):
-    context = get_valoracion_form_data(session)
+    def contexto():
+        # Solo se arma si hay que volver a mostrar el formulario
+        return get_valoracion_form_data(session, id_usuario=id_usuario_FK, id_titulo=id_titulo_FK)
+
     form_data = {
         "id_usuario_FK": id_usuario_FK,
         "id_titulo_FK": id_titulo_FK,
@@ -541,12 +684,12 @@ async def crear_valoracion_web(
         "fecha": fecha
     }
 
-    # 1. Validación: Puntuación (mínimo 1 estrella)
-    if puntuacion <= 0.0:
+    # 1. Validación: Puntuación (de 1 a 5 estrellas)
+    if puntuacion <= 0.0 or puntuacion > 5:
         return templates.TemplateResponse("valoracion_form.html", {
             "request": request, "accion": "Crear",
             "error_message": "La puntuación no puede ser cero. Selecciona de 1 a 5 estrellas.", "form_data": form_data,
-            **context
+            **contexto()
         })
 
     # 2. Validación: Claves foráneas (Usuario y Título deben existir y estar activos)
@@ -557,34 +700,24 @@ async def crear_valoracion_web(
         return templates.TemplateResponse("valoracion_form.html", {
             "request": request, "accion": "Crear",
             "error_message": f"Usuario con ID {id_usuario_FK} no encontrado o inactivo.", "form_data": form_data,
-            **context
+            **contexto()
         })
     if not titulo or not titulo.is_active:
         return templates.TemplateResponse("valoracion_form.html", {
             "request": request, "accion": "Crear",
             "error_message": f"Título con ID {id_titulo_FK} no encontrado o inactivo.", "form_data": form_data,
-            **context
+            **contexto()
         })
 
-    # 3. Validación: No duplicar valoración para el mismo usuario y título
-    existing_rating = session.exec(select(Valoracion).where(
-        Valoracion.id_usuario_FK == id_usuario_FK,
-        Valoracion.id_titulo_FK == id_titulo_FK,
-        Valoracion.is_active == True
-    )).first()
-
-    if existing_rating:
+    # 3. Inserción atómica: el índice único parcial evita duplicar la valoración activa (ON CONFLICT DO NOTHING)
+    fecha_obj = datetime.strptime(fecha, "%Y-%m-%d").date()
+    if valoraciones.crear_valoracion(session, id_usuario_FK, id_titulo_FK, puntuacion, comentario, fecha_obj) is None:
         return templates.TemplateResponse("valoracion_form.html", {
             "request": request, "accion": "Crear",
             "error_message": "Ya existe una valoración activa de este usuario para este título. Por favor, edita la valoración existente.",
-            "form_data": form_data, **context
+            "form_data": form_data, **contexto()
         })
 
-    fecha_obj = datetime.strptime(fecha, "%Y-%m-%d").date()
-    nueva_val = Valoracion(id_usuario_FK=id_usuario_FK, id_titulo_FK=id_titulo_FK, puntuacion=puntuacion,
-                           comentario=comentario, fecha=fecha_obj)
-    session.add(nueva_val)
-    session.commit()
     return RedirectResponse(url="/web/valoraciones?mensaje=Valoración registrada", status_code=303)
 
 
@@ -613,8 +746,6 @@ async def editar_valoracion_web(id_valoracion: int,
     if not val:
         raise HTTPException(status_code=404, detail="Valoración no encontrada")
 
-    context = get_valoracion_form_data(session)
-
     form_data = {
         "id_usuario_FK": id_usuario_FK,
         "id_titulo_FK": id_titulo_FK,
@@ -623,41 +754,64 @@ async def editar_valoracion_web(id_valoracion: int,
         "fecha": fecha
     }
 
-    # 1. Validación: Puntuación (mínimo 1 estrella)
-    if puntuacion <= 0.0:
+    def error(mensaje: str):
         return templates.TemplateResponse("valoracion_form.html", {
-            "request": request, "accion": "Editar",
-            "error_message": "La puntuación no puede ser cero. Selecciona de 1 a 5 estrellas.", "form_data": form_data,
-            "valoracion": val, **context
+            "request": request, "accion": "Editar", "error_message": mensaje, "form_data": form_data,
+            **get_valoracion_form_data(session, id_valoracion)
         })
 
+    # 1. Validación: Puntuación (de 1 a 5 estrellas)
+    if puntuacion <= 0.0 or puntuacion > 5:
+        return error("La puntuación no puede ser cero. Selecciona de 1 a 5 estrellas.")
+
+    # 2. Validación: si cambia el usuario o el título, deben estar activos y sin otra valoración activa del par
+    if (id_usuario_FK, id_titulo_FK) != (val.id_usuario_FK, val.id_titulo_FK):
+        usuario = session.get(Usuario, id_usuario_FK)
+        titulo = session.get(PeliculaSerie, id_titulo_FK)
+        if not usuario or not usuario.is_active:
+            return error(f"Usuario con ID {id_usuario_FK} no encontrado o inactivo.")
+        if not titulo or not titulo.is_active:
+            return error(f"Título con ID {id_titulo_FK} no encontrado o inactivo.")
+        if val.is_active and session.exec(select(Valoracion.id_valoracion).where(
+                Valoracion.id_usuario_FK == id_usuario_FK, Valoracion.id_titulo_FK == id_titulo_FK,
+                Valoracion.is_active == True, Valoracion.id_valoracion != id_valoracion)).first():
+            return error("Ya existe una valoración activa de este usuario para este título. Por favor, edita la valoración existente.")
+
+    anterior = (val.id_titulo_FK, val.fecha, val.puntuacion)
     val.id_usuario_FK = id_usuario_FK
     val.id_titulo_FK = id_titulo_FK
     val.puntuacion = puntuacion
     val.comentario = comentario
     val.fecha = datetime.strptime(fecha, "%Y-%m-%d").date()
-    session.commit()
+    try:
+        # El autoflush de los agregados ya puede chocar con el índice único si otra petición se adelantó
+        if val.is_active:
+            valoraciones.actualizar_agregados(session, [anterior], [(val.id_titulo_FK, val.fecha, val.puntuacion)])
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        return error("Ya existe una valoración activa de este usuario para este título. Por favor, edita la valoración existente.")
     return RedirectResponse(url="/web/valoraciones?mensaje=Valoración actualizada", status_code=303)
 
 
-@router.get("/valoraciones/eliminar/{id_valoracion}")
+@router.post("/valoraciones/eliminar/{id_valoracion}")
 async def eliminar_valoracion_web(id_valoracion: int, session: Session = Depends(get_session)):
-    val = session.get(Valoracion, id_valoracion)
-    if val:
-        val.is_active = False
-        val.deleted_at = datetime.now()
-        session.commit()
+    lotes.eliminar_lote(session, Valoracion, [id_valoracion])
     return RedirectResponse(url="/web/valoraciones?mensaje=Valoración movida a papelera", status_code=303)
 
 
-@router.get("/valoraciones/restaurar/{id_valoracion}")
+@router.post("/valoraciones/restaurar/{id_valoracion}")
 async def restaurar_valoracion_web(id_valoracion: int, session: Session = Depends(get_session)):
-    val = session.get(Valoracion, id_valoracion)
-    if val:
-        val.is_active = True
-        val.deleted_at = None
-        session.commit()
-    return RedirectResponse(url="/web/valoraciones?mensaje=Valoración restaurada", status_code=303)
+    afectados = lotes.restaurar_lote(session, Valoracion, [id_valoracion])
+    mensaje = _mensaje_restaurar(afectados, "valoracion", "Valoración restaurada")
+    return RedirectResponse(url=f"/web/valoraciones?mensaje={mensaje}", status_code=303)
+
+
+@router.post("/valoraciones/restaurar-seleccionados")
+async def restaurar_valoraciones_lote_web(ids: List[int] = Form([]), session: Session = Depends(get_session)):
+    afectados = lotes.restaurar_lote(session, Valoracion, ids)
+    mensaje = _mensaje_restaurar(afectados, "valoracion", f"{afectados['valoracion']} valoraciones restauradas")
+    return RedirectResponse(url=f"/web/valoraciones?mensaje={mensaje}", status_code=303)
 
 
 # ==========================================
@@ -672,15 +826,15 @@ async def pagina_rutinas(
         month: Optional[int] = None,
         session: Session = Depends(get_session)
 ):
-    # 1. Obtener todos los usuarios activos para el selector
-    usuarios = session.exec(select(Usuario).where(Usuario.is_active == True)).all()
+    # 1. Usuario elegido en el buscador (el resto lo busca el autocompletado)
+    usuario_sel = proyecciones.opcion_usuario(session, id_usuario_FK)
 
     hoy = date.today()
 
     # Base context para la plantilla
     context = {
         "request": request,
-        "usuarios": usuarios,
+        "usuario_sel": usuario_sel,
         "selected_user_id": id_usuario_FK,
         "now": hoy,  # Fecha actual para resaltado de día
         "year": year if year is not None else hoy.year,
@@ -693,15 +847,26 @@ async def pagina_rutinas(
 
     # --- Usuario seleccionado: Procede con la lógica del calendario ---
 
-    # 2. Filtrar rutinas por usuario seleccionado
-    query = select(Rutina).where(Rutina.is_active == True, Rutina.id_usuario_FK == id_usuario_FK)
-    rutinas = session.exec(query).all()
+    # 2. Mes a mostrar (usa fecha actual o parámetros de URL)
+    target_year = year if year is not None else hoy.year
+    target_month = month if month is not None else hoy.month
+
+    try:
+        target_date = date(target_year, target_month, 1)
+    except ValueError:
+        target_date = date(hoy.year, hoy.month, 1)
+
+    year = target_date.year
+    month = target_date.month
+    fin_mes = date(year, month, calendar.monthrange(year, month)[1])
+
+    # 3. Rutinas del usuario que tocan el mes (con el nombre de su título), mapeadas por día del mes
+    rutinas = proyecciones.rutinas_calendario(session, id_usuario_FK, target_date, fin_mes)
 
-    # 3. Mapeo de rutinas por día
     rutinas_map = {}
     for r in rutinas:
-        fecha_cursor = r.fecha_inicio
-        fecha_fin = r.fecha_fin
+        fecha_cursor = max(r.fecha_inicio, target_date)
+        fecha_fin = min(r.fecha_fin, fin_mes)
 
         while fecha_cursor <= fecha_fin:
             fecha_str = fecha_cursor.strftime("%Y-%m-%d")
@@ -712,22 +877,11 @@ async def pagina_rutinas(
             rutinas_map[fecha_str].append(r)
             fecha_cursor += timedelta(days=1)
 
-    # 4. Diccionario de Títulos (para mostrar el nombre del título en el calendario)
-    titulos = session.exec(select(PeliculaSerie).where(PeliculaSerie.is_active == True)).all()
-    titulos_dict = {t.id_titulo: t for t in titulos}
-
-    # 5. Generación del Calendario (usa fecha actual o parámetros de URL)
-    target_year = year if year is not None else hoy.year
-    target_month = month if month is not None else hoy.month
-
-    try:
-        target_date = date(target_year, target_month, 1)
-    except ValueError:
-        target_date = date(hoy.year, hoy.month, 1)
-
-    year = target_date.year
-    month = target_date.month
+    # Minutos planeados por día (la duración de cada título repartida entre los días de su rutina)
+    minutos_map = {(target_date + timedelta(days=i)).strftime("%Y-%m-%d"): round(float(m))
+                   for i, m in enumerate(agenda.carga_usuario(session, id_usuario_FK, target_date, fin_mes)) if m}
 
+    # 4. Generación del Calendario
     cal = calendar.monthcalendar(year, month)
 
     meses = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre",
@@ -749,7 +903,8 @@ async def pagina_rutinas(
     context.update({
         "calendar_weeks": cal,
         "rutinas_map": rutinas_map,
-        "titulos_dict": titulos_dict,
+        "minutos_map": minutos_map,
+        "max_minutos_dia": agenda.RUTINA_MAX_MINUTOS_DIA,
         "year": year,
         "month": month,
         "nombre_mes": nombre_mes,
@@ -764,14 +919,16 @@ async def pagina_rutinas(
 
 
 # Helper function to get common data for Rutina forms
-def get_rutina_form_data(session: Session, id_rutina: Optional[int] = None):
-    usuarios = session.exec(select(Usuario).where(Usuario.is_active == True)).all()
-    titulos = session.exec(select(PeliculaSerie).where(PeliculaSerie.is_active == True)).all()
+def get_rutina_form_data(session: Session, id_rutina: Optional[int] = None,
+                         id_usuario: Optional[int] = None, id_titulo: Optional[int] = None):
+    # Solo se cargan las opciones ya elegidas; el resto las busca el autocompletado
     rutina = session.get(Rutina, id_rutina) if id_rutina else None
+    if rutina:
+        id_usuario, id_titulo = rutina.id_usuario_FK, rutina.id_titulo_FK
 
     return {
-        "usuarios": usuarios,
-        "titulos": titulos,
+        "usuario_sel": proyecciones.opcion_usuario(session, id_usuario),
+        "titulo_sel": proyecciones.opcion_titulo(session, id_titulo),
         "rutina": rutina
     }
 
@@ -783,7 +940,7 @@ async def pagina_crear_rutina(
         id_usuario_FK: Optional[int] = None,
         session: Session = Depends(get_session)
 ):
-    context = get_rutina_form_data(session)
+    context = get_rutina_form_data(session, id_usuario=id_usuario_FK)
 
     return templates.TemplateResponse("rutina_form.html", {
         "request": request,
@@ -805,7 +962,10 @@ async def crear_rutina_web(
         fecha_inicio: str = Form(...),
         fecha_fin: str = Form(...),
         session: Session = Depends(get_session)):
-    context = get_rutina_form_data(session)
+    def contexto():
+        # Solo se arma si hay que volver a mostrar el formulario
+        return get_rutina_form_data(session, id_usuario=id_usuario_FK, id_titulo=id_titulo_FK)
+
     form_data = {
         "nombre": nombre,
         "id_usuario_FK": id_usuario_FK,
@@ -821,7 +981,7 @@ async def crear_rutina_web(
     except ValueError:
         return templates.TemplateResponse("rutina_form.html", {
             "request": request, "accion": "Crear", "error_message": "Formato de fecha inválido. Use AAAA-MM-DD.",
-            "form_data": form_data, **context
+            "form_data": form_data, **contexto()
         })
 
     # 2. Validación: Fecha de inicio no puede ser posterior a la fecha de fin
@@ -829,7 +989,7 @@ async def crear_rutina_web(
         return templates.TemplateResponse("rutina_form.html", {
             "request": request, "accion": "Crear",
             "error_message": "La fecha de inicio no puede ser posterior a la fecha de fin.", "form_data": form_data,
-            **context
+            **contexto()
         })
 
     # 3. Validación: Claves foráneas (Usuario y Título deben existir y estar activos)
@@ -840,16 +1000,23 @@ async def crear_rutina_web(
         return templates.TemplateResponse("rutina_form.html", {
             "request": request, "accion": "Crear",
             "error_message": f"Usuario con ID {id_usuario_FK} no encontrado o inactivo.", "form_data": form_data,
-            **context
+            **contexto()
         })
     if not titulo or not titulo.is_active:
         return templates.TemplateResponse("rutina_form.html", {
             "request": request, "accion": "Crear",
             "error_message": f"Título con ID {id_titulo_FK} no encontrado o inactivo.", "form_data": form_data,
-            **context
+            **contexto()
         })
 
-    # 4. Creación
+    # 4. Validación: Minutos planeados por día (RUTINA_MAX_MINUTOS_DIA)
+    error = agenda.exceso(session, id_usuario_FK, f_inicio, f_fin, titulo.duracion)
+    if error:
+        return templates.TemplateResponse("rutina_form.html", {
+            "request": request, "accion": "Crear", "error_message": error, "form_data": form_data, **contexto()
+        })
+
+    # 5. Creación
     rutina = Rutina(nombre=nombre, id_usuario_FK=id_usuario_FK, id_titulo_FK=id_titulo_FK,
                     fecha_inicio=f_inicio, fecha_fin=f_fin)
     session.add(rutina)
@@ -890,7 +1057,6 @@ async def editar_rutina_web(
     if not rutina:
         raise HTTPException(status_code=404, detail=f"Rutina con ID {id_rutina} no encontrada")
 
-    context = get_rutina_form_data(session)
     form_data = {
         "nombre": nombre,
         "id_usuario_FK": id_usuario_FK,
@@ -906,7 +1072,7 @@ async def editar_rutina_web(
     except ValueError:
         return templates.TemplateResponse("rutina_form.html", {
             "request": request, "accion": "Editar", "error_message": "Formato de fecha inválido. Use AAAA-MM-DD.",
-            "form_data": form_data, "rutina": rutina, **context
+            "form_data": form_data, **get_rutina_form_data(session, id_rutina)
         })
 
     # 2. Validación: Fecha de inicio no puede ser posterior a la fecha de fin
@@ -914,10 +1080,21 @@ async def editar_rutina_web(
         return templates.TemplateResponse("rutina_form.html", {
             "request": request, "accion": "Editar",
             "error_message": "La fecha de inicio no puede ser posterior a la fecha de fin.", "form_data": form_data,
-            "rutina": rutina, **context
+            **get_rutina_form_data(session, id_rutina)
         })
 
-    # 3. Actualización de datos
+    # 3. Validación: Minutos planeados por día (RUTINA_MAX_MINUTOS_DIA)
+    titulo = session.get(PeliculaSerie, id_titulo_FK)
+    if not titulo:
+        raise HTTPException(status_code=404, detail=f"Título con ID {id_titulo_FK} no encontrado")
+    error = agenda.exceso(session, id_usuario_FK, f_inicio, f_fin, titulo.duracion, id_rutina)
+    if error:
+        return templates.TemplateResponse("rutina_form.html", {
+            "request": request, "accion": "Editar", "error_message": error, "form_data": form_data,
+            **get_rutina_form_data(session, id_rutina)
+        })
+
+    # 4. Actualización de datos
     rutina.nombre = nombre
     rutina.id_usuario_FK = id_usuario_FK
     rutina.id_titulo_FK = id_titulo_FK
@@ -932,7 +1109,7 @@ async def editar_rutina_web(
         status_code=303
     )
 
-@router.get("/rutinas/eliminar/{id_rutina}")
+@router.post("/rutinas/eliminar/{id_rutina}")
 async def eliminar_rutina_web(id_rutina: int, session: Session = Depends(get_session)):
     rutina = session.get(Rutina, id_rutina)
     user_id = None
@@ -953,55 +1130,45 @@ async def eliminar_rutina_web(id_rutina: int, session: Session = Depends(get_ses
 
 @router.get("/estadisticas", response_class=HTMLResponse)
 async def pagina_estadisticas(request: Request, session: Session = Depends(get_session)):
-    # 1. Conteo General y Promedio Global (Nuevos KPIs)
-    n_usuarios = session.exec(select(func.count(Usuario.id_usuario)).where(Usuario.is_active == True)).one()
-    n_titulos = session.exec(select(func.count(PeliculaSerie.id_titulo)).where(PeliculaSerie.is_active == True)).one()
-    n_valoraciones = session.exec(
-        select(func.count(Valoracion.id_valoracion)).where(Valoracion.is_active == True)).one()
-
-    # NUEVO KPI: Total Rutinas
-    n_rutinas = session.exec(select(func.count(Rutina.id_rutina)).where(Rutina.is_active == True)).one()
-
-    # NUEVO KPI: Promedio Global
-    promedio_global_query = select(func.avg(Valoracion.puntuacion)).where(Valoracion.is_active == True)
-    promedio_global_raw = session.exec(promedio_global_query).one_or_none()
+    # 1. Conteo General (compartido con la página de inicio) y Promedio Global
+    conteos = consultas.contar_activos(session)
+
+    # NUEVO KPI: Promedio Global (de las series mensuales, sin recorrer las valoraciones)
+    promedio_global_raw = series.promedio_global(session)
     promedio_global = round(promedio_global_raw, 1) if promedio_global_raw is not None else 0.0
 
-    # 2. Películas mejor valoradas (Top Rated) - Se mantiene
-    top_rated_query = (
-        select(PeliculaSerie.titulo, func.avg(Valoracion.puntuacion).label("promedio"))
-        .join(Valoracion)
-        .where(PeliculaSerie.is_active == True, Valoracion.is_active == True)
-        .group_by(PeliculaSerie.id_titulo)
-        .order_by(desc("promedio"))
-        .limit(5)
-    )
-    top_rated_results = session.exec(top_rated_query).all()
-    top_rated_labels = [r[0] for r in top_rated_results]
-    top_rated_data = [round(r[1], 1) for r in top_rated_results]
+    # 2. Películas mejor valoradas (Top Rated) - Promedio ponderado del ranking en memoria
+    top_rated_results = consultas.top_titulos(session, 5)
+    top_rated_labels = [r["titulo"] for r in top_rated_results]
+    top_rated_data = [round(r["puntaje"], 1) for r in top_rated_results]
+
+    # Los géneros se agrupan por su id entero; el nombre se pone después (un título puede contar en varios)
+    nombres_genero = generos.nombres(session)
 
     # 3. Distribución por Género (Título Count) - Se mantiene (ordenado por conteo)
     genre_query = (
-        select(PeliculaSerie.genero, func.count(PeliculaSerie.id_titulo))
+        select(TituloGenero.id_genero_FK, func.count(TituloGenero.id_titulo_FK))
+        .join(PeliculaSerie, PeliculaSerie.id_titulo == TituloGenero.id_titulo_FK)
         .where(PeliculaSerie.is_active == True)
-        .group_by(PeliculaSerie.genero)
-        .order_by(desc(func.count(PeliculaSerie.id_titulo)))
+        .group_by(TituloGenero.id_genero_FK)
+        .order_by(desc(func.count(TituloGenero.id_titulo_FK)))
     )
     genre_results = session.exec(genre_query).all()
-    genre_labels = [r[0] for r in genre_results]
+    genre_labels = [nombres_genero[r[0]] for r in genre_results]
     genre_data = [r[1] for r in genre_results]
 
     # NUEVA ESTADÍSTICA: Top 5 Géneros más valorados (por número de reseñas)
     most_rated_genres_query = (
-        select(PeliculaSerie.genero, func.count(Valoracion.id_valoracion).label("total_reviews"))
+        select(TituloGenero.id_genero_FK, func.count(Valoracion.id_valoracion).label("total_reviews"))
+        .join(PeliculaSerie, PeliculaSerie.id_titulo == TituloGenero.id_titulo_FK)
         .join(Valoracion, PeliculaSerie.id_titulo == Valoracion.id_titulo_FK)
         .where(PeliculaSerie.is_active == True, Valoracion.is_active == True)
-        .group_by(PeliculaSerie.genero)
+        .group_by(TituloGenero.id_genero_FK)
         .order_by(desc("total_reviews"))
         .limit(5)
     )
     most_rated_genres_results = session.exec(most_rated_genres_query).all()
-    most_rated_genres_labels = [r[0] for r in most_rated_genres_results]
+    most_rated_genres_labels = [nombres_genero[r[0]] for r in most_rated_genres_results]
     most_rated_genres_data = [r[1] for r in most_rated_genres_results]
 
     # NUEVA ESTADÍSTICA: Títulos por Año de Estreno (Top 5)
@@ -1016,13 +1183,15 @@ async def pagina_estadisticas(request: Request, session: Session = Depends(get_s
     titles_by_year_labels = [str(r[0]) for r in titles_by_year_results]
     titles_by_year_data = [r[1] for r in titles_by_year_results]
 
+    # Valoraciones por semana del último año y por mes de los dos últimos (solo de las series)
+    hoy = date.today()
+    por_semana = series.serie(session, "semana", hoy - timedelta(days=364), hoy)
+    por_mes = series.serie(session, "mes", hoy.replace(day=1) - timedelta(days=700), hoy)
+
     return templates.TemplateResponse("estadisticas.html", {
         "request": request,
         # KPIs
-        "n_usuarios": n_usuarios,
-        "n_titulos": n_titulos,
-        "n_valoraciones": n_valoraciones,
-        "n_rutinas": n_rutinas,
+        **conteos,
         "promedio_global": promedio_global,
         # Gráficos existentes
         "top_rated_labels": top_rated_labels,
@@ -1034,4 +1203,6 @@ async def pagina_estadisticas(request: Request, session: Session = Depends(get_s
         "most_rated_genres_data": most_rated_genres_data,
         "titles_by_year_labels": titles_by_year_labels,
         "titles_by_year_data": titles_by_year_data,
+        "por_semana": por_semana,
+        "por_mes": por_mes,
     })
\ No newline at end of file
@@ -0,0 +1,53 @@
+// Autocompletado asíncrono para los selectores de usuario y título.
+// El campo visible busca en la API mientras se escribe; el ID elegido va en un input oculto.
+document.querySelectorAll('input[data-autocompletar]').forEach(function (campo) {
+    const destino = document.getElementById(campo.dataset.destino);
+    const lista = document.getElementById(campo.getAttribute('list'));
+    let opciones = {};
+    let temporizador = null;
+
+    function etiqueta(item) {
+        const detalle = campo.dataset.detalle ? item[campo.dataset.detalle] : null;
+        return detalle ? `${item[campo.dataset.texto]} (${detalle})` : item[campo.dataset.texto];
+    }
+
+    campo.addEventListener('input', function () {
+        campo.setCustomValidity('');
+        const elegido = opciones[campo.value];
+        destino.value = elegido !== undefined ? elegido : '';
+        if (elegido !== undefined) {
+            if (campo.dataset.enviar) campo.form.submit();
+            return;
+        }
+
+        clearTimeout(temporizador);
+        const texto = campo.value.trim();
+        if (!texto) return;
+        temporizador = setTimeout(function () {
+            fetch(`${campo.dataset.autocompletar}?q=${encodeURIComponent(texto)}`)
+                .then(r => r.ok ? r.json() : [])
+                .then(function (sugerencias) {
+                    opciones = {};
+                    lista.innerHTML = '';
+                    sugerencias.forEach(function (item) {
+                        const texto = etiqueta(item);
+                        opciones[texto] = item[campo.dataset.id];
+                        const opcion = document.createElement('option');
+                        opcion.value = texto;
+                        lista.appendChild(opcion);
+                    });
+                });
+        }, 200);
+    });
+
+    // Sin ID elegido no se envía el formulario
+    if (campo.required) {
+        campo.form.addEventListener('submit', function (e) {
+            if (!destino.value) {
+                e.preventDefault();
+                campo.setCustomValidity('Selecciona una opción de la lista');
+                campo.reportValidity();
+            }
+        });
+    }
+});
@@ -0,0 +1,106 @@
+// Cambios en vivo de valoraciones (SSE, ver routers/eventos.py).
+// Parchea la página abierta en lugar de recargarla:
+//  - valoraciones.html: promedios, totales y comentarios de cada título
+//  - index.html: tarjetas del top 5
+(function () {
+    if (!window.EventSource) return;
+
+    const fuente = new EventSource("/eventos/valoraciones");
+    let huboError = false;
+
+    function mostrarAviso() {
+        const aviso = document.getElementById("aviso-en-vivo");
+        if (aviso) aviso.style.display = "block";
+    }
+
+    function pintarEstrellas(contenedor, puntuacion) {
+        const llenas = Math.floor(puntuacion);
+        contenedor.querySelectorAll("i.fa-star").forEach((estrella, i) => {
+            estrella.style.color = i < llenas ? "#ffc107" : "#444";
+        });
+    }
+
+    function rellenarComentario(tarjeta, v) {
+        tarjeta.dataset.valoracion = v.id_valoracion;
+        const img = tarjeta.querySelector(".user-comment-img");
+        img.src = v.usuario_img || "/static/img/user-placeholder.png";
+        img.alt = v.usuario_nombre;
+        tarjeta.querySelector(".comment-user-name").textContent = v.usuario_nombre;
+        tarjeta.querySelector("[data-puntuacion]").textContent = v.puntuacion;
+        pintarEstrellas(tarjeta.querySelector("[data-estrellas]"), v.puntuacion);
+        tarjeta.querySelector(".comment-body").textContent = v.comentario;
+        tarjeta.querySelector(".comment-date").textContent = "Fecha: " + v.fecha;
+        const editar = tarjeta.querySelector("[data-editar]");
+        if (editar) editar.href = "/web/valoraciones/editar/" + v.id_valoracion;
+        const eliminar = tarjeta.querySelector("[data-eliminar]");
+        if (eliminar) eliminar.action = "/web/valoraciones/eliminar/" + v.id_valoracion;
+    }
+
+    // --- valoraciones.html ---
+    fuente.addEventListener("valoracion", (evento) => {
+        const plantilla = document.getElementById("plantilla-comentario");
+        if (!plantilla) return;
+        const { valoracion, titulo } = JSON.parse(evento.data);
+
+        document.querySelectorAll(`[data-titulo="${titulo.id_titulo}"]`).forEach((elemento) => {
+            elemento.querySelectorAll("[data-promedio]").forEach((e) => e.textContent = titulo.promedio_puntuacion);
+            elemento.querySelectorAll("[data-total]").forEach((e) => e.textContent = titulo.total_valoraciones);
+            // Las estrellas del promedio, no las de cada comentario
+            elemento.querySelectorAll("[data-estrellas]").forEach((e) => {
+                if (!e.closest(".comment-card")) pintarEstrellas(e, titulo.promedio_puntuacion);
+            });
+        });
+
+        const tarjetaTitulo = document.querySelector(`.movie-card[data-titulo="${titulo.id_titulo}"]`);
+        if (tarjetaTitulo) {
+            tarjetaTitulo.style.display = titulo.total_valoraciones > 0 ? "" : "none";
+        } else if (titulo.total_valoraciones > 0) {
+            // Primer comentario de un título que no está en la página
+            mostrarAviso();
+            return;
+        }
+
+        const existente = document.querySelector(`.comment-card[data-valoracion="${valoracion.id_valoracion}"]`);
+        if (!valoracion.is_active) {
+            if (existente) existente.remove();
+        } else if (existente) {
+            rellenarComentario(existente, valoracion);
+        } else {
+            const contenedor = document.getElementById(`comments-container-${titulo.id_titulo}`);
+            if (contenedor) {
+                const nueva = plantilla.content.firstElementChild.cloneNode(true);
+                rellenarComentario(nueva, valoracion);
+                contenedor.appendChild(nueva);
+            }
+        }
+    });
+
+    // --- index.html ---
+    fuente.addEventListener("top", (evento) => {
+        const grilla = document.getElementById("top-titulos");
+        const plantilla = document.getElementById("plantilla-top");
+        if (!grilla || !plantilla) return;
+        const top = JSON.parse(evento.data);
+        const vacio = document.getElementById("top-vacio");
+
+        grilla.querySelectorAll(".movie-card").forEach((tarjeta) => tarjeta.remove());
+        if (vacio) vacio.style.display = top.length ? "none" : "";
+        top.forEach((titulo) => {
+            const tarjeta = plantilla.content.firstElementChild.cloneNode(true);
+            const img = tarjeta.querySelector("img");
+            img.src = titulo.img_url;
+            img.alt = titulo.titulo;
+            const nombre = tarjeta.querySelector("h3");
+            nombre.textContent = titulo.titulo;
+            nombre.title = titulo.titulo;
+            tarjeta.querySelector("[data-promedio]").textContent = titulo.promedio_puntuacion;
+            pintarEstrellas(tarjeta.querySelector("[data-estrellas]"), titulo.promedio_puntuacion);
+            grilla.appendChild(tarjeta);
+        });
+    });
+
+    // Cambios masivos (cascadas, lotes) o reconexión tras perder eventos: se ofrece recargar
+    fuente.addEventListener("recargar", mostrarAviso);
+    fuente.addEventListener("error", () => { huboError = true; });
+    fuente.addEventListener("open", () => { if (huboError) mostrarAviso(); });
+})();
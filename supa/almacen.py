@@ -0,0 +1,129 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import UploadFile
+from sqlalchemy import delete, update, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+from data.models import Imagen, Usuario, PeliculaSerie, UsuarioArchivo, PeliculaSerieArchivo
+from supa.supabase import get_supabase_client, SUPABASE_BUCKET
+from utils.db import engine
+
+load_dotenv()
+
+# Tamaño de los trozos al leer la subida (se calcula el hash mientras se copia a disco)
+IMAGENES_TROZO = 1024 * 1024
+# Una imagen sin referencias se conserva este tiempo antes de borrarla del bucket
+IMAGENES_GRACIA_HORAS = int(os.getenv("IMAGENES_GRACIA_HORAS", "24"))
+IMAGENES_LOTE = int(os.getenv("IMAGENES_LOTE", "100"))
+
+# Columnas que pueden apuntar a una imagen del bucket
+COLUMNAS_IMG = (Usuario.img, PeliculaSerie.img, UsuarioArchivo.img, PeliculaSerieArchivo.img)
+
+
+def _extension(file: UploadFile) -> str:
+    sufijo = Path(file.filename or "").suffix.lower()
+    return sufijo or mimetypes.guess_extension(file.content_type or "") or ""
+
+
+def _subir(ruta: str, archivo: Path, tipo: Optional[str]) -> str:
+    bucket = get_supabase_client().storage.from_(SUPABASE_BUCKET)
+    # El contenido de una ruta no cambia nunca: se puede cachear indefinidamente
+    bucket.upload(path=ruta, file=archivo, file_options={
+        "content-type": tipo or "application/octet-stream",
+        "cache-control": "31536000",
+        "upsert": "true",
+    })
+    return bucket.get_public_url(ruta)
+
+
+def _registrar(imagen: Imagen) -> str:
+    with Session(engine) as session:
+        session.add(imagen)
+        try:
+            session.commit()
+        except IntegrityError:
+            # Otro worker subió el mismo contenido a la vez
+            session.rollback()
+            return session.get(Imagen, imagen.hash).url
+        return imagen.url
+
+
+async def guardar_imagen(file: UploadFile) -> Optional[str]:
+    """Sube `file` al bucket en img/<hash>.<ext> y devuelve su URL pública (None si está vacío).
+
+    Si ese contenido ya se subió antes no se vuelve a transferir: se devuelve la URL registrada.
+    """
+    hash_contenido = hashlib.sha256()
+    tamano = 0
+    with tempfile.NamedTemporaryFile(delete=False) as temporal:
+        while trozo := await file.read(IMAGENES_TROZO):
+            hash_contenido.update(trozo)
+            temporal.write(trozo)
+            tamano += len(trozo)
+    try:
+        if not tamano:
+            return None
+        huella = hash_contenido.hexdigest()
+
+        with Session(engine) as session:
+            # Renovar ultimo_uso aplaza la recolección mientras se guarda la fila que la usará
+            existente = session.exec(update(Imagen).where(Imagen.hash == huella).values(ultimo_uso=datetime.now())
+                                     .returning(Imagen.url)).first()
+            session.commit()
+        if existente:
+            return existente[0]
+
+        ruta = f"img/{huella[:2]}/{huella}{_extension(file)}"
+        url = await run_in_threadpool(_subir, ruta, Path(temporal.name), file.content_type)
+        return _registrar(Imagen(hash=huella, ruta=ruta, url=url, tipo=file.content_type, tamano=tamano,
+                                 ultimo_uso=datetime.now()))
+    finally:
+        os.unlink(temporal.name)
+
+
+def cambiar_referencia(session: Session, anterior: Optional[str], nueva: Optional[str]):
+    """Ajusta los contadores cuando una fila cambia de imagen (en la transacción del cambio).
+
+    Las URLs que no son del almacén (imágenes por defecto, subidas antiguas) no se cuentan.
+    """
+    if anterior == nueva:
+        return
+    ahora = datetime.now()
+    if nueva:
+        session.exec(update(Imagen).where(Imagen.url == nueva)
+                     .values(referencias=Imagen.referencias + 1, ultimo_uso=ahora))
+    if anterior:
+        session.exec(update(Imagen).where(Imagen.url == anterior)
+                     .values(referencias=Imagen.referencias - 1, ultimo_uso=ahora))
+
+
+def recolectar_huerfanas(session: Session, gracia_horas: int = IMAGENES_GRACIA_HORAS,
+                         lote: int = IMAGENES_LOTE) -> int:
+    """Borra del bucket y del índice las imágenes sin referencias desde hace `gracia_horas`.
+
+    El contador se contrasta con las columnas img (incluido el archivo), así que un
+    contador desajustado nunca borra una imagen en uso.
+    """
+    limite = datetime.now() - timedelta(hours=gracia_horas)
+    en_uso = union_all(*(select(columna).where(columna.is_not(None)) for columna in COLUMNAS_IMG))
+    condiciones = [Imagen.referencias <= 0, Imagen.ultimo_uso < limite, Imagen.url.not_in(en_uso)]
+
+    borradas = 0
+    while True:
+        hashes = session.exec(select(Imagen.hash).where(*condiciones).limit(lote)).all()
+        if not hashes:
+            return borradas
+        # Se repiten las condiciones: una subida pudo reutilizar la imagen desde la consulta anterior
+        rutas = session.exec(delete(Imagen).where(Imagen.hash.in_(hashes), *condiciones)
+                             .returning(Imagen.ruta)).scalars().all()
+        session.commit()
+        if rutas:
+            get_supabase_client().storage.from_(SUPABASE_BUCKET).remove(rutas)
+            borradas += len(rutas)
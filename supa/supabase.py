@@ -1,16 +1,17 @@
 import os
-from typing import Optional
-from fastapi import UploadFile
-from supabase import create_client, Client
+from typing import Optional, TYPE_CHECKING
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 load_dotenv()
 
 SUPABASE_URL=os.getenv("SUPABASE_URL_MOV")
 SUPABASE_KEY=os.getenv("SUPABASE_KEY_MOV")
 SUPABASE_BUCKET=os.getenv("SUPABASE_BUCKET_MOV")
 
-_supabase_client:Optional[Client]=None
+_supabase_client:Optional["Client"]=None
 
 def get_supabase_client():
     global _supabase_client
@@ -19,26 +20,8 @@ def get_supabase_client():
             raise ValueError(
                 "No estan las credenciales"
             )
+        # El SDK se importa solo cuando un worker sube su primera imagen
+        from supabase import create_client
         _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
     return _supabase_client
-
-async def upload_to_bucket(file: UploadFile):
-    client = get_supabase_client()
-
-    try:
-        file_content = await file.read()
-        file_path= f"public/{file.filename}"
-        result = client.storage.from_(SUPABASE_BUCKET).upload(
-            path=file_path,
-            file=file_content,
-            file_options={
-                "content-type": file.content_type
-            }
-        )
-        public_url = client.storage.from_(
-            SUPABASE_BUCKET
-        ).get_public_url(file_path)
-        return public_url
-    except Exception as e:
-        raise e
\ No newline at end of file
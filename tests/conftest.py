@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Antes de importar la aplicación: utils.db crea el engine al importarse y load_dotenv no pisa lo ya definido
+_TEMPORAL = tempfile.mkdtemp(prefix="cinehub-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TEMPORAL}/cine.db"
+os.environ["POSTERS_DIR"] = f"{_TEMPORAL}/posters"
+os.environ["REPLICA_URLS"] = ""
+os.environ["JWT_CLAVES"] = "pruebas:clave-de-las-pruebas-con-al-menos-32-bytes"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import itertools
+import pytest
+
+CLAVE = "secreta123"
+_numeros = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def base():
+    """Base SQLite migrada desde cero, compartida por todas las pruebas (cada una crea sus propias filas)."""
+    from utils import esquema
+    from utils.db import engine
+    esquema.migrar(engine)
+    return engine
+
+
+@pytest.fixture
+def crear(base):
+    """Crea usuarios y títulos nuevos, con nombres que no chocan entre pruebas."""
+    from sqlmodel import Session
+    from data.models import Usuario, PeliculaSerie
+    from utils.security import get_password_hash
+
+    class Crear:
+        def usuario(self):
+            n = next(_numeros)
+            with Session(base) as session:
+                usuario = Usuario(nombre=f"Usuario {n}", correo=f"u{n}@prueba.com", clave=get_password_hash(CLAVE))
+                session.add(usuario)
+                session.commit()
+                return usuario.id_usuario, usuario.correo
+
+        def titulo(self):
+            n = next(_numeros)
+            with Session(base) as session:
+                titulo = PeliculaSerie(titulo=f"Título {n}", anio_estreno=2000, duracion=100, descripcion="-", img="",
+                                       genero="Drama")
+                session.add(titulo)
+                session.commit()
+                return titulo.id_titulo
+
+    return Crear()
+
+
+@pytest.fixture
+def cliente(base, crear):
+    """TestClient con la sesión web iniciada (sin el arranque: no hace falta calentar nada)."""
+    from fastapi.testclient import TestClient
+    from main import app
+    cliente = TestClient(app)
+    id_usuario, correo = crear.usuario()
+    respuesta = cliente.post("/web/login", data={"correo": correo, "clave": CLAVE, "siguiente": "/"}, follow_redirects=False)
+    assert respuesta.status_code == 303
+    token = cliente.post("/auth/login", json={"correo": correo, "clave": CLAVE}).json()["access_token"]
+    cliente.headers["Authorization"] = f"Bearer {token}"
+    cliente.id_usuario = id_usuario
+    return cliente
@@ -0,0 +1,25 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from utils import admision
+from utils.admision import Admision, Limite
+
+
+def test_rechazo_en_html_para_navegadores(monkeypatch):
+    monkeypatch.setitem(admision.limites_admision, "total", Limite("total", 0, 0))
+    app = FastAPI()
+
+    @app.get("/web/titulos")
+    def titulos():
+        return {"ok": True}
+
+    cliente = TestClient(Admision(app))
+
+    pagina = cliente.get("/web/titulos", headers={"Accept": "text/html,application/xhtml+xml,*/*;q=0.8"})
+    assert pagina.status_code == 503
+    assert pagina.headers["content-type"].startswith("text/html")
+    assert pagina.headers["retry-after"] == admision.ADMISION_RETRY_AFTER
+    assert "Servidor saturado" in pagina.text
+
+    api = cliente.get("/web/titulos", headers={"Accept": "application/json"})
+    assert (api.status_code, api.json()["limite"]) == (503, "total")
+    assert api.headers["retry-after"] == admision.ADMISION_RETRY_AFTER
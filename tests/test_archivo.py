@@ -0,0 +1,71 @@
+from datetime import date
+from sqlmodel import Session, select
+from data.models import Usuario, UsuarioArchivo, Valoracion, ValoracionArchivo, Rutina
+from utils import agenda, archivo, lotes, valoraciones
+from utils.security import get_password_hash
+
+
+def test_restaurar_desde_el_archivo_no_choca_con_filas_nuevas(base, crear):
+    id_usuario, correo = crear.usuario()
+    id_titulo = crear.titulo()
+    with Session(base) as session:
+        id_valoracion = valoraciones.crear_valoracion(session, id_usuario, id_titulo, 4.0, "-", date.today())
+        lotes.eliminar_lote(session, Usuario, [id_usuario], cascada=True)
+        archivo.archivar_eliminados(session, dias=0)
+        assert session.get(UsuarioArchivo, id_usuario) and session.get(ValoracionArchivo, id_valoracion)
+
+        # Otro usuario ocupa ahora su correo; con AUTOINCREMENT no recibe su id
+        nuevo = Usuario(nombre="Nuevo", correo=correo, clave=get_password_hash("secreta123"))
+        session.add(nuevo)
+        session.commit()
+        assert nuevo.id_usuario > id_usuario
+
+        afectados = lotes.restaurar_lote(session, Valoracion, [id_valoracion])
+
+        assert afectados["conflictos"] == {"usuario": [id_usuario], "valoracion": [id_valoracion]}
+        assert afectados["valoracion"] == 0
+        assert session.get(ValoracionArchivo, id_valoracion) is not None
+        assert session.exec(select(Usuario.id_usuario).where(Usuario.correo == correo)).all() == [nuevo.id_usuario]
+
+
+def test_restaurar_sin_conflictos_devuelve_usuario_y_valoracion(base, crear):
+    id_usuario, _ = crear.usuario()
+    id_titulo = crear.titulo()
+    with Session(base) as session:
+        id_valoracion = valoraciones.crear_valoracion(session, id_usuario, id_titulo, 4.0, "-", date.today())
+        lotes.eliminar_lote(session, Usuario, [id_usuario], cascada=True)
+        archivo.archivar_eliminados(session, dias=0)
+
+        afectados = lotes.restaurar_lote(session, Usuario, [id_usuario], cascada=True)
+
+        assert "conflictos" not in afectados
+        assert (afectados["usuario"], afectados["valoracion"]) == (1, 1)
+        assert session.get(Valoracion, id_valoracion).is_active
+
+
+def test_restaurar_no_pasa_del_maximo_diario_de_rutinas(base, crear, monkeypatch):
+    monkeypatch.setattr(agenda, "RUTINA_MAX_MINUTOS_DIA", 100.0)
+    id_usuario, _ = crear.usuario()
+    id_titulo = crear.titulo()
+    with Session(base) as session:
+        # Dos rutinas de 100 minutos el mismo día: solo cabe una
+        rutinas = [Rutina(nombre=f"Rutina {i}", fecha_inicio=date.today(), fecha_fin=date.today(),
+                          id_usuario_FK=id_usuario, id_titulo_FK=id_titulo) for i in range(2)]
+        session.add_all(rutinas)
+        session.commit()
+        primera, segunda = (r.id_rutina for r in rutinas)
+        lotes.eliminar_lote(session, Usuario, [id_usuario], cascada=True)
+
+        afectados = lotes.restaurar_lote(session, Usuario, [id_usuario], cascada=True)
+        assert (afectados["rutina"], afectados["excesos"]) == (1, {"rutina": [segunda]})
+        assert session.get(Rutina, primera).is_active and not session.get(Rutina, segunda).is_active
+
+        afectados = lotes.restaurar_lote(session, Rutina, [segunda])
+        assert (afectados["rutina"], afectados["excesos"]) == (0, {"rutina": [segunda]})
+
+
+def test_papelera_con_pagina_cero_o_negativa_muestra_la_primera(base):
+    with Session(base) as session:
+        primera = archivo.pagina_papelera(session, Usuario, ["id_usuario", "nombre"], 1)
+        assert archivo.pagina_papelera(session, Usuario, ["id_usuario", "nombre"], 0) == primera
+        assert archivo.pagina_papelera(session, Usuario, ["id_usuario", "nombre"], -3) == primera
@@ -0,0 +1,57 @@
+import json
+import uuid
+from sqlmodel import Session
+from data.models import Genero
+from utils import bus
+from utils.cache import cache
+
+
+def test_el_lector_vacia_la_cache_si_el_archivo_rota_aunque_vuelva_a_crecer(tmp_path, monkeypatch):
+    ruta = tmp_path / "bus.jsonl"
+    lector, escritor = bus.BusArchivo(str(ruta)), bus.BusArchivo(str(ruta))
+    evento = json.dumps({"origen": "otro", "etiquetas": ["x"]})
+    escritor.publicar(evento)
+    lector.leer()
+    vaciados = bus.metricas.vaciados
+
+    # Tras rotar se escribe más de lo que el lector ya había leído: con truncar no lo notaría
+    monkeypatch.setattr(bus, "BUS_ARCHIVO_BYTES", 0)
+    escritor.publicar(evento)
+    monkeypatch.setattr(bus, "BUS_ARCHIVO_BYTES", 1024 * 1024)
+    for _ in range(5):
+        escritor.publicar(evento)
+    monkeypatch.setattr(cache, "limpiar", lambda: setattr(bus.metricas, "vaciados", bus.metricas.vaciados + 100))
+    lector.leer()
+
+    assert bus.metricas.vaciados == vaciados + 101
+    assert lector._posicion == ruta.stat().st_size == 6 * (len(evento) + 1)
+
+
+class Transaccional:
+    nombre = "prueba"
+    transaccional = True
+
+    def __init__(self):
+        self.mensajes = []
+
+    def publicar(self, mensaje, conexion=None):
+        self.mensajes.append((json.loads(mensaje)["etiquetas"], conexion is not None))
+
+
+def test_con_transporte_transaccional_se_publica_antes_de_confirmar(base, monkeypatch):
+    transporte = Transaccional()
+    monkeypatch.setattr(bus, "_transporte", transporte)
+
+    with Session(base) as session:
+        session.add(Genero(nombre="Prueba del bus", clave=uuid.uuid4().hex))
+        session.rollback()
+    assert transporte.mensajes == []
+
+    with Session(base) as session:
+        genero = Genero(nombre="Prueba del bus", clave=uuid.uuid4().hex)
+        session.add(genero)
+        session.commit()
+        id_genero = genero.id_genero
+    # Una sola vez, dentro de la transacción (con su conexión) e incluyendo lo del último flush
+    [(etiquetas, en_transaccion)] = transporte.mensajes
+    assert en_transaccion and f"genero:{id_genero}" in etiquetas
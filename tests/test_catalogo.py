@@ -0,0 +1,42 @@
+import pytest
+from utils import catalogo as modulo
+from utils.catalogo import Catalogo
+
+
+def test_una_recarga_fallida_se_reintenta(base, crear, monkeypatch):
+    crear.titulo()
+    catalogo = Catalogo()
+    filas = modulo._filas
+
+    def caida(*args, **kwargs):
+        raise RuntimeError("base de datos caída")
+
+    monkeypatch.setattr(modulo, "_filas", caida)
+    with pytest.raises(RuntimeError):
+        catalogo.instantanea()
+    assert catalogo._recargar
+
+    monkeypatch.setattr(modulo, "_filas", filas)
+    assert len(catalogo.instantanea().ids) > 0
+    assert (catalogo._recargar, catalogo.recargas) == (False, 1)
+
+
+def test_una_recarga_parcial_fallida_conserva_los_pendientes(base, crear, monkeypatch):
+    id_titulo = crear.titulo()
+    catalogo = Catalogo()
+    catalogo.instantanea()
+    catalogo.al_invalidar({f"peliculaserie:{id_titulo}"})
+    monkeypatch.setattr(modulo, "_pares", lambda *args: 1 / 0)
+
+    with pytest.raises(ZeroDivisionError):
+        catalogo.instantanea()
+    assert catalogo._pendientes == {id_titulo}
+
+
+@pytest.mark.parametrize("pagina", [0, -2])
+def test_paginas_fuera_de_rango_dan_la_primera(base, crear, pagina):
+    crear.titulo()
+    catalogo = Catalogo()
+    primera = catalogo.explorar(pagina=1, por_pagina=2)["ids"]
+    assert catalogo.explorar(pagina=pagina, por_pagina=2)["ids"] == primera
+    assert catalogo.explorar(pagina=1, por_pagina=0)["ids"] == primera[:1]
@@ -0,0 +1,70 @@
+import gzip
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+from utils import compresion
+from utils.compresion import Compresion, Estaticos
+from utils.respuestas import sin_cambios
+
+ETAG = '"abc123"'
+CUERPO = b"x" * 200_000
+
+
+def crear_app():
+    app = FastAPI()
+
+    @app.get("/grande")
+    def grande(request: Request):
+        if sin_cambios(request, ETAG):
+            return Response(status_code=304, headers={"ETag": ETAG})
+        return Response(CUERPO, media_type="text/plain", headers={"ETag": ETAG})
+
+    return TestClient(Compresion(app))
+
+
+def test_la_variante_comprimida_lleva_etag_debil(monkeypatch):
+    hilos = []
+    original = compresion.anyio.to_thread.run_sync
+    monkeypatch.setattr(compresion.anyio.to_thread, "run_sync",
+                        lambda funcion, *args: hilos.append(funcion) or original(funcion, *args))
+    cliente = crear_app()
+
+    respuesta = cliente.get("/grande", headers={"Accept-Encoding": "gzip"})
+    assert respuesta.headers["content-encoding"] == "gzip"
+    assert respuesta.headers["etag"] == "W/" + ETAG
+    assert respuesta.content == CUERPO  # httpx ya descomprime
+    assert compresion._COMPRESORES["gzip"] in hilos
+
+    revalidada = cliente.get("/grande", headers={"Accept-Encoding": "gzip", "If-None-Match": "W/" + ETAG})
+    assert (revalidada.status_code, revalidada.headers["etag"]) == (304, "W/" + ETAG)
+
+    # Sin compresión el ETag fuerte se conserva
+    assert cliente.get("/grande", headers={"Accept-Encoding": "identity"}).headers["etag"] == ETAG
+
+
+def test_vary_aunque_no_se_comprima():
+    app = FastAPI()
+
+    @app.get("/corto")
+    def corto():
+        return {"ok": True}
+
+    cliente = TestClient(Compresion(app))
+    assert "Accept-Encoding" in cliente.get("/corto", headers={"Accept-Encoding": "gzip"}).headers["vary"]
+    assert "Accept-Encoding" in crear_app().get("/grande", headers={"Accept-Encoding": ""}).headers["vary"]
+
+
+def test_estaticos_precomprimidos_responden_304(tmp_path):
+    (tmp_path / "dist").mkdir()
+    (tmp_path / "dist" / "app.abc.js").write_text("console.log(1)")
+    (tmp_path / "dist" / "app.abc.js.gz").write_bytes(gzip.compress(b"console.log(1)"))
+    app = FastAPI()
+    app.mount("/static", Estaticos(directory=tmp_path), name="static")
+    cliente = TestClient(app)
+
+    respuesta = cliente.get("/static/dist/app.abc.js", headers={"Accept-Encoding": "gzip"})
+    assert respuesta.headers["content-encoding"] == "gzip"
+    revalidada = cliente.get("/static/dist/app.abc.js",
+                             headers={"Accept-Encoding": "gzip", "If-None-Match": respuesta.headers["etag"]})
+    assert revalidada.status_code == 304
+    assert revalidada.headers["vary"] == "Accept-Encoding"
+    assert revalidada.headers["cache-control"] == compresion.CACHE_INMUTABLE
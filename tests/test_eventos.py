@@ -0,0 +1,48 @@
+from datetime import date
+import pytest
+from sqlmodel import Session
+from utils import eventos, valoraciones
+
+
+@pytest.fixture
+def enviadas(monkeypatch):
+    tramas = []
+    monkeypatch.setattr(eventos.difusor, "difundir", tramas.append)
+    return tramas
+
+
+def test_sin_paginas_abiertas_no_se_consulta_nada(base, enviadas, monkeypatch):
+    monkeypatch.setattr(eventos.consultas, "top_titulos", lambda *args: pytest.fail("no debía consultar el top"))
+    monkeypatch.setattr(eventos, "_pendientes", eventos.queue.Queue())
+
+    eventos._al_invalidar({"valoracion", "valoracion:1"})
+    eventos._procesar({"valoracion", "valoracion:1"})
+
+    assert eventos._pendientes.empty()
+    assert enviadas == []
+
+
+def test_con_paginas_abiertas_se_envian_la_valoracion_y_el_top(base, crear, enviadas, monkeypatch):
+    monkeypatch.setattr(eventos.difusor, "_suscriptores", {object()})
+    id_usuario, _ = crear.usuario()
+    id_titulo = crear.titulo()
+    with Session(base) as session:
+        id_valoracion = valoraciones.crear_valoracion(session, id_usuario, id_titulo, 4.0, "-", date.today())
+
+    eventos._procesar({"valoracion", f"valoracion:{id_valoracion}"})
+
+    assert [t.split(b"\n")[0] for t in enviadas] == [b"event: valoracion", b"event: top"]
+    assert f'"id_valoracion":{id_valoracion}'.encode() in enviadas[0]
+
+
+def test_cache_vaciada_pide_recargar(base, enviadas, monkeypatch):
+    monkeypatch.setattr(eventos.difusor, "_suscriptores", {object()})
+    eventos._procesar(None)
+    assert enviadas == [eventos.trama("recargar", {})]
+
+
+def test_el_flujo_en_vivo_pide_sesion(base):
+    from fastapi.testclient import TestClient
+    from main import app
+    respuesta = TestClient(app).get("/eventos/valoraciones", follow_redirects=False)
+    assert (respuesta.status_code, respuesta.headers["location"]) == (303, "/web/login?siguiente=%2Feventos%2Fvaloraciones")
@@ -0,0 +1,51 @@
+import time
+from datetime import date
+from utils.ical import _texto
+
+
+def test_escapa_todos_los_saltos_de_linea():
+    assert _texto("a\rb\r\nc\nd;e,f\\") == "a\\nb\\nc\\nd\\;e\\,f\\\\"
+
+
+def test_rutinas_ics_revalida_con_listas_y_etags_debiles(cliente):
+    ruta = cliente.get(f"/web/usuarios/{cliente.id_usuario}/calendario").json()["url"]
+    etag = cliente.get(ruta).headers["etag"]
+
+    assert cliente.get(ruta, headers={"If-None-Match": f'"otro", W/{etag}'}).status_code == 304
+    # Un ETag que solo contiene al actual como subcadena no es el mismo
+    assert cliente.get(ruta, headers={"If-None-Match": f'"x{etag[1:]}'}).status_code == 200
+
+
+def test_rutinas_ics_exige_el_token_vigente(cliente, crear):
+    otro, _ = crear.usuario()
+    base = f"/web/usuarios/{cliente.id_usuario}/rutinas.ics"
+    anterior = cliente.get(f"/web/usuarios/{cliente.id_usuario}/calendario").json()["url"]
+    assert cliente.get(base).status_code == 404
+    assert cliente.get(f"/web/usuarios/{otro}/calendario").status_code == 403
+    assert cliente.get(f"/web/usuarios/{otro}/habitos").status_code == 403
+
+    nueva = cliente.post(f"/web/usuarios/{cliente.id_usuario}/calendario/renovar").json()["url"]
+    assert nueva != anterior
+    assert (cliente.get(anterior).status_code, cliente.get(nueva).status_code) == (404, 200)
+
+
+def test_editar_una_rutina_cambia_dtstamp_y_sequence(cliente, crear):
+    id_titulo = crear.titulo()
+    hoy = date.today().isoformat()
+    rutina = cliente.post("/rutinas/", json={"nombre": "Antes", "fecha_inicio": hoy, "fecha_fin": hoy,
+                                             "id_usuario_FK": cliente.id_usuario, "id_titulo_FK": id_titulo}).json()
+    url = cliente.get(f"/web/usuarios/{cliente.id_usuario}/calendario").json()["url"]
+
+    def evento():
+        texto = cliente.get(url).text
+        inicio = texto.index(f"UID:rutina-{rutina['id_rutina']}@cinehub")
+        lineas = texto[inicio:texto.index("END:VEVENT", inicio)].split("\r\n")
+        return {clave: valor for clave, _, valor in (linea.partition(":") for linea in lineas)}
+
+    antes = evento()
+    time.sleep(1)
+    cliente.put(f"/rutinas/{rutina['id_rutina']}", json={**rutina, "nombre": "Después"})
+    despues = evento()
+
+    assert (antes["SEQUENCE"], despues["SEQUENCE"]) == ("0", "1")
+    assert despues["DTSTAMP"] > antes["DTSTAMP"] and despues["LAST-MODIFIED"] == despues["DTSTAMP"]
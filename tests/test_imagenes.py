@@ -0,0 +1,31 @@
+import uuid
+from datetime import datetime
+from sqlmodel import Session
+from data.models import Imagen
+
+
+def referencias(base, huella):
+    with Session(base) as session:
+        return session.get(Imagen, huella).referencias
+
+
+def test_la_api_de_titulos_cuenta_las_referencias(base, cliente):
+    huella = uuid.uuid4().hex
+    url = f"https://almacen/img/{huella}.png"
+    with Session(base) as session:
+        session.add(Imagen(hash=huella, ruta=f"img/{huella}.png", url=url, tamano=1, ultimo_uso=datetime.now()))
+        session.commit()
+
+    datos = {"titulo": f"Con imagen {huella}", "genero": "Drama", "anio_estreno": 2020, "duracion": 90,
+             "descripcion": "-", "img": url}
+    respuesta = cliente.post("/titulos/", json=datos)
+    assert respuesta.status_code == 200
+    id_titulo = respuesta.json()["id_titulo"]
+    assert referencias(base, huella) == 1
+
+    # Sin img en el cuerpo se conserva la imagen; con img: null se suelta
+    del datos["img"]
+    assert cliente.put(f"/titulos/{id_titulo}", json=datos).json()["img"] == url
+    assert referencias(base, huella) == 1
+    assert cliente.put(f"/titulos/{id_titulo}", json={**datos, "img": None}).json()["img"] is None
+    assert referencias(base, huella) == 0
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+from starlette.requests import Request
+from utils.posters import CachePosters, OrigenNoPermitido
+from utils.respuestas import sin_cambios
+
+TAMANO = 1000
+RUTA = "/storage/v1/object/public/bucket/"
+
+
+class Bucket(BaseHTTPRequestHandler):
+    """Sustituto local del bucket: imágenes de TAMANO bytes y una redirección fuera de él."""
+    pedidas = []
+
+    def do_GET(self):
+        Bucket.pedidas.append(self.path)
+        if self.path.endswith("/redirige.png"):
+            self.send_response(302)
+            self.send_header("Location", "http://127.0.0.1:1/interna")
+            self.end_headers()
+            return
+        cuerpo = self.path.encode().ljust(TAMANO, b"\0")
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def origen():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Bucket)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}{RUTA}"
+    servidor.shutdown()
+
+
+@pytest.fixture
+def cache(tmp_path, origen):
+    Bucket.pedidas.clear()
+    return CachePosters(str(tmp_path), max_bytes=int(TAMANO * 2.5), max_imagen=TAMANO * 2, origen=origen)
+
+
+def obtener(cache, url):
+    async def pedir():
+        try:
+            return await cache.obtener(url)
+        finally:
+            if cache._cliente:
+                await cache._cliente.aclose()
+                cache._cliente = None
+    return asyncio.run(pedir())
+
+
+def test_la_segunda_peticion_sale_del_disco(cache, origen):
+    primero = obtener(cache, origen + "a.png")
+    segundo = obtener(cache, origen + "a.png")
+
+    assert segundo == primero
+    assert primero.tipo == "image/png"
+    assert primero.ruta.read_bytes().startswith(f"{RUTA}a.png".encode())
+    assert Bucket.pedidas == [f"{RUTA}a.png"]
+    assert (cache.fallos, cache.aciertos) == (1, 1)
+
+
+def test_desaloja_la_menos_usada_al_pasar_el_limite(cache, origen):
+    a = obtener(cache, origen + "a.png")
+    obtener(cache, origen + "b.png")
+    obtener(cache, origen + "a.png")  # b pasa a ser la menos usada
+    b = cache._entradas[next(iter(cache._entradas))]
+    obtener(cache, origen + "c.png")
+
+    assert cache.desalojados == 1
+    assert not b.ruta.exists()
+    assert a.ruta.exists()
+    assert cache.metricas()["bytes"] == 2 * TAMANO
+
+
+def test_una_imagen_abierta_se_lee_entera_aunque_se_desaloje(cache, origen):
+    async def pedir():
+        try:
+            poster, archivo = await cache.abrir(origen + "a.png")
+            await cache.obtener(origen + "b.png")
+            await cache.obtener(origen + "c.png")  # desaloja a.png
+            with archivo:
+                return poster, archivo.read()
+        finally:
+            await cache._cliente.aclose()
+            cache._cliente = None
+
+    poster, contenido = asyncio.run(pedir())
+    assert cache.desalojados == 1 and not poster.ruta.exists()
+    assert contenido == f"{RUTA}a.png".encode().ljust(TAMANO, b"\0")
+
+
+@pytest.mark.parametrize("url", [
+    "http://169.254.169.254/latest/meta-data/",
+    "http://localhost:{puerto}/storage/v1/object/public/bucket/a.png",
+    "http://127.0.0.1:1/storage/v1/object/public/bucket/a.png",
+    "https://127.0.0.1:{puerto}/storage/v1/object/public/bucket/a.png",
+    "http://127.0.0.1:{puerto}/storage/v1/object/public/otro/a.png",
+    "http://127.0.0.1:{puerto}/storage/v1/object/public/bucket/../otro/a.png",
+    "http://usuario@127.0.0.1:{puerto}/storage/v1/object/public/bucket/a.png",
+    "file:///etc/passwd",
+])
+def test_rechaza_urls_fuera_del_bucket(cache, origen, url):
+    url = url.format(puerto=httpx.URL(origen).port)
+    with pytest.raises(OrigenNoPermitido):
+        obtener(cache, url)
+    assert Bucket.pedidas == []
+    assert cache.fallos == 0
+
+
+def test_no_sigue_redirecciones(cache, origen):
+    with pytest.raises(httpx.HTTPStatusError):
+        obtener(cache, origen + "redirige.png")
+    assert Bucket.pedidas == [f"{RUTA}redirige.png"]
+    assert cache.errores == 1
+
+
+def test_sin_origen_no_descarga_nada(tmp_path):
+    cache = CachePosters(str(tmp_path), TAMANO, TAMANO, origen="")
+    assert not cache.permitida("https://proyecto.supabase.co/storage/v1/object/public/bucket/a.png")
+
+
+@pytest.mark.parametrize("cabecera, coincide", [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"otro", "abc"', True),
+    ('*', True),
+    ('"abcd"', False),
+    ('"ab"', False),
+    ('', False),
+])
+def test_if_none_match(cabecera, coincide):
+    peticion = Request({"type": "http", "headers": [(b"if-none-match", cabecera.encode())]})
+    assert sin_cambios(peticion, '"abc"') is coincide
@@ -0,0 +1,110 @@
+import time
+import pytest
+from sqlalchemy import text
+from sqlmodel import SQLModel, Session, create_engine, select
+from starlette.requests import Request
+from data.models import Genero
+from utils import db, replicas
+from utils.db import SesionEnrutada, usar_primaria
+
+
+@pytest.fixture(scope="module")
+def replica(base, tmp_path_factory):
+    """Segunda base SQLite que hace de réplica: mismo esquema, pero con un género que la primaria no tiene."""
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('replica')}/replica.db")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Genero(nombre="Solo en réplica", clave="solo en replica"))
+        session.commit()
+    yield engine
+    engine.dispose()
+
+
+def en_replica(session) -> bool:
+    return session.exec(select(Genero.id_genero).where(Genero.clave == "solo en replica")).first() is not None
+
+
+def test_lee_de_la_replica_y_tras_escribir_se_queda_en_la_primaria(base, replica):
+    escrituras = []
+    with SesionEnrutada(base, replica=replica, al_escribir=lambda: escrituras.append(1)) as session:
+        assert en_replica(session)
+        session.add(Genero(nombre="Nuevo en primaria", clave=f"nuevo {time.monotonic_ns()}"))
+        session.flush()
+        assert not en_replica(session)
+        session.commit()
+        assert not en_replica(session)
+    assert escrituras == [1]
+
+
+@pytest.mark.parametrize("sql, lee_replica", [
+    ("SELECT 1", True),
+    ("  with x as (select 1) select * from x", True),
+    ("UPDATE genero SET nombre = nombre WHERE 0", False),
+    ("DELETE FROM genero WHERE 0", False),
+])
+def test_texto_sql_de_escritura_va_a_la_primaria(base, replica, sql, lee_replica):
+    with SesionEnrutada(base, replica=replica) as session:
+        session.exec(text(sql))
+        assert en_replica(session) is lee_replica
+
+
+def test_select_for_update_va_a_la_primaria(base, replica):
+    with SesionEnrutada(base, replica=replica) as session:
+        session.exec(select(Genero.id_genero).with_for_update()).all()
+        assert not en_replica(session)
+
+
+def test_usar_primaria_antes_de_leer_para_escribir(base, replica):
+    with SesionEnrutada(base, replica=replica) as session:
+        usar_primaria(session)
+        assert not en_replica(session)
+    with Session(base) as session:
+        usar_primaria(session)  # con una sesión normal no hace nada
+
+
+def test_si_la_replica_falla_se_repite_en_la_primaria(base, tmp_path):
+    caida = create_engine(f"sqlite:///{tmp_path}/no/existe/replica.db")
+    with SesionEnrutada(base, replica=caida) as session:
+        assert session.exec(select(Genero.id_genero)).first() is not None
+        assert session.replica is None
+
+
+def test_las_replicas_se_miden_fuera_de_las_peticiones(replica):
+    lectura = replicas.Replicas([replica.url.render_as_string()], 1, 0)
+    # Sin medir todavía no se usa (y elegir no mide: no bloquea la petición)
+    assert lectura.elegir() is None
+
+    lectura.replicas[0].medir()
+    assert lectura.elegir() is lectura.replicas[0].engine
+
+    # Una medición vieja (hilo de chequeo colgado) deja de valer
+    lectura.replicas[0].medido_en -= 4 * replicas.REPLICA_CHEQUEO_SEGUNDOS
+    assert lectura.elegir() is None
+
+
+def peticion(metodo: str, cookie: str = ""):
+    cabeceras = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "method": metodo, "headers": cabeceras})
+
+
+@pytest.mark.parametrize("metodo, cookie, usa_replica", [
+    ("GET", "", True),
+    ("POST", "", False),
+    ("GET", f"{replicas.COOKIE_PRIMARIA}=1", False),
+])
+def test_get_session_elige_la_replica(base, replica, monkeypatch, metodo, cookie, usa_replica):
+    monkeypatch.setattr(db.replicas_lectura, "elegir", lambda: replica)
+    generador = db.get_session(peticion(metodo, cookie))
+    session = next(generador)
+    assert en_replica(session) is usa_replica
+    generador.close()
+
+
+def test_sqlite_en_memoria_no_recibe_opciones_de_pool():
+    assert replicas.opciones_pool("sqlite://", 5, 10) == {}
+    assert replicas.opciones_pool("sqlite:///:memory:", 5, 10) == {}
+    assert replicas.opciones_pool("sqlite:///datos.db", 5, 10) == {"pool_size": 5, "max_overflow": 10}
+    replica = replicas.Replica("sqlite:///:memory:", 5, 10)
+    with replica.engine.connect() as conexion:
+        assert conexion.execute(text("SELECT 1")).scalar() == 1
+    replica.engine.dispose()
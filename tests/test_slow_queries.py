@@ -0,0 +1,30 @@
+import json
+from sqlalchemy import create_engine, text
+from utils import slow_queries
+
+
+def registrar(monkeypatch):
+    entradas = []
+    monkeypatch.setattr(slow_queries, "SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(slow_queries, "SLOW_QUERY_EXPLAIN_RATE", 1)
+    monkeypatch.setattr(slow_queries, "_configurar_logger", lambda: None)
+    monkeypatch.setattr(slow_queries._logger, "info", lambda texto: entradas.append(json.loads(texto)))
+    engine = create_engine("sqlite://")
+    slow_queries.instalar(engine)
+    return engine, entradas
+
+
+def test_guarda_los_parametros_salvo_los_sensibles(monkeypatch):
+    engine, entradas = registrar(monkeypatch)
+    with engine.connect() as conexion:
+        conexion.execute(text("SELECT :id_usuario, :correo_1, :nombre, :otro"),
+                         {"id_usuario": 7, "correo_1": "x", "nombre": "Ana", "otro": "ana@correo.com"})
+
+    [entrada] = entradas
+    assert json.loads(entrada["params"]) == {"id_usuario": 7, "correo_1": "***", "nombre": "Ana", "otro": "***"}
+    assert entrada["plan"]
+
+
+def test_no_explica_sentencias_con_bloqueos():
+    assert slow_queries._explicar("postgresql", None, "SELECT id FROM usuario WHERE id = 1 FOR UPDATE", {}) is None
+    assert slow_queries._explicar("postgresql", None, "select 1 for no key update", {}) is None
@@ -0,0 +1,103 @@
+from datetime import date
+import pytest
+from sqlmodel import Session
+from data.models import Valoracion
+from utils import valoraciones
+
+MENSAJE_DUPLICADA = "Ya existe una valoración activa de este usuario para este título"
+
+
+def valorar(base, id_usuario, id_titulo, puntuacion=4.0):
+    with Session(base) as session:
+        return valoraciones.crear_valoracion(session, id_usuario, id_titulo, puntuacion, "-", date.today())
+
+
+def formulario(id_usuario, id_titulo, puntuacion=3.0):
+    return {"id_usuario_FK": id_usuario, "id_titulo_FK": id_titulo, "puntuacion": puntuacion,
+            "comentario": "editada", "fecha": date.today().isoformat()}
+
+
+def leer(base, id_valoracion):
+    with Session(base) as session:
+        return session.get(Valoracion, id_valoracion)
+
+
+def test_editar_hacia_un_par_ya_valorado_vuelve_al_formulario(base, crear, cliente):
+    id_usuario, _ = crear.usuario()
+    titulo_a, titulo_b = crear.titulo(), crear.titulo()
+    valorar(base, id_usuario, titulo_a)
+    id_b = valorar(base, id_usuario, titulo_b)
+
+    respuesta = cliente.post(f"/web/valoraciones/editar/{id_b}", data=formulario(id_usuario, titulo_a),
+                             follow_redirects=False)
+
+    assert respuesta.status_code == 200
+    assert MENSAJE_DUPLICADA in respuesta.text
+    assert (leer(base, id_b).id_titulo_FK, leer(base, id_b).comentario) == (titulo_b, "-")
+
+
+def test_choque_con_el_indice_unico_al_guardar_se_revierte(base, crear, cliente, monkeypatch):
+    id_usuario, _ = crear.usuario()
+    titulo_a, titulo_b = crear.titulo(), crear.titulo()
+    id_b = valorar(base, id_usuario, titulo_b)
+    original = valoraciones.actualizar_agregados
+
+    def adelantarse(session, quitadas=(), agregadas=()):
+        # Otra petición crea la valoración del par destino justo después de la comprobación previa
+        monkeypatch.setattr(valoraciones, "actualizar_agregados", original)
+        valorar(base, id_usuario, titulo_a)
+        original(session, quitadas, agregadas)
+
+    monkeypatch.setattr(valoraciones, "actualizar_agregados", adelantarse)
+    respuesta = cliente.post(f"/web/valoraciones/editar/{id_b}", data=formulario(id_usuario, titulo_a),
+                             follow_redirects=False)
+
+    assert respuesta.status_code == 200
+    assert MENSAJE_DUPLICADA in respuesta.text
+    assert leer(base, id_b).id_titulo_FK == titulo_b
+
+
+def test_editar_sin_cambiar_el_par_guarda(base, crear, cliente):
+    id_usuario, _ = crear.usuario()
+    id_titulo = crear.titulo()
+    id_valoracion = valorar(base, id_usuario, id_titulo)
+
+    respuesta = cliente.post(f"/web/valoraciones/editar/{id_valoracion}", data=formulario(id_usuario, id_titulo, 5.0),
+                             follow_redirects=False)
+
+    assert respuesta.status_code == 303
+    assert (leer(base, id_valoracion).puntuacion, leer(base, id_valoracion).comentario) == (5.0, "editada")
+
+
+def test_api_rechaza_puntuaciones_fuera_de_rango(crear, cliente):
+    id_usuario, _ = crear.usuario()
+    id_titulo = crear.titulo()
+    datos = {"puntuacion": 7, "comentario": "-", "fecha": date.today().isoformat()}
+
+    assert cliente.put(f"/valoraciones/usuario/{id_usuario}/titulo/{id_titulo}", json=datos).status_code == 422
+    assert cliente.post("/valoraciones/", json={**datos, "puntuacion": -1, "id_usuario_FK": id_usuario,
+                                                "id_titulo_FK": id_titulo}).status_code == 422
+
+
+def test_api_solo_modifica_datos_propios(base, crear, cliente):
+    otro, _ = crear.usuario()
+    id_titulo = crear.titulo()
+    ajena = valorar(base, otro, id_titulo)
+    datos = {"puntuacion": 4, "comentario": "-", "fecha": date.today().isoformat()}
+
+    assert cliente.put(f"/valoraciones/usuario/{otro}/titulo/{id_titulo}", json=datos).status_code == 403
+    assert cliente.delete(f"/valoraciones/{ajena}").status_code == 403
+    assert cliente.post("/valoraciones/eliminar-lote", json={"ids": [ajena]}).status_code == 403
+    assert cliente.delete(f"/web/usuarios/{otro}").status_code == 403
+    assert leer(base, ajena).is_active
+
+    assert cliente.put(f"/valoraciones/usuario/{cliente.id_usuario}/titulo/{id_titulo}", json=datos).status_code == 200
+
+
+@pytest.mark.parametrize("grano, anios, estado", [("dia", 4, 400), ("semana", 19, 200), ("semana", 21, 400),
+                                                  ("mes", 101, 400)])
+def test_series_limitan_el_rango_en_todos_los_granos(cliente, grano, anios, estado):
+    desde = date(2000, 1, 1)
+    respuesta = cliente.get("/valoraciones/series", params={"grano": grano, "desde": desde.isoformat(),
+                                                            "hasta": desde.replace(year=2000 + anios).isoformat()})
+    assert respuesta.status_code == estado
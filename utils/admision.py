@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from dotenv import load_dotenv
+from starlette.datastructures import Headers
+
+load_dotenv()
+
+# Peticiones simultáneas que pueden usar la base de datos (por defecto, el tamaño máximo del pool)
+ADMISION_TOTAL = int(os.getenv("ADMISION_TOTAL", str(int(os.getenv("DB_POOL_SIZE", "5")) + int(os.getenv("DB_MAX_OVERFLOW", "10")))))
+ADMISION_COLA_TOTAL = int(os.getenv("ADMISION_COLA_TOTAL", "50"))
+# Páginas de analítica: pocas a la vez para que no acaparen el pool
+ADMISION_ANALITICA = int(os.getenv("ADMISION_ANALITICA", "2"))
+ADMISION_COLA_ANALITICA = int(os.getenv("ADMISION_COLA_ANALITICA", "4"))
+# Tiempo máximo en cola antes de responder 503
+ADMISION_ESPERA_MS = float(os.getenv("ADMISION_ESPERA_MS", "2000"))
+ADMISION_RETRY_AFTER = os.getenv("ADMISION_RETRY_AFTER", "2")
+
+MENSAJE_SATURADO = "Servidor saturado, inténtalo de nuevo en unos segundos"
+# Página mínima para navegadores: sin plantillas ni base de datos, que es justo lo que falta
+HTML_SATURADO = f"""<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="UTF-8"><title>CineHub - Servidor saturado</title></head>
+<body><h1>Servidor saturado</h1><p>{MENSAJE_SATURADO}.</p><p><a href="">Reintentar</a></p></body>
+</html>
+"""
+
+# Prioridad al liberar un hueco del límite global: menor número = antes
+PRIORIDAD = {"escritura": 0, "general": 1, "analitica": 2}
+
+# Rutas que no usan la base de datos (o conexiones SSE de larga duración): no pasan por admisión
+EXENTAS = ("/health", "/static", "/web/admin", "/eventos")
+# Páginas caras de analítica (ruta exacta; sus formularios y acciones son "general")
+ANALITICA = {"/web/estadisticas", "/web/valoraciones", "/web/valoraciones/"}
+
+
+class Limite:
+    """Semáforo con cola acotada y prioridades. Pensado para un solo event loop (un worker)."""
+
+    def __init__(self, nombre: str, maximo: int, cola: int):
+        self.nombre = nombre
+        self.maximo = maximo
+        self.cola = cola
+        self.activos = 0
+        self.admitidos = 0
+        self.rechazados = {"cola_llena": 0, "espera_agotada": 0}
+        self.cola_maxima = 0
+        self._espera = []  # heap de (prioridad, turno, future)
+        self._turno = itertools.count()
+
+    @property
+    def en_cola(self):
+        return sum(1 for *_, futuro in self._espera if not futuro.done())
+
+    async def entrar(self, prioridad: int, espera_s: float) -> bool:
+        if self.activos < self.maximo and not self.en_cola:
+            self.activos += 1
+            self.admitidos += 1
+            return True
+        if self.en_cola >= self.cola:
+            self.rechazados["cola_llena"] += 1
+            return False
+
+        futuro = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._espera, (prioridad, next(self._turno), futuro))
+        self.cola_maxima = max(self.cola_maxima, self.en_cola)
+        try:
+            await asyncio.wait_for(asyncio.shield(futuro), espera_s)
+        except BaseException as error:
+            # Espera agotada o cliente desconectado: si el hueco llegó justo entonces, se devuelve
+            if futuro.done() and not futuro.cancelled():
+                self.salir()
+            futuro.cancel()
+            if isinstance(error, asyncio.TimeoutError):
+                self.rechazados["espera_agotada"] += 1
+                return False
+            raise
+        self.admitidos += 1
+        return True
+
+    def salir(self):
+        # El hueco pasa directamente al siguiente en espera (activos no cambia)
+        while self._espera:
+            *_, futuro = heapq.heappop(self._espera)
+            if not futuro.done():
+                futuro.set_result(True)
+                return
+        self.activos -= 1
+
+    def metricas(self):
+        return {"maximo": self.maximo, "activos": self.activos, "en_cola": self.en_cola, "cola": self.cola,
+                "cola_maxima": self.cola_maxima, "admitidos": self.admitidos, "rechazados": self.rechazados}
+
+
+limites_admision = {
+    "total": Limite("total", ADMISION_TOTAL, ADMISION_COLA_TOTAL),
+    "analitica": Limite("analitica", ADMISION_ANALITICA, ADMISION_COLA_ANALITICA),
+}
+
+
+def clase_de(metodo: str, ruta: str):
+    if ruta.startswith(EXENTAS):
+        return None
+    if metodo not in ("GET", "HEAD"):
+        return "escritura"
+    return "analitica" if ruta in ANALITICA else "general"
+
+
+class Admision:
+    """Middleware ASGI de control de admisión.
+
+    Toda petición con acceso a la base de datos ocupa un hueco del límite global; las de
+    analítica además uno de su propio límite. Si la cola está llena o la espera supera
+    ADMISION_ESPERA_MS se responde 503 con Retry-After en lugar de encolar sin fin.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        clase = clase_de(scope.get("method", ""), scope["path"]) if scope["type"] == "http" else None
+        if clase is None:
+            await self.app(scope, receive, send)
+            return
+
+        limites = [limites_admision[clase]] if clase in limites_admision else []
+        limites.append(limites_admision["total"])
+        ocupados = []
+        limite_espera = time.monotonic() + ADMISION_ESPERA_MS / 1000
+        try:
+            for limite in limites:
+                if not await limite.entrar(PRIORIDAD[clase], max(0.0, limite_espera - time.monotonic())):
+                    await self._rechazar(scope, send, limite.nombre)
+                    return
+                ocupados.append(limite)
+            await self.app(scope, receive, send)
+        finally:
+            for limite in reversed(ocupados):
+                limite.salir()
+
+    async def _rechazar(self, scope, send, limite: str):
+        if "text/html" in Headers(scope=scope).get("accept", ""):
+            cuerpo, tipo = HTML_SATURADO.encode(), b"text/html; charset=utf-8"
+        else:
+            cuerpo, tipo = json.dumps({"detail": MENSAJE_SATURADO, "limite": limite}).encode(), b"application/json"
+        await send({"type": "http.response.start", "status": 503, "headers": [
+            (b"content-type", tipo),
+            (b"content-length", str(len(cuerpo)).encode()),
+            (b"retry-after", ADMISION_RETRY_AFTER.encode()),
+        ]})
+        await send({"type": "http.response.body", "body": cuerpo})
+
+
+def metricas():
+    return {nombre: limite.metricas() for nombre, limite in limites_admision.items()}
@@ -0,0 +1,124 @@
+import os
+from datetime import date, timedelta
+from itertools import groupby
+from typing import List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func, literal_column
+from sqlmodel import Session, select
+from data.models import Usuario, PeliculaSerie, Rutina, RUTINA_PERIODO
+
+load_dotenv()
+
+# Minutos planeados que un usuario puede tener en un mismo día (0 = sin límite)
+RUTINA_MAX_MINUTOS_DIA = float(os.getenv("RUTINA_MAX_MINUTOS_DIA", "0"))
+
+# Una rutina planea ver su título una vez dentro de su periodo: la duración del título
+# se reparte por igual entre los días de la rutina (ver utils/habitos.py).
+
+
+def minutos_diarios(duracion: int, inicio: date, fin: date) -> float:
+    return duracion / ((fin - inicio).days + 1)
+
+
+def carga(rutinas, desde: date, hasta: date) -> np.ndarray:
+    """Minutos planeados por día entre `desde` y `hasta` (incluidos) para filas (inicio, fin, duracion).
+
+    Se suma con un array de diferencias: +minutos el primer día, -minutos el día siguiente al último.
+    """
+    dias = (hasta - desde).days + 1
+    if dias <= 0:
+        return np.zeros(0)
+    rutinas = list(rutinas)
+    if not rutinas:
+        return np.zeros(dias)
+    inicio = np.array([r[0].toordinal() for r in rutinas]) - desde.toordinal()
+    fin = np.array([r[1].toordinal() for r in rutinas]) - desde.toordinal()
+    por_dia = np.array([r[2] for r in rutinas], dtype=np.float64) / (fin - inicio + 1)
+
+    visibles = (fin >= 0) & (inicio < dias)
+    diferencias = np.zeros(dias + 1)
+    np.add.at(diferencias, np.clip(inicio[visibles], 0, dias), por_dia[visibles])
+    np.add.at(diferencias, np.clip(fin[visibles] + 1, 0, dias), -por_dia[visibles])
+    return np.cumsum(diferencias[:-1])
+
+
+def lunes(fecha: date) -> date:
+    return fecha - timedelta(days=fecha.weekday())
+
+
+def solapa(dialecto: str, desde: date, hasta: date):
+    """Condición "la rutina comparte algún día con [desde, hasta]"."""
+    if dialecto == "postgresql":
+        # Misma expresión que el índice GiST ix_rutina_periodo, para que se use
+        return RUTINA_PERIODO.op("&&")(func.daterange(desde, hasta, literal_column("'[]'")))
+    return (Rutina.fecha_inicio <= hasta) & (Rutina.fecha_fin >= desde)
+
+
+def solapadas(session: Session, id_usuario: int, desde: date, hasta: date, excluir: Optional[int] = None):
+    """Rutinas activas del usuario que comparten algún día con [desde, hasta], con la duración de su título."""
+    query = (
+        select(Rutina.id_rutina, Rutina.nombre, Rutina.fecha_inicio, Rutina.fecha_fin, PeliculaSerie.duracion)
+        .join(PeliculaSerie, PeliculaSerie.id_titulo == Rutina.id_titulo_FK)
+        .where(Rutina.id_usuario_FK == id_usuario, Rutina.is_active == True,
+               solapa(session.get_bind().dialect.name, desde, hasta))
+        .order_by(Rutina.fecha_inicio, Rutina.id_rutina)
+    )
+    if excluir is not None:
+        query = query.where(Rutina.id_rutina != excluir)
+    return session.exec(query).all()
+
+
+def carga_usuario(session: Session, id_usuario: int, desde: date, hasta: date,
+                  excluir: Optional[int] = None) -> np.ndarray:
+    filas = solapadas(session, id_usuario, desde, hasta, excluir)
+    return carga([(f.fecha_inicio, f.fecha_fin, f.duracion) for f in filas], desde, hasta)
+
+
+def exceso(session: Session, id_usuario: int, inicio: date, fin: date, duracion: int,
+           excluir: Optional[int] = None) -> Optional[str]:
+    """Mensaje de error si con esta rutina algún día pasa de RUTINA_MAX_MINUTOS_DIA, o None.
+
+    `excluir` es la rutina que se está editando (su versión anterior no cuenta).
+    """
+    if not RUTINA_MAX_MINUTOS_DIA:
+        return None
+    # Bloquea al usuario hasta el commit: dos rutinas simultáneas no pasan la comprobación a la vez
+    session.exec(select(Usuario.id_usuario).where(Usuario.id_usuario == id_usuario).with_for_update()).first()
+    por_dia = carga_usuario(session, id_usuario, inicio, fin, excluir) + minutos_diarios(duracion, inicio, fin)
+    dia = int(por_dia.argmax())
+    if por_dia[dia] > RUTINA_MAX_MINUTOS_DIA + 1e-6:
+        return (f"El {inicio + timedelta(days=dia)} quedarían {round(float(por_dia[dia]))} minutos planeados "
+                f"(máximo {RUTINA_MAX_MINUTOS_DIA:g} por día).")
+    return None
+
+
+def excesos_al_restaurar(session: Session, ids) -> List[int]:
+    """De las rutinas inactivas `ids`, las que al reactivarlas pasarían de RUTINA_MAX_MINUTOS_DIA algún día.
+
+    Se revisan por usuario en orden de fecha: cada una se suma a las activas y a las anteriores
+    que sí caben, como si se crearan una tras otra con `exceso`.
+    """
+    if not RUTINA_MAX_MINUTOS_DIA or not ids:
+        return []
+    candidatas = session.exec(
+        select(Rutina.id_rutina, Rutina.id_usuario_FK, Rutina.fecha_inicio, Rutina.fecha_fin, PeliculaSerie.duracion)
+        .join(PeliculaSerie, PeliculaSerie.id_titulo == Rutina.id_titulo_FK)
+        .where(Rutina.id_rutina.in_(ids), Rutina.is_active == False)
+        .order_by(Rutina.id_usuario_FK, Rutina.fecha_inicio, Rutina.id_rutina)
+    ).all()
+    rechazadas = []
+    for id_usuario, filas in groupby(candidatas, key=lambda f: f.id_usuario_FK):
+        filas = list(filas)
+        # Mismo bloqueo que `exceso`: no se cruza con una rutina creada a la vez
+        session.exec(select(Usuario.id_usuario).where(Usuario.id_usuario == id_usuario).with_for_update()).first()
+        desde, hasta = filas[0].fecha_inicio, max(f.fecha_fin for f in filas)
+        por_dia = carga_usuario(session, id_usuario, desde, hasta)
+        for fila in filas:
+            tramo = slice((fila.fecha_inicio - desde).days, (fila.fecha_fin - desde).days + 1)
+            nueva = por_dia[tramo] + minutos_diarios(fila.duracion, fila.fecha_inicio, fila.fecha_fin)
+            if nueva.max() > RUTINA_MAX_MINUTOS_DIA + 1e-6:
+                rechazadas.append(fila.id_rutina)
+            else:
+                por_dia[tramo] = nueva
+    return rechazadas
@@ -0,0 +1,161 @@
+import math
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert, literal, func, union_all, exists
+from sqlmodel import Session, select
+from data.models import (Usuario, PeliculaSerie, Valoracion, Rutina, UsuarioArchivo,
+                         PeliculaSerieArchivo, ValoracionArchivo, RutinaArchivo, TituloGenero, Tendencia)
+from utils import generos
+from utils.db import usar_primaria
+
+load_dotenv()
+
+ARCHIVO_RETENCION_DIAS = int(os.getenv("ARCHIVO_RETENCION_DIAS", "30"))
+ARCHIVO_LOTE = int(os.getenv("ARCHIVO_LOTE", "500"))
+
+ARCHIVOS = {
+    Usuario: UsuarioArchivo,
+    PeliculaSerie: PeliculaSerieArchivo,
+    Valoracion: ValoracionArchivo,
+    Rutina: RutinaArchivo,
+}
+
+
+def pk(modelo):
+    """Columna de clave primaria de `modelo` (también la usa utils/lotes.py)."""
+    return modelo.__table__.primary_key.columns.values()[0]
+
+
+def _copiar(session: Session, origen, destino, ids, extra=None):
+    """INSERT ... SELECT de las filas `ids` de `origen` a `destino` y DELETE en `origen`."""
+    columnas = [c.name for c in origen.__table__.columns if c.name != "archived_at"]
+    seleccion = [origen.__table__.c[c] for c in columnas]
+    if extra:
+        columnas += list(extra)
+        seleccion += [literal(v) for v in extra.values()]
+
+    session.exec(insert(destino.__table__).from_select(columnas, select(*seleccion).where(pk(origen).in_(ids))))
+    session.exec(delete(origen.__table__).where(pk(origen).in_(ids)))
+
+
+def _restaurables(session: Session, archivo, modelo, ids):
+    """Separa los `ids` archivados que pueden volver a `modelo` de los que chocarían al volver.
+
+    Chocan los que tienen su id ya ocupado en la tabla activa o un valor único (correo, título)
+    que ahora usa otra fila. Entre varias archivadas con el mismo valor solo vuelve la más reciente.
+    """
+    ids = session.exec(select(pk(archivo)).where(pk(archivo).in_(ids)).order_by(pk(archivo).desc())).all()
+    ocupados = set(session.exec(select(pk(modelo)).where(pk(modelo).in_(ids))).all())
+    # Por cada columna única: su valor en cada fila archivada y los valores ya usados en la tabla activa
+    unicas = []
+    for columna in modelo.__table__.columns:
+        if columna.unique:
+            valores = dict(session.exec(select(pk(archivo), archivo.__table__.c[columna.name])
+                                        .where(pk(archivo).in_(ids))).all())
+            usados = set(session.exec(select(columna).where(columna.in_(set(valores.values())))).all())
+            unicas.append((valores, usados))
+
+    libres, conflictos = [], []
+    for id_fila in ids:
+        if id_fila in ocupados or any(valores[id_fila] in usados for valores, usados in unicas):
+            conflictos.append(id_fila)
+            continue
+        libres.append(id_fila)
+        for valores, usados in unicas:
+            usados.add(valores[id_fila])
+    return libres, conflictos
+
+
+def _archivar_lote(session: Session, modelo, limite: datetime, lote: int) -> int:
+    condiciones = [modelo.is_active == False, modelo.deleted_at < limite]
+    # Un usuario o título solo se archiva cuando ya no tiene dependientes en las tablas activas
+    if modelo is Usuario:
+        condiciones += [~exists().where(Valoracion.id_usuario_FK == Usuario.id_usuario),
+                        ~exists().where(Rutina.id_usuario_FK == Usuario.id_usuario)]
+    elif modelo is PeliculaSerie:
+        condiciones += [~exists().where(Valoracion.id_titulo_FK == PeliculaSerie.id_titulo),
+                        ~exists().where(Rutina.id_titulo_FK == PeliculaSerie.id_titulo)]
+
+    ids = session.exec(select(pk(modelo)).where(*condiciones).limit(lote)).all()
+    if ids:
+        if modelo is PeliculaSerie:
+            # El archivo conserva solo la etiqueta de géneros; al restaurar se vuelven a enlazar
+            session.exec(delete(TituloGenero).where(TituloGenero.id_titulo_FK.in_(ids)))
+            # Sin valoraciones activas su tendencia ya es 0
+            session.exec(delete(Tendencia).where(Tendencia.id_titulo_FK.in_(ids)))
+        _copiar(session, modelo, ARCHIVOS[modelo], ids, extra={"archived_at": datetime.now()})
+        session.commit()
+    return len(ids)
+
+
+def archivar_eliminados(session: Session, dias: int = ARCHIVO_RETENCION_DIAS, lote: int = ARCHIVO_LOTE):
+    """Mueve al archivo las filas eliminadas hace más de `dias`, en lotes de `lote` filas.
+
+    Primero valoraciones y rutinas, para que sus usuarios y títulos queden libres.
+    """
+    limite = datetime.now() - timedelta(days=dias)
+    movidas = {}
+    for modelo in (Valoracion, Rutina, PeliculaSerie, Usuario):
+        total = 0
+        while True:
+            n = _archivar_lote(session, modelo, limite, lote)
+            total += n
+            if n < lote:
+                break
+        movidas[modelo.__tablename__] = total
+    return movidas
+
+
+def restaurar_desde_archivo(session: Session, modelo, ids, conflictos=None):
+    """Devuelve a la tabla activa las filas archivadas de `ids` (siguen inactivas) y devuelve sus ids.
+
+    Para valoraciones y rutinas también se devuelven su usuario y título si estaban archivados.
+    Las que no pueden volver (ver `_restaurables`), y las que dependen de un usuario o título que no
+    pudo volver, se quedan en el archivo y se anotan en `conflictos` ({tabla: [ids]}).
+    """
+    usar_primaria(session)
+    conflictos = {} if conflictos is None else conflictos
+    archivo = ARCHIVOS[modelo]
+    ids, chocan = _restaurables(session, archivo, modelo, ids)
+
+    if ids and modelo in (Valoracion, Rutina):
+        padres = session.exec(select(pk(archivo), archivo.id_usuario_FK, archivo.id_titulo_FK)
+                              .where(pk(archivo).in_(ids))).all()
+        restaurar_desde_archivo(session, Usuario, {p[1] for p in padres}, conflictos)
+        restaurar_desde_archivo(session, PeliculaSerie, {p[2] for p in padres}, conflictos)
+        # Un padre que se quedó en el archivo no puede recibir de vuelta a sus dependientes
+        sin_usuario = set(conflictos.get(Usuario.__tablename__, ()))
+        sin_titulo = set(conflictos.get(PeliculaSerie.__tablename__, ()))
+        huerfanas = {p[0] for p in padres if p[1] in sin_usuario or p[2] in sin_titulo}
+        ids = [i for i in ids if i not in huerfanas]
+        chocan += sorted(huerfanas)
+
+    if chocan:
+        conflictos.setdefault(modelo.__tablename__, []).extend(chocan)
+    if not ids:
+        return []
+    _copiar(session, archivo, modelo, ids)
+    if modelo is PeliculaSerie:
+        generos.reconstruir(session, ids)
+    return ids
+
+
+def pagina_papelera(session: Session, modelo, campos, page: int = 1, limite: int = 10):
+    """Página de la papelera: filas inactivas de la tabla activa más las archivadas."""
+    page = max(1, page)
+    archivo = ARCHIVOS[modelo]
+    recientes = select(*[getattr(modelo, c) for c in campos], modelo.deleted_at,
+                       literal(False).label("archivado")).where(modelo.is_active == False)
+    archivadas = select(*[getattr(archivo, c) for c in campos], archivo.deleted_at,
+                        literal(True).label("archivado"))
+    papelera = union_all(recientes, archivadas).subquery()
+
+    total = session.exec(select(func.count()).select_from(papelera)).one()
+    filas = session.exec(
+        select(*papelera.c)
+        .order_by(papelera.c.deleted_at.desc())
+        .offset((page - 1) * limite)
+        .limit(limite)
+    ).all()
+    return filas, max(1, math.ceil(total / limite))
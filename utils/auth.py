@@ -0,0 +1,226 @@
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from functools import lru_cache
+import jwt
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from data.models import Usuario, TokenUsado
+from utils import bus
+from utils.security import verify_password, get_password_hash
+
+load_dotenv()
+
+logger = logging.getLogger("cinehub.auth")
+
+# Claves de firma "kid:secreto" separadas por comas; la primera firma y todas verifican
+# (para rotar: añadir la nueva delante y quitar la vieja cuando caduquen sus tokens)
+_JWT_CLAVES = os.getenv("JWT_CLAVES", "")
+ACCESO_MINUTOS = int(os.getenv("JWT_ACCESO_MINUTOS", "15"))
+REFRESCO_DIAS = int(os.getenv("JWT_REFRESCO_DIAS", "7"))
+# Duración de la sesión de la interfaz web (cookie)
+SESION_HORAS = int(os.getenv("JWT_SESION_HORAS", "8"))
+COOKIE_SESION = "sesion"
+ALGORITMO = "HS256"
+# Solo para desarrollo con un único worker: sin JWT_CLAVES, una clave aleatoria por proceso
+JWT_CLAVE_TEMPORAL = os.getenv("JWT_CLAVE_TEMPORAL", "0") == "1"
+# Usuarios que pueden modificar filas de otros usuarios desde la API (IDs separados por comas)
+ADMINISTRADORES = {int(i) for i in os.getenv("ADMIN_IDS", "").split(",") if i.strip()}
+
+if _JWT_CLAVES:
+    CLAVES = dict(par.strip().split(":", 1) for par in _JWT_CLAVES.split(",") if par.strip())
+elif JWT_CLAVE_TEMPORAL:
+    # Los tokens no sirven entre workers ni tras reiniciar
+    logger.warning("JWT_CLAVES no configurada: se usa una clave temporal (JWT_CLAVE_TEMPORAL=1)")
+    CLAVES = {"local": secrets.token_urlsafe(32)}
+else:
+    # Con una clave por worker los tokens y la sesión web fallarían al azar: mejor no arrancar
+    raise ValueError("Falta JWT_CLAVES (\"kid:secreto\"); para desarrollo, JWT_CLAVE_TEMPORAL=1")
+KID_ACTIVO = next(iter(CLAVES))
+
+
+class ListaRevocados:
+    """jti revocados hasta su expiración; pasada ésta el token ya no es válido de todos modos.
+
+    Solo para tokens de acceso y sesiones (cierre de sesión): los de refresco se consumen en la
+    base de datos (ver `consumir_refresco`), porque aquí dos workers podrían aceptar el mismo
+    antes de recibir la revocación del otro.
+    """
+
+    def __init__(self):
+        self._jtis = {}
+        self._lock = threading.Lock()
+        self._purgado_en = time.time()
+
+    def revocar(self, jti: str, exp: int):
+        with self._lock:
+            self._jtis[jti] = exp
+            self._purgar()
+
+    def contiene(self, jti: str) -> bool:
+        return jti in self._jtis
+
+    def _purgar(self):
+        ahora = time.time()
+        if ahora - self._purgado_en < 60:
+            return
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > ahora}
+        self._purgado_en = ahora
+
+    def __len__(self):
+        return len(self._jtis)
+
+
+revocados = ListaRevocados()
+
+
+# Revocaciones hechas en otros workers
+bus.suscribir("revocaciones", lambda datos: revocados.revocar(datos["jti"], datos["exp"]))
+
+
+def huella_clave(clave_hash: str) -> str:
+    """Cambia si cambia la contraseña: invalida los tokens de refresco emitidos antes."""
+    return hashlib.sha256(clave_hash.encode()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=1)
+def _hash_relleno():
+    # Sin usuario también se paga un bcrypt: el tiempo de respuesta no delata qué correos existen
+    return get_password_hash("relleno-no-es-una-clave")
+
+
+def autenticar(session: Session, correo: str, clave: str):
+    """Fila (id_usuario, clave) del usuario activo con esas credenciales, o None."""
+    usuario = session.exec(select(Usuario.id_usuario, Usuario.clave)
+                           .where(Usuario.correo == correo, Usuario.is_active == True)).first()
+    if not verify_password(clave, usuario.clave if usuario else _hash_relleno()) or not usuario:
+        return None
+    return usuario
+
+
+def _firmar(claims: dict, duracion_s: int) -> str:
+    ahora = int(time.time())
+    claims = {**claims, "iat": ahora, "exp": ahora + duracion_s, "jti": uuid.uuid4().hex[:16]}
+    return jwt.encode(claims, CLAVES[KID_ACTIVO], algorithm=ALGORITMO, headers={"kid": KID_ACTIVO})
+
+
+def emitir_tokens(id_usuario: int, clave_hash: str) -> dict:
+    return {
+        "access_token": _firmar({"sub": str(id_usuario), "tipo": "acceso"}, ACCESO_MINUTOS * 60),
+        "refresh_token": _firmar({"sub": str(id_usuario), "tipo": "refresco", "clv": huella_clave(clave_hash)},
+                                 REFRESCO_DIAS * 86400),
+        "token_type": "bearer",
+        "expires_in": ACCESO_MINUTOS * 60,
+    }
+
+
+def emitir_sesion(id_usuario: int) -> str:
+    return _firmar({"sub": str(id_usuario), "tipo": "sesion"}, SESION_HORAS * 3600)
+
+
+def verificar(token: str, tipo: str) -> dict:
+    """Comprueba firma, expiración, tipo y revocación. Sin consultas a la base de datos."""
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid not in CLAVES:
+            raise jwt.InvalidTokenError("kid desconocido")
+        claims = jwt.decode(token, CLAVES[kid], algorithms=[ALGORITMO], options={"require": ["exp", "sub", "jti"]})
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expirado", headers={"WWW-Authenticate": "Bearer"})
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Token inválido", headers={"WWW-Authenticate": "Bearer"})
+    if claims.get("tipo") != tipo or revocados.contiene(claims["jti"]):
+        raise HTTPException(status_code=401, detail="Token inválido", headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+
+def revocar(claims: dict):
+    revocados.revocar(claims["jti"], claims["exp"])
+    bus.emitir("revocaciones", {"jti": claims["jti"], "exp": claims["exp"]})
+
+
+def consumir_refresco(session: Session, claims: dict) -> bool:
+    """Marca el token de refresco como usado. False si ya lo estaba (en este u otro worker).
+
+    La inserción en token_usado es atómica: de dos peticiones simultáneas con el mismo token,
+    la segunda choca con la llave primaria.
+    """
+    # De paso se borran los ya caducados (esos tokens no pasan `verificar` de todos modos)
+    session.exec(delete(TokenUsado).where(TokenUsado.exp < int(time.time()))
+                 .execution_options(etiquetas={"token_usado"}))
+    session.add(TokenUsado(jti=claims["jti"], exp=claims["exp"]))
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        return False
+    return True
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def token_actual(credenciales: HTTPAuthorizationCredentials = Depends(_bearer)) -> dict:
+    if credenciales is None:
+        raise HTTPException(status_code=401, detail="Se requiere autenticación", headers={"WWW-Authenticate": "Bearer"})
+    return verificar(credenciales.credentials, "acceso")
+
+
+def usuario_actual(claims: dict = Depends(token_actual)) -> int:
+    """ID del usuario autenticado (para `Depends` en los endpoints de escritura)."""
+    return int(claims["sub"])
+
+
+def comprobar_propietario(id_usuario: int, propietarios):
+    """403 si alguna fila que se va a escribir es de otro usuario (salvo para ADMIN_IDS)."""
+    if id_usuario in ADMINISTRADORES:
+        return
+    if any(propietario != id_usuario for propietario in propietarios):
+        raise HTTPException(status_code=403, detail="Solo puede modificar sus propios datos")
+
+
+def token_calendario(id_usuario: int, version: int) -> str:
+    """Secreto de la URL del calendario de un usuario; cambia al incrementar su `version_calendario`."""
+    return _firma_calendario(CLAVES[KID_ACTIVO], id_usuario, version)
+
+
+def verificar_calendario(token: str, id_usuario: int, version: int) -> bool:
+    # Vale con cualquiera de las claves: rotar JWT_CLAVES no rompe las suscripciones hasta retirar la vieja
+    return any(hmac.compare_digest(token, _firma_calendario(clave, id_usuario, version)) for clave in CLAVES.values())
+
+
+def _firma_calendario(clave: str, id_usuario: int, version: int) -> str:
+    return hmac.new(clave.encode(), f"calendario:{id_usuario}:{version}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+class SesionRequerida(Exception):
+    """Página web sin sesión válida: main.py redirige al formulario de inicio de sesión."""
+
+    def __init__(self, siguiente: str):
+        self.siguiente = siguiente
+
+
+def sesion_web(request: Request) -> int:
+    """ID del usuario con sesión en la interfaz web (cookie `sesion`); dependencia de los routers HTML."""
+    # Tras iniciar sesión se vuelve a la página pedida (un POST no se puede repetir: se vuelve al inicio)
+    siguiente = "/"
+    if request.method == "GET":
+        siguiente = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    token = request.cookies.get(COOKIE_SESION)
+    if not token:
+        raise SesionRequerida(siguiente)
+    try:
+        claims = verificar(token, "sesion")
+    except HTTPException:
+        raise SesionRequerida(siguiente)
+    request.state.id_usuario = int(claims["sub"])
+    return request.state.id_usuario
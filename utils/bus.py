@@ -0,0 +1,262 @@
+import itertools
+import json
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+load_dotenv()
+
+# Canal de PostgreSQL (LISTEN/NOTIFY) y archivo compartido para SQLite u otros motores
+BUS_CANAL = os.getenv("BUS_CANAL", "cinehub_cache")
+BUS_ARCHIVO = os.getenv("BUS_ARCHIVO", "logs/bus_cache.jsonl")
+BUS_ARCHIVO_BYTES = int(os.getenv("BUS_ARCHIVO_BYTES", str(1024 * 1024)))
+BUS_INTERVALO = float(os.getenv("BUS_INTERVALO", "0.2"))
+# NOTIFY admite hasta 8000 bytes; si el evento no cabe se pide vaciar la caché entera
+_MAX_PAYLOAD = 7500
+
+ORIGEN = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+logger = logging.getLogger("cinehub.bus")
+_secuencia = itertools.count(1)
+
+
+class Metricas:
+    """Latencia de entrega (envío en otro worker -> desalojo en este), en milisegundos."""
+
+    def __init__(self, muestras: int = 500):
+        self.recibidos = 0
+        self.enviados = 0
+        self.vaciados = 0
+        self.errores = 0
+        self._latencias = deque(maxlen=muestras)
+        self._lock = threading.Lock()
+
+    def registrar(self, latencia_ms: float):
+        with self._lock:
+            self.recibidos += 1
+            self._latencias.append(latencia_ms)
+
+    def resumen(self):
+        with self._lock:
+            latencias = sorted(self._latencias)
+        p = lambda q: round(latencias[min(len(latencias) - 1, int(q * len(latencias)))], 2) if latencias else None
+        return {
+            "origen": ORIGEN,
+            "transporte": _transporte.nombre if _transporte else None,
+            "enviados": self.enviados,
+            "recibidos": self.recibidos,
+            "vaciados": self.vaciados,
+            "errores": self.errores,
+            "latencia_ms": {"p50": p(0.5), "p95": p(0.95), "max": p(1.0)},
+        }
+
+
+metricas = Metricas()
+_transporte = None
+# Otros mensajes entre workers además de las etiquetas de caché: canal -> funciones suscritas
+_canales = {}
+
+
+def _evento(**contenido):
+    return json.dumps({"origen": ORIGEN, "version": next(_secuencia), "enviado": time.time(), **contenido})
+
+
+def _recibir(mensaje: str):
+    from utils.cache import cache  # import diferido: cache publica en este módulo
+
+    try:
+        evento = json.loads(mensaje)
+    except ValueError:
+        metricas.errores += 1
+        return
+    if evento.get("origen") == ORIGEN:
+        return
+    if evento.get("todo"):
+        cache.limpiar()
+        metricas.vaciados += 1
+    elif "canal" in evento:
+        for funcion in _canales.get(evento["canal"], ()):
+            funcion(evento["datos"])
+    else:
+        cache.invalidar(evento.get("etiquetas", ()))
+    metricas.registrar((time.time() - evento.get("enviado", time.time())) * 1000)
+
+
+class BusPostgres:
+    nombre = "postgresql"
+    # NOTIFY se entrega al confirmar la transacción en la que se emite (y se descarta si se deshace)
+    transaccional = True
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def publicar(self, mensaje: str, conexion=None):
+        if conexion is not None:
+            conexion.execute(text("SELECT pg_notify(:canal, :mensaje)"), {"canal": BUS_CANAL, "mensaje": mensaje})
+            return
+        conexion = self.engine.raw_connection()
+        try:
+            cursor = conexion.cursor()
+            cursor.execute("SELECT pg_notify(%s, %s)", (BUS_CANAL, mensaje))
+            conexion.commit()
+        finally:
+            conexion.close()
+
+    def escuchar(self):
+        while True:
+            pg = None
+            try:
+                # Conexión propia y fuera del pool: queda bloqueada esperando notificaciones
+                conexion = self.engine.raw_connection()
+                conexion.detach()
+                pg = conexion.driver_connection
+                pg.autocommit = True
+                pg.cursor().execute(f'LISTEN "{BUS_CANAL}"')
+                while True:
+                    if select.select([pg], [], [], 5) == ([], [], []):
+                        continue
+                    pg.poll()
+                    while pg.notifies:
+                        _recibir(pg.notifies.pop(0).payload)
+            except Exception:
+                metricas.errores += 1
+                if pg is not None:
+                    pg.close()
+                # Al reconectar pudo perderse algún evento: se vacía la caché por seguridad
+                from utils.cache import cache
+                cache.limpiar()
+                time.sleep(1)
+
+
+class BusArchivo:
+    """Cada worker añade eventos a un archivo compartido y lee los de los demás."""
+
+    nombre = "archivo"
+    transaccional = False
+
+    def __init__(self, ruta: str = BUS_ARCHIVO):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self.ruta.touch()
+        estado = self.ruta.stat()
+        self._inodo, self._posicion = estado.st_ino, estado.st_size
+        self._pendiente = b""
+
+    def _rotar(self):
+        # Un archivo nuevo (otro inodo) en lugar de truncar: el lector lo detecta aunque ya haya
+        # vuelto a crecer más allá de la posición por la que iba
+        nuevo = self.ruta.with_name(f"{self.ruta.name}.{ORIGEN}")
+        nuevo.write_bytes(b"")
+        os.replace(nuevo, self.ruta)
+
+    def publicar(self, mensaje: str, conexion=None):
+        linea = (mensaje + "\n").encode()
+        while True:
+            # O_APPEND con una sola escritura: las líneas de varios procesos no se mezclan
+            descriptor = os.open(self.ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+            try:
+                estado = os.fstat(descriptor)
+                if estado.st_size > BUS_ARCHIVO_BYTES:
+                    self._rotar()
+                    continue
+                os.write(descriptor, linea)
+                # Si otro worker rotó entretanto, la línea quedó en el archivo viejo: se repite en el nuevo
+                if self.ruta.stat().st_ino == estado.st_ino:
+                    return
+            finally:
+                os.close(descriptor)
+
+    def leer(self):
+        with open(self.ruta, "rb") as archivo:
+            estado = os.fstat(archivo.fileno())
+            if estado.st_ino != self._inodo or estado.st_size < self._posicion:
+                # Otro worker rotó (o alguien truncó) el archivo: lo no leído se da por perdido
+                from utils.cache import cache
+                cache.limpiar()
+                metricas.vaciados += 1
+                self._inodo, self._posicion, self._pendiente = estado.st_ino, 0, b""
+            if estado.st_size == self._posicion:
+                return
+            archivo.seek(self._posicion)
+            datos = self._pendiente + archivo.read()
+            self._posicion = archivo.tell()
+        *lineas, self._pendiente = datos.split(b"\n")
+        for linea in lineas:
+            if linea:
+                _recibir(linea.decode())
+
+    def escuchar(self):
+        while True:
+            time.sleep(BUS_INTERVALO)
+            try:
+                self.leer()
+            except OSError:
+                metricas.errores += 1
+
+
+def iniciar(engine, escuchar: bool = True):
+    """Elige el transporte según el motor y arranca el hilo que escucha a los demás workers.
+
+    Los scripts sueltos (archivar_db.py) solo publican: escuchar=False.
+    """
+    global _transporte
+    if _transporte is not None:
+        return
+    _transporte = BusPostgres(engine) if engine.dialect.name == "postgresql" else BusArchivo()
+    if escuchar:
+        threading.Thread(target=_transporte.escuchar, name="bus-cache", daemon=True).start()
+
+
+def _enviar(mensaje: str):
+    try:
+        _transporte.publicar(mensaje)
+        metricas.enviados += 1
+    except Exception:
+        # Sin bus los demás workers solo se enteran al expirar el TTL
+        metricas.errores += 1
+
+
+def transaccional() -> bool:
+    """True si el transporte publica dentro de la transacción que escribe (ver `publicar`)."""
+    return _transporte is not None and _transporte.transaccional
+
+
+def publicar(etiquetas, conexion=None):
+    """Avisa a los demás workers de las etiquetas modificadas.
+
+    Con un transporte transaccional se llama antes de confirmar, con la `conexion` de la transacción:
+    el aviso sale con el commit y sin abrir otra conexión. Los errores hacen fallar la transacción.
+    """
+    if _transporte is None or not etiquetas:
+        return
+    mensaje = _evento(etiquetas=sorted(etiquetas))
+    if len(mensaje.encode()) > _MAX_PAYLOAD:
+        mensaje = _evento(todo=True)
+    if conexion is None:
+        _enviar(mensaje)
+        return
+    _transporte.publicar(mensaje, conexion)
+    metricas.enviados += 1
+
+
+def suscribir(canal: str, funcion):
+    """`funcion(datos)` se llama con cada mensaje de `canal` enviado por otro worker."""
+    _canales.setdefault(canal, []).append(funcion)
+
+
+def emitir(canal: str, datos):
+    """Envía `datos` (serializable a JSON) a los suscriptores de `canal` en los demás workers."""
+    if _transporte is None:
+        return
+    mensaje = _evento(canal=canal, datos=datos)
+    if len(mensaje.encode()) > _MAX_PAYLOAD:
+        metricas.errores += 1
+        logger.warning("Mensaje del canal %s descartado: %s bytes (máximo %s)", canal, len(mensaje.encode()), _MAX_PAYLOAD)
+        return
+    _enviar(mensaje)
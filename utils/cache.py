@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from itertools import chain
+from dotenv import load_dotenv
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from utils import bus
+
+load_dotenv()
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+
+
+class Cache:
+    """Caché en memoria con expiración y dependencias por etiqueta.
+
+    Las etiquetas son nombres de tabla ("valoracion") o filas concretas
+    ("usuario:5"). Una etiqueta "usuario:*" invalida todas las filas de esa tabla.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        # Segundos tras una invalidación en los que un valor nuevo solo se guarda por ese tiempo
+        # (con réplicas de lectura, el cálculo pudo leer datos aún no replicados)
+        self.margen = 0.0
+        self._invalidado_en = 0.0
+        self._datos = {}
+        self._generacion = 0
+        self._lock = threading.Lock()
+        # Funciones que reciben cada invalidación, local o de otro worker (None = todo); ver utils/catalogo.py
+        self.oyentes = []
+
+    def obtener(self, clave, calcular, dependencias=()):
+        entrada = self._datos.get(clave)
+        if entrada and entrada[0] > time.monotonic():
+            return entrada[1]
+
+        generacion = self._generacion
+        valor = calcular()
+        with self._lock:
+            # Si hubo una invalidación mientras se calculaba, el valor puede estar obsoleto
+            if generacion == self._generacion:
+                ahora = time.monotonic()
+                ttl = self.margen if ahora - self._invalidado_en < self.margen else self.ttl
+                self._datos[clave] = (ahora + ttl, valor, frozenset(dependencias))
+        return valor
+
+    def invalidar(self, etiquetas):
+        etiquetas = set(etiquetas)
+        prefijos = tuple(e[:-1] for e in etiquetas if e.endswith(":*"))
+        with self._lock:
+            self._generacion += 1
+            self._invalidado_en = time.monotonic()
+            obsoletas = [
+                clave for clave, (_, _, deps) in self._datos.items()
+                if deps & etiquetas or (prefijos and any(d.startswith(prefijos) for d in deps))
+            ]
+            for clave in obsoletas:
+                del self._datos[clave]
+        for oyente in self.oyentes:
+            oyente(etiquetas)
+
+    def limpiar(self):
+        with self._lock:
+            self._generacion += 1
+            self._datos.clear()
+        for oyente in self.oyentes:
+            oyente(None)
+
+
+cache = Cache()
+
+
+def etiquetas_de(obj):
+    """Etiquetas afectadas al escribir una fila: su tabla, la propia fila y las filas a las que apunta."""
+    tabla = obj.__table__
+    estado = inspect(obj)
+    etiquetas = {tabla.name}
+    pk = estado.mapper.primary_key_from_instance(obj)[0]
+    if pk is not None:
+        etiquetas.add(f"{tabla.name}:{pk}")
+
+    for columna in tabla.columns:
+        for fk in columna.foreign_keys:
+            historial = estado.attrs[columna.key].history
+            for valor in chain(historial.added, historial.unchanged, historial.deleted):
+                if valor is not None:
+                    etiquetas.add(f"{fk.column.table.name}:{valor}")
+    return etiquetas
+
+
+def etiquetas_tabla(tabla):
+    """Sin detalle de filas: la tabla entera y todo lo que dependa de sus referencias."""
+    etiquetas = {tabla.name, f"{tabla.name}:*"}
+    etiquetas.update(f"{fk.column.table.name}:*" for fk in tabla.foreign_keys)
+    return etiquetas
+
+
+def registrar_etiquetas(session, etiquetas):
+    session.info.setdefault("etiquetas_modificadas", set()).update(etiquetas)
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_cambios(session, flush_context):
+    etiquetas = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if hasattr(obj, "__table__"):
+            etiquetas.update(etiquetas_de(obj))
+    registrar_etiquetas(session, etiquetas)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _registrar_sentencias(estado):
+    # UPDATE/DELETE/INSERT en bloque no pasan por el flush
+    if not (estado.is_update or estado.is_delete or estado.is_insert):
+        return
+    etiquetas = estado.execution_options.get("etiquetas")
+    if etiquetas is None:
+        etiquetas = etiquetas_tabla(estado.statement.table)
+    registrar_etiquetas(estado.session, etiquetas)
+
+
+@event.listens_for(Session, "before_commit")
+def _publicar_en_transaccion(session):
+    # Con PostgreSQL el NOTIFY va en la misma transacción: se entrega solo si confirma
+    if not bus.transaccional():
+        return
+    session.flush()
+    etiquetas = session.info.get("etiquetas_modificadas")
+    if etiquetas:
+        bus.publicar(etiquetas, session.connection())
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar(session):
+    etiquetas = session.info.pop("etiquetas_modificadas", None)
+    if etiquetas:
+        cache.invalidar(etiquetas)
+        # Los demás workers desalojan las mismas etiquetas al recibir el evento
+        if not bus.transaccional():
+            bus.publicar(etiquetas)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar(session):
+    session.info.pop("etiquetas_modificadas", None)
@@ -0,0 +1,237 @@
+import threading
+from typing import NamedTuple, Optional, Sequence
+import numpy as np
+from sqlmodel import Session, select
+from sqlalchemy import func
+from data.models import PeliculaSerie, Valoracion, TituloGenero
+from utils import generos as generos_db
+from utils.cache import cache
+from utils.db import engine
+
+# Tramos de la faceta de duración, en minutos: [inicio, siguiente inicio)
+TRAMOS_DURACION = (0, 31, 61, 91, 121, 151)
+ORDENES = {"id": "Por defecto", "recientes": "Más recientes", "mejor_valorados": "Mejor valorados", "duracion": "Más cortos"}
+
+
+class Instantanea(NamedTuple):
+    """Columnas del catálogo, una posición por título (los inactivos quedan con activo=False).
+
+    Los géneros van aparte como pares (título, género), ordenados por título: un título puede tener varios.
+    """
+    ids: np.ndarray
+    anio: np.ndarray
+    duracion: np.ndarray
+    promedio: np.ndarray  # NaN si no tiene valoraciones activas
+    activo: np.ndarray
+    pares_titulo: np.ndarray
+    pares_genero: np.ndarray
+    pares_posicion: np.ndarray  # posición en `ids` del título de cada par
+    generos: dict  # id_genero -> nombre
+
+
+def _filas(session: Session, ids=None):
+    promedios = select(Valoracion.id_titulo_FK, func.avg(Valoracion.puntuacion).label("promedio")) \
+        .where(Valoracion.is_active == True).group_by(Valoracion.id_titulo_FK)
+    query = select(PeliculaSerie.id_titulo, PeliculaSerie.anio_estreno, PeliculaSerie.duracion, PeliculaSerie.is_active)
+    if ids is None:
+        query = query.where(PeliculaSerie.is_active == True)
+    else:
+        # Recarga parcial: también las filas desactivadas, para marcarlas
+        promedios = promedios.where(Valoracion.id_titulo_FK.in_(ids))
+        query = query.where(PeliculaSerie.id_titulo.in_(ids))
+    promedios = promedios.subquery()
+    query = query.add_columns(promedios.c.promedio) \
+        .outerjoin(promedios, promedios.c.id_titulo_FK == PeliculaSerie.id_titulo).order_by(PeliculaSerie.id_titulo)
+    return session.exec(query).all()
+
+
+def _pares(session: Session, ids=None):
+    query = select(TituloGenero.id_titulo_FK, TituloGenero.id_genero_FK).order_by(TituloGenero.id_titulo_FK)
+    if ids is None:
+        query = query.join(PeliculaSerie, PeliculaSerie.id_titulo == TituloGenero.id_titulo_FK) \
+            .where(PeliculaSerie.is_active == True)
+    else:
+        query = query.where(TituloGenero.id_titulo_FK.in_(ids))
+    return session.exec(query).all()
+
+
+def _tramo_duracion(i: int) -> str:
+    inicio = TRAMOS_DURACION[i]
+    if i + 1 == len(TRAMOS_DURACION):
+        return f"{inicio}+"
+    return f"{inicio}-{TRAMOS_DURACION[i + 1] - 1}"
+
+
+class Catalogo:
+    """Instantánea en memoria de los títulos para explorar con filtros y facetas sin ir a la base de datos.
+
+    Se recarga entera solo al arrancar o tras un cambio masivo; un commit que toca títulos
+    concretos (o sus valoraciones) solo vuelve a leer esas filas en la siguiente consulta.
+    Cada recarga construye arrays nuevos, así que una consulta en curso nunca ve un estado a medias.
+    """
+
+    def __init__(self):
+        self._instantanea: Optional[Instantanea] = None
+        self._pendientes = set()
+        self._recargar = True
+        self._lock = threading.Lock()
+        self._lock_pendientes = threading.Lock()
+        self.recargas = 0
+        self.parciales = 0
+
+    def al_invalidar(self, etiquetas):
+        if etiquetas is None or "peliculaserie:*" in etiquetas:
+            self._recargar = True
+            return
+        # Las valoraciones y rutinas llevan la etiqueta de su título (ver utils/cache.py)
+        ids = {int(e.split(":", 1)[1]) for e in etiquetas if e.startswith("peliculaserie:")}
+        if ids:
+            with self._lock_pendientes:
+                self._pendientes.update(ids)
+
+    def instantanea(self) -> Instantanea:
+        if self._recargar or self._pendientes:
+            with self._lock:
+                # Siempre contra la primaria: una réplica atrasada dejaría valores viejos como buenos
+                # Las marcas se limpian antes de leer (una invalidación que llegue mientras tanto
+                # vuelve a marcarlas) y se restauran si la lectura falla, para reintentar en la siguiente
+                with Session(engine) as session:
+                    if self._recargar:
+                        self._recargar = False
+                        with self._lock_pendientes:
+                            self._pendientes = set()
+                        try:
+                            self._instantanea = self._construir(_filas(session), _pares(session),
+                                                                generos_db.nombres(session))
+                        except Exception:
+                            self._recargar = True
+                            raise
+                        self.recargas += 1
+                    elif self._pendientes:
+                        with self._lock_pendientes:
+                            ids, self._pendientes = self._pendientes, set()
+                        try:
+                            self._instantanea = self._actualizar(self._instantanea, ids, _filas(session, ids),
+                                                                 _pares(session, ids), generos_db.nombres(session))
+                        except Exception:
+                            with self._lock_pendientes:
+                                self._pendientes |= ids
+                            raise
+                        self.parciales += 1
+        return self._instantanea
+
+    def _construir(self, filas, pares, generos) -> Instantanea:
+        ids = np.array([fila[0] for fila in filas], dtype=np.int64)
+        pares_titulo = np.array([par[0] for par in pares], dtype=np.int64)
+        return Instantanea(
+            ids=ids,
+            anio=np.array([fila[1] for fila in filas], dtype=np.int32),
+            duracion=np.array([fila[2] for fila in filas], dtype=np.int32),
+            promedio=np.array([np.nan if fila[4] is None else fila[4] for fila in filas], dtype=np.float64),
+            activo=np.array([fila[3] for fila in filas], dtype=bool),
+            pares_titulo=pares_titulo,
+            pares_genero=np.array([par[1] for par in pares], dtype=np.int32),
+            pares_posicion=np.searchsorted(ids, pares_titulo),
+            generos=dict(generos),
+        )
+
+    def _actualizar(self, actual: Instantanea, ids, filas, pares, generos) -> Instantanea:
+        nuevas = self._construir(filas, pares, generos)
+        columnas = {nombre: getattr(actual, nombre).copy() for nombre in ("ids", "anio", "duracion", "promedio", "activo")}
+        # Los ids pedidos que ya no existen (archivados) quedan inactivos
+        columnas["activo"][np.isin(actual.ids, list(ids))] = False
+
+        posiciones = np.searchsorted(actual.ids, nuevas.ids)
+        existe = np.isin(nuevas.ids, actual.ids)
+        for nombre in columnas:
+            columnas[nombre][posiciones[existe]] = getattr(nuevas, nombre)[existe]
+        if not existe.all():
+            # Títulos nuevos: se insertan manteniendo los ids ordenados (searchsorted lo necesita)
+            for nombre in columnas:
+                columnas[nombre] = np.insert(columnas[nombre], posiciones[~existe], getattr(nuevas, nombre)[~existe])
+
+        # Pares: fuera los de los títulos releídos, dentro los nuevos
+        conservar = ~np.isin(actual.pares_titulo, list(ids))
+        pares_titulo = np.concatenate([actual.pares_titulo[conservar], nuevas.pares_titulo])
+        pares_genero = np.concatenate([actual.pares_genero[conservar], nuevas.pares_genero])
+        orden = np.argsort(pares_titulo, kind="stable")
+        return Instantanea(**columnas, pares_titulo=pares_titulo[orden], pares_genero=pares_genero[orden],
+                           pares_posicion=np.searchsorted(columnas["ids"], pares_titulo[orden]), generos=dict(generos))
+
+    def explorar(self, generos: Sequence[int] = (), anio_min: Optional[int] = None, anio_max: Optional[int] = None,
+                 duracion_min: Optional[int] = None, duracion_max: Optional[int] = None,
+                 promedio_min: Optional[float] = None, orden: str = "id", pagina: int = 1, por_pagina: int = 10) -> dict:
+        """Ids de la página pedida, el total y el conteo de cada faceta en una sola pasada.
+
+        El conteo de una faceta aplica todos los filtros menos el suyo, para poder
+        mostrar cuántos títulos habría al elegir otro valor de esa misma faceta.
+        """
+        c = self.instantanea()
+        todos = np.ones(len(c.ids), dtype=bool)
+
+        if generos:
+            # Títulos con alguno de los géneros elegidos
+            m_genero = np.zeros(len(c.ids), dtype=bool)
+            m_genero[c.pares_posicion[np.isin(c.pares_genero, list(generos))]] = True
+        else:
+            m_genero = todos
+        m_anio = todos.copy()
+        if anio_min is not None:
+            m_anio &= c.anio >= anio_min
+        if anio_max is not None:
+            m_anio &= c.anio <= anio_max
+        m_duracion = todos.copy()
+        if duracion_min is not None:
+            m_duracion &= c.duracion >= duracion_min
+        if duracion_max is not None:
+            m_duracion &= c.duracion <= duracion_max
+        # NaN >= x es False: sin valoraciones no pasa un mínimo de puntuación
+        m_promedio = c.promedio >= promedio_min if promedio_min is not None else todos
+
+        base = c.activo
+        seleccion = base & m_genero & m_anio & m_duracion & m_promedio
+
+        validos = (base & m_anio & m_duracion & m_promedio)[c.pares_posicion]
+        conteo_generos = np.bincount(c.pares_genero[validos], minlength=max(c.generos, default=0) + 1)
+        anios, conteo_anios = np.unique(c.anio[base & m_genero & m_duracion & m_promedio], return_counts=True)
+        tramos = np.digitize(c.duracion[base & m_genero & m_anio & m_promedio], TRAMOS_DURACION[1:])
+        conteo_tramos = np.bincount(tramos, minlength=len(TRAMOS_DURACION))
+        promedios = c.promedio[base & m_genero & m_anio & m_duracion]
+        estrellas = np.bincount(np.floor(promedios[~np.isnan(promedios)]).astype(np.int64), minlength=6)[:6]
+
+        indices = np.flatnonzero(seleccion)
+        if orden == "recientes":
+            indices = indices[np.lexsort((c.ids[indices], -c.anio[indices]))]
+        elif orden == "mejor_valorados":
+            # Sin valoraciones al final
+            indices = indices[np.lexsort((c.ids[indices], np.nan_to_num(-c.promedio[indices], nan=np.inf)))]
+        elif orden == "duracion":
+            indices = indices[np.lexsort((c.ids[indices], c.duracion[indices]))]
+        por_pagina = max(1, por_pagina)
+        inicio = (max(1, pagina) - 1) * por_pagina
+
+        return {
+            "ids": c.ids[indices[inicio:inicio + por_pagina]].tolist(),
+            "total": len(indices),
+            "facetas": {
+                "generos": sorted(({"id_genero": g, "genero": nombre, "total": int(conteo_generos[g])}
+                                   for g, nombre in c.generos.items() if conteo_generos[g] or g in generos),
+                                  key=lambda f: generos_db.clave(f["genero"])),
+                "anios": [{"anio": int(a), "total": int(n)} for a, n in zip(anios, conteo_anios)],
+                "duraciones": [{"tramo": _tramo_duracion(i), "desde": TRAMOS_DURACION[i], "total": int(n)}
+                               for i, n in enumerate(conteo_tramos)],
+                # Cuántos títulos tienen al menos n estrellas de promedio
+                "estrellas": [{"minimo": n, "total": int(estrellas[n:].sum())} for n in range(1, 6)],
+                "sin_valoraciones": int(np.isnan(promedios).sum()),
+            },
+        }
+
+    def metricas(self):
+        c = self._instantanea
+        return {"titulos": 0 if c is None else int(c.activo.sum()), "posiciones": 0 if c is None else len(c.ids),
+                "generos": 0 if c is None else len(c.generos), "recargas": self.recargas,
+                "parciales": self.parciales, "pendientes": len(self._pendientes)}
+
+
+catalogo = Catalogo()
+cache.oyentes.append(catalogo.al_invalidar)
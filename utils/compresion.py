@@ -0,0 +1,149 @@
+import gzip
+import mimetypes
+import os
+import anyio
+from pathlib import Path
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # sin brotli se comprime solo con gzip
+    brotli = None
+
+load_dotenv()
+
+# Respuestas más pequeñas no compensan el coste de comprimir
+COMPRESION_MIN_BYTES = int(os.getenv("COMPRESION_MIN_BYTES", "1024"))
+COMPRESION_NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", "6"))
+COMPRESION_NIVEL_BROTLI = int(os.getenv("COMPRESION_NIVEL_BROTLI", "5"))
+# Cuerpos mayores se comprimen en un hilo para no bloquear el bucle de eventos
+COMPRESION_HILO_BYTES = int(os.getenv("COMPRESION_HILO_BYTES", str(64 * 1024)))
+# Los archivos de static/dist llevan el hash en el nombre: nunca cambian
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+CACHE_ESTATICOS = os.getenv("CACHE_ESTATICOS", "public, max-age=3600")
+
+TIPOS_COMPRIMIBLES = ("text/html", "application/json", "text/css", "application/javascript", "text/javascript",
+                      "image/svg+xml", "text/plain", "text/calendar")
+
+_COMPRESORES = {
+    "gzip": lambda datos: gzip.compress(datos, COMPRESION_NIVEL_GZIP),
+}
+if brotli:
+    _COMPRESORES["br"] = lambda datos: brotli.compress(datos, quality=COMPRESION_NIVEL_BROTLI)
+
+
+def elegir_codificacion(accept_encoding: str, disponibles=("br", "gzip")):
+    """Primera codificación de `disponibles` que acepta el cliente (br antes que gzip)."""
+    aceptadas = set()
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        if parametros.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        aceptadas.add(nombre.strip())
+    for codificacion in disponibles:
+        if codificacion in aceptadas or "*" in aceptadas:
+            return codificacion
+    return None
+
+
+def _debilitar_etag(cabeceras):
+    # La variante comprimida no es idéntica byte a byte: un ETag fuerte no puede ser el mismo (RFC 9110 §8.8.1)
+    etag = cabeceras.get("etag")
+    if etag and not etag.startswith("W/"):
+        cabeceras["etag"] = "W/" + etag
+
+
+class Compresion:
+    """Middleware ASGI: comprime con br/gzip las respuestas HTML/JSON de un solo bloque.
+
+    Las respuestas en streaming (más de un bloque, p. ej. eventos SSE) pasan sin tocar.
+    """
+
+    def __init__(self, app, minimo: int = COMPRESION_MIN_BYTES):
+        self.app = app
+        self.minimo = minimo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Sin Accept-Encoding no se comprime, pero la respuesta sigue necesitando Vary
+        codificacion = elegir_codificacion(Headers(scope=scope).get("accept-encoding", ""),
+                                           tuple(c for c in ("br", "gzip") if c in _COMPRESORES))
+        inicio = None
+
+        async def enviar(mensaje):
+            nonlocal inicio
+            if mensaje["type"] == "http.response.start":
+                inicio = mensaje
+                return
+            if inicio is None:
+                await send(mensaje)
+                return
+
+            cabeceras = MutableHeaders(raw=inicio["headers"])
+            cuerpo = mensaje.get("body", b"")
+            comprimible = (
+                "content-encoding" not in cabeceras
+                and cabeceras.get("content-type", "").split(";")[0].strip() in TIPOS_COMPRIMIBLES
+            )
+            if comprimible:
+                # También si no se comprime esta vez: otra petición con otro Accept-Encoding sí recibiría br/gzip
+                cabeceras.add_vary_header("Accept-Encoding")
+            comprimir = (
+                comprimible
+                and codificacion is not None
+                and not mensaje.get("more_body", False)
+                and len(cuerpo) >= self.minimo
+            )
+            if comprimir:
+                if len(cuerpo) >= COMPRESION_HILO_BYTES:
+                    cuerpo = await anyio.to_thread.run_sync(_COMPRESORES[codificacion], cuerpo)
+                else:
+                    cuerpo = _COMPRESORES[codificacion](cuerpo)
+                cabeceras["content-encoding"] = codificacion
+                cabeceras["content-length"] = str(len(cuerpo))
+                _debilitar_etag(cabeceras)
+                mensaje = {**mensaje, "body": cuerpo}
+            elif inicio["status"] == 304 and codificacion is not None:
+                # El 304 repite el ETag de la variante que tiene el cliente, que es la comprimida
+                _debilitar_etag(cabeceras)
+            await send(inicio)
+            inicio = None
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
+
+
+class Estaticos(StaticFiles):
+    """StaticFiles que sirve las variantes .br/.gz de static/dist y marca esos archivos como inmutables."""
+
+    def __init__(self, *args, carpeta_versionada: str = "dist", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.carpeta_versionada = carpeta_versionada
+
+    async def get_response(self, path: str, scope):
+        versionado = Path(path).parts[:1] == (self.carpeta_versionada,)
+        if versionado:
+            aceptadas = Headers(scope=scope).get("accept-encoding", "")
+            for codificacion, extension in (("br", ".br"), ("gzip", ".gz")):
+                if elegir_codificacion(aceptadas, (codificacion,)) is None:
+                    continue
+                ruta, info = await anyio.to_thread.run_sync(self.lookup_path, path + extension)
+                if info is not None:
+                    respuesta = FileResponse(ruta, stat_result=info, media_type=mimetypes.guess_type(path)[0], headers={
+                        "Content-Encoding": codificacion, "Vary": "Accept-Encoding", "Cache-Control": CACHE_INMUTABLE,
+                    })
+                    if self.is_not_modified(respuesta.headers, Headers(scope=scope)):
+                        return NotModifiedResponse(respuesta.headers)
+                    return respuesta
+
+        respuesta = await super().get_response(path, scope)
+        if respuesta.status_code in (200, 304):
+            respuesta.headers["Cache-Control"] = CACHE_INMUTABLE if versionado else CACHE_ESTATICOS
+            if versionado:
+                respuesta.headers.add_vary_header("Accept-Encoding")
+        return respuesta
@@ -1,17 +1,114 @@
 ﻿
+import re
+from fastapi import Request
+from sqlalchemy import TextClause
+from sqlalchemy.exc import DBAPIError, OperationalError
 from sqlmodel import SQLModel, create_engine, Session
 from dotenv import load_dotenv
+from utils import slow_queries, esquema, cache, replicas  # cache registra los listeners de invalidación
 import os
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# "version": compara la versión guardada y migra solo si hace falta (por defecto)
+# "create_all": reflexiona todas las tablas en cada arranque (comportamiento anterior)
+# "none": no toca el esquema; las migraciones se aplican aparte con init_db.py
+DB_STARTUP_MODE = os.getenv("DB_STARTUP_MODE", "version")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Registra cada sentencia SQL en el log; solo para depurar
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
 
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(DATABASE_URL, echo=DB_ECHO, **replicas.opciones_pool(DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW))
+slow_queries.instalar(engine)
+replicas_lectura = replicas.Replicas(replicas.REPLICA_URLS, DB_POOL_SIZE, DB_MAX_OVERFLOW)
+if replicas_lectura.replicas:
+    # Un valor calculado justo después de invalidar puede venir de una réplica aún atrasada
+    cache.cache.margen = replicas.REPLICA_MAX_LAG
 
 def crear_db():
-    SQLModel.metadata.create_all(engine)
+    if DB_STARTUP_MODE == "none":
+        return
+    if DB_STARTUP_MODE == "create_all":
+        SQLModel.metadata.create_all(engine)
+        return
+    if esquema.leer_version(engine) == esquema.VERSION_ESQUEMA:
+        return
+    esquema.migrar(engine)
 
-def get_session():
-    with Session(engine) as session:
+# SQL textual que solo lee; cualquier otro text() se trata como escritura
+_TEXTO_LECTURA = re.compile(r"\s*(SELECT|WITH|VALUES|SHOW|EXPLAIN)\b", re.IGNORECASE)
+
+
+def _escribe(clause) -> bool:
+    if isinstance(clause, TextClause):
+        return not _TEXTO_LECTURA.match(clause.text)
+    # INSERT/UPDATE/DELETE (también los de cada dialecto) y SELECT ... FOR UPDATE
+    return getattr(clause, "is_dml", False) or getattr(clause, "_for_update_arg", None) is not None
+
+
+class SesionEnrutada(Session):
+    """Lee de la réplica y escribe en la primaria.
+
+    En cuanto la sesión escribe, el resto de sus consultas también van a la primaria
+    (para leer lo recién escrito) y se avisa con `al_escribir`. El código que lee para
+    luego escribir llama antes a `usar_primaria`, para no decidir con datos atrasados.
+    """
+
+    def __init__(self, *args, replica=None, al_escribir=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica = replica
+        self.al_escribir = al_escribir
+
+    def usar_primaria(self):
+        self.replica = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or _escribe(clause):
+            self.replica = None
+            if self.al_escribir:
+                self.al_escribir()
+                self.al_escribir = None
+        if self.replica is not None:
+            return self.replica
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+    def _reintentar(self, ejecutar, *args, **kwargs):
+        replica = self.replica
+        try:
+            return ejecutar(*args, **kwargs)
+        except (OperationalError, DBAPIError) as error:
+            # Réplica caída: la lectura se repite en la primaria (la sesión aún no había escrito nada)
+            if replica is None or self.replica is not replica or self.new or self.dirty or self.deleted:
+                raise
+            if not isinstance(error, OperationalError) and not error.connection_invalidated:
+                raise
+            self.rollback()
+            self.replica = None
+            return ejecutar(*args, **kwargs)
+
+    def exec(self, *args, **kwargs):
+        return self._reintentar(super().exec, *args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._reintentar(super().execute, *args, **kwargs)
+
+
+def usar_primaria(session: Session):
+    """Lo que lea `session` desde ahora sale de la primaria (no hace nada con una sesión normal)."""
+    if isinstance(session, SesionEnrutada):
+        session.usar_primaria()
+
+
+def get_session(request: Request):
+    replica = None
+    if request.method in ("GET", "HEAD") and not request.cookies.get(replicas.COOKIE_PRIMARIA):
+        replica = replicas_lectura.elegir()
+
+    def al_escribir():
+        # El middleware de main.py fija la cookie que manda las próximas lecturas a la primaria
+        request.state.escribio = True
+
+    with SesionEnrutada(engine, replica=replica, al_escribir=al_escribir) as session:
         yield session
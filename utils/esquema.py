@@ -0,0 +1,174 @@
+from typing import Optional
+from sqlalchemy import inspect, text
+from sqlmodel import SQLModel, Field
+
+# Versión del esquema que espera este código. Al cambiar tablas o índices
+# se incrementa y se registra una migración con @migracion(nueva_version).
+VERSION_ESQUEMA = 12
+
+MIGRACIONES = {}
+
+
+class EsquemaVersion(SQLModel, table=True):
+    __tablename__ = "esquema_version"
+    id: int = Field(default=1, primary_key=True)
+    version: int
+
+
+def migracion(version: int):
+    def registrar(funcion):
+        MIGRACIONES[version] = funcion
+        return funcion
+    return registrar
+
+
+def crear_indice(conn, tabla, nombre: str):
+    """Crea (si falta) un índice declarado en el modelo sobre una tabla ya existente."""
+    for indice in tabla.indexes:
+        if indice.name == nombre:
+            indice.create(conn, checkfirst=True)
+            return
+    raise ValueError(f"El índice {nombre} no está declarado en {tabla.name}")
+
+
+def leer_version(engine) -> Optional[int]:
+    """Versión guardada en la base de datos, o None si aún no existe la tabla."""
+    # Solo la tabla ausente cuenta como "sin versión"; un fallo de conexión se propaga
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("esquema_version"):
+            return None
+        return conn.execute(text("SELECT version FROM esquema_version WHERE id = 1")).scalar()
+
+
+def _guardar_version(conn, version: int):
+    actualizadas = conn.execute(text("UPDATE esquema_version SET version = :v WHERE id = 1"), {"v": version}).rowcount
+    if not actualizadas:
+        conn.execute(text("INSERT INTO esquema_version (id, version) VALUES (1, :v)"), {"v": version})
+
+
+def migrar(engine):
+    """Lleva la base de datos a VERSION_ESQUEMA aplicando solo las migraciones pendientes."""
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Evita que varios workers migren a la vez
+            conn.execute(text("SELECT pg_advisory_xact_lock(727274)"))
+
+        inspector = inspect(conn)
+        if inspector.has_table("esquema_version"):
+            actual = conn.execute(text("SELECT version FROM esquema_version WHERE id = 1")).scalar()
+            if actual is not None and actual >= VERSION_ESQUEMA:
+                # Otro worker ya migró (o el código desplegado es más antiguo)
+                return
+        elif inspector.has_table("usuario"):
+            # Base de datos creada antes del versionado: se toma como versión 1
+            actual = 1
+        else:
+            actual = None
+
+        if actual is None:
+            # Base de datos vacía: create_all ya produce el esquema más reciente
+            SQLModel.metadata.create_all(conn)
+            from utils.generos import sembrar
+            sembrar(conn)
+        else:
+            EsquemaVersion.__table__.create(conn, checkfirst=True)
+            for version in range(actual + 1, VERSION_ESQUEMA + 1):
+                MIGRACIONES[version](conn)
+
+        _guardar_version(conn, VERSION_ESQUEMA)
+
+
+# ==========================================
+# MIGRACIONES
+# ==========================================
+
+@migracion(2)
+def _v2_archivo(conn):
+    from data.models import (Usuario, PeliculaSerie, Valoracion, Rutina, UsuarioArchivo,
+                             PeliculaSerieArchivo, ValoracionArchivo, RutinaArchivo)
+    for modelo in (Usuario, PeliculaSerie, Valoracion, Rutina):
+        crear_indice(conn, modelo.__table__, f"ix_{modelo.__tablename__}_deleted_at")
+    for archivo in (UsuarioArchivo, PeliculaSerieArchivo, ValoracionArchivo, RutinaArchivo):
+        archivo.__table__.create(conn, checkfirst=True)
+
+
+@migracion(3)
+def _v3_indices_prefijo(conn):
+    from data.models import Usuario, PeliculaSerie
+    crear_indice(conn, Usuario.__table__, "ix_usuario_nombre_prefijo")
+    crear_indice(conn, Usuario.__table__, "ix_usuario_correo_prefijo")
+    crear_indice(conn, PeliculaSerie.__table__, "ix_peliculaserie_titulo_prefijo")
+
+
+@migracion(4)
+def _v4_valoracion_activa_unica(conn):
+    from data.models import Valoracion
+    # Antes de crear el índice único se desactivan los duplicados, conservando la valoración más reciente
+    conn.execute(text("""
+        UPDATE valoracion SET is_active = :falso, deleted_at = CURRENT_TIMESTAMP
+        WHERE is_active = :verdadero AND id_valoracion NOT IN (
+            SELECT MAX(id_valoracion) FROM valoracion WHERE is_active = :verdadero
+            GROUP BY "id_usuario_FK", "id_titulo_FK"
+        )
+    """), {"verdadero": True, "falso": False})
+    crear_indice(conn, Valoracion.__table__, "ux_valoracion_activa")
+
+
+@migracion(5)
+def _v5_imagenes(conn):
+    from data.models import Imagen
+    # Las imágenes subidas antes (public/<nombre>) no se registran: nunca se recolectan
+    Imagen.__table__.create(conn, checkfirst=True)
+
+
+@migracion(6)
+def _v6_generos(conn):
+    from data.models import Genero, TituloGenero
+    from utils.generos import normalizar
+    Genero.__table__.create(conn, checkfirst=True)
+    TituloGenero.__table__.create(conn, checkfirst=True)
+    normalizar(conn)
+
+
+@migracion(7)
+def _v7_tendencias(conn):
+    from data.models import Tendencia
+    from utils.tendencias import reconstruir
+    Tendencia.__table__.create(conn, checkfirst=True)
+    reconstruir(conn)
+
+
+@migracion(8)
+def _v8_series(conn):
+    from data.models import ResumenValoracion
+    from utils.series import rellenar
+    ResumenValoracion.__table__.create(conn, checkfirst=True)
+    rellenar(conn)
+
+
+@migracion(9)
+def _v9_periodo_rutinas(conn):
+    from data.models import Rutina
+    crear_indice(conn, Rutina.__table__, "ix_rutina_usuario_periodo")
+    # Solo en PostgreSQL (ddl_if): en otros motores no se crea
+    crear_indice(conn, Rutina.__table__, "ix_rutina_periodo")
+
+
+@migracion(10)
+def _v10_tokens_usados(conn):
+    from data.models import TokenUsado
+    TokenUsado.__table__.create(conn, checkfirst=True)
+
+
+@migracion(11)
+def _v11_version_calendario(conn):
+    for tabla in ("usuario", "usuario_archivo"):
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN version_calendario INTEGER NOT NULL DEFAULT 0"))
+
+
+@migracion(12)
+def _v12_version_rutinas(conn):
+    # Las rutinas existentes quedan sin fecha de modificación: ical usa su fecha de inicio
+    for tabla in ("rutina", "rutina_archivo"):
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN modificada TIMESTAMP"))
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN secuencia INTEGER NOT NULL DEFAULT 0"))
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import orjson
+from dotenv import load_dotenv
+from sqlmodel import Session, select
+from sqlalchemy import func
+from data.models import Usuario, Valoracion
+from data import consultas
+from utils.cache import cache
+from utils.posters import url_poster
+from utils.db import engine
+
+load_dotenv()
+
+# Tramas pendientes por cliente; si un cliente lento llena su cola se le desconecta
+EVENTOS_COLA = int(os.getenv("EVENTOS_COLA", "64"))
+# Más filas cambiadas en un commit que esto: se pide a las páginas que se recarguen
+EVENTOS_MAX_FILAS = int(os.getenv("EVENTOS_MAX_FILAS", "20"))
+LATIDO_SEGUNDOS = 15
+
+logger = logging.getLogger("cinehub.eventos")
+
+
+def trama(tipo: str, datos) -> bytes:
+    """Evento SSE ya serializado: se construye una vez y se envía igual a todos los clientes."""
+    return b"event: " + tipo.encode() + b"\ndata: " + orjson.dumps(datos) + b"\n\n"
+
+
+class Suscriptor:
+    def __init__(self):
+        self.cola = asyncio.Queue(maxsize=EVENTOS_COLA)
+
+    async def tramas(self):
+        """Tramas para StreamingResponse, con latidos para que los proxies no corten la conexión."""
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                siguiente = await asyncio.wait_for(self.cola.get(), LATIDO_SEGUNDOS)
+            except asyncio.TimeoutError:
+                yield b": latido\n\n"
+                continue
+            if siguiente is None:
+                return
+            yield siguiente
+
+
+class Difusor:
+    """Reparte cada trama a todas las páginas abiertas de este worker."""
+
+    def __init__(self):
+        self._suscriptores = set()
+        self._loop = None
+        self.desconectados = 0
+
+    def suscribir(self) -> Suscriptor:
+        self._loop = asyncio.get_running_loop()
+        suscriptor = Suscriptor()
+        self._suscriptores.add(suscriptor)
+        return suscriptor
+
+    def cancelar(self, suscriptor: Suscriptor):
+        self._suscriptores.discard(suscriptor)
+
+    def difundir(self, datos: bytes):
+        # Se llama desde hilos (commits, bus): el reparto se hace en el event loop
+        if self._loop is not None and self._suscriptores:
+            self._loop.call_soon_threadsafe(self._repartir, datos)
+
+    def _repartir(self, datos: bytes):
+        for suscriptor in list(self._suscriptores):
+            try:
+                suscriptor.cola.put_nowait(datos)
+            except asyncio.QueueFull:
+                # Cliente demasiado lento: se vacía su cola y se cierra; EventSource reconecta solo
+                while not suscriptor.cola.empty():
+                    suscriptor.cola.get_nowait()
+                suscriptor.cola.put_nowait(None)
+                self._suscriptores.discard(suscriptor)
+                self.desconectados += 1
+
+    def __len__(self):
+        return len(self._suscriptores)
+
+
+difusor = Difusor()
+_pendientes = queue.Queue()
+
+
+def _emitir(tipo: str, datos):
+    difusor.difundir(trama(tipo, datos))
+
+
+def _valoraciones(session: Session, ids):
+    filas = session.exec(select(
+        Valoracion.id_valoracion, Valoracion.puntuacion, Valoracion.comentario, Valoracion.fecha,
+        Valoracion.id_titulo_FK, Valoracion.id_usuario_FK, Valoracion.is_active,
+        Usuario.nombre.label("usuario_nombre"), Usuario.img.label("usuario_img"),
+    ).join(Usuario, Usuario.id_usuario == Valoracion.id_usuario_FK).where(Valoracion.id_valoracion.in_(ids))).all()
+    return [fila._asdict() for fila in filas]
+
+
+def _resumen_titulos(session: Session, ids):
+    filas = session.exec(select(
+        Valoracion.id_titulo_FK, func.avg(Valoracion.puntuacion), func.count(Valoracion.id_valoracion),
+    ).where(Valoracion.id_titulo_FK.in_(ids), Valoracion.is_active == True).group_by(Valoracion.id_titulo_FK)).all()
+    resumen = {id_titulo: {"id_titulo": id_titulo, "promedio_puntuacion": 0.0, "total_valoraciones": 0} for id_titulo in ids}
+    for id_titulo, promedio, total in filas:
+        resumen[id_titulo].update(promedio_puntuacion=round(promedio, 1), total_valoraciones=total)
+    return resumen
+
+
+def _procesar(etiquetas):
+    # Las páginas pudieron cerrarse mientras el cambio esperaba en la cola
+    if not len(difusor):
+        return
+    if etiquetas is None:
+        # Caché vaciada entera (evento demasiado grande o perdido en el bus): no se sabe qué cambió
+        _emitir("recargar", {})
+        return
+    ids = {int(e.split(":")[1]) for e in etiquetas if e.startswith("valoracion:") and e != "valoracion:*"}
+    with Session(engine) as session:
+        if len(ids) > EVENTOS_MAX_FILAS or (not ids and ("valoracion:*" in etiquetas or "peliculaserie:*" in etiquetas)):
+            # Cambio masivo sin detalle de filas (cascadas, lotes grandes)
+            _emitir("recargar", {})
+        elif ids:
+            valoraciones = _valoraciones(session, ids)
+            resumen = _resumen_titulos(session, {v["id_titulo_FK"] for v in valoraciones})
+            for valoracion in valoraciones:
+                valoracion["fecha"] = valoracion["fecha"].isoformat()
+                _emitir("valoracion", {"valoracion": valoracion, "titulo": resumen[valoracion["id_titulo_FK"]]})
+
+        top = [{**titulo, "img_url": url_poster(titulo["id_titulo"], titulo["img_url"])}
+               for titulo in consultas.top_titulos(session, 5)]
+        _emitir("top", top)
+
+
+def _trabajar():
+    while True:
+        etiquetas = _pendientes.get()
+        try:
+            _procesar(etiquetas)
+        except Exception:
+            logger.exception("Error generando eventos en vivo")
+
+
+def _al_invalidar(etiquetas):
+    # Sin páginas abiertas en este worker no se consulta nada
+    if not len(difusor):
+        return
+    # Solo interesan los cambios que afectan a valoraciones o al top de títulos
+    if etiquetas is None or "valoracion" in etiquetas or "peliculaserie" in etiquetas:
+        _pendientes.put(None if etiquetas is None else set(etiquetas))
+
+
+def iniciar():
+    """Arranca el hilo que convierte los cambios en eventos para las páginas abiertas en este worker.
+
+    Recibe las invalidaciones de la caché, tanto de este worker como de los demás (por el bus),
+    así que cada worker consulta solo si tiene páginas abiertas y nunca envía filas por el bus.
+    """
+    cache.oyentes.append(_al_invalidar)
+    threading.Thread(target=_trabajar, name="eventos", daemon=True).start()
@@ -0,0 +1,136 @@
+import re
+import unicodedata
+from sqlalchemy import bindparam, delete, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from data.models import Genero, TituloGenero, PeliculaSerie, PeliculaSerieArchivo
+from utils.cache import cache
+from utils import series
+
+# Géneros con los que nace la tabla (los del formulario de títulos)
+GENEROS_BASE = [
+    "Acción", "Aventura", "Animación", "Biografía", "Ciencia Ficción",
+    "Comedia", "Crimen", "Documental", "Drama", "Familia",
+    "Fantasía", "Historia", "Misterio", "Musical", "Romance",
+    "Suspenso", "Terror", "Western",
+]
+
+
+def clave(nombre: str) -> str:
+    """'  Acción ' -> 'accion': sin tildes, en minúsculas y con los espacios normalizados."""
+    sin_tildes = "".join(c for c in unicodedata.normalize("NFKD", nombre) if not unicodedata.combining(c))
+    return " ".join(sin_tildes.lower().split())
+
+
+def separar(texto: str):
+    """'Acción/aventura, Drama' -> ['Acción', 'aventura', 'Drama'] (sin repetidos)."""
+    nombres = {}
+    for parte in re.split(r"[,/]", texto or ""):
+        parte = " ".join(parte.split())
+        if parte:
+            nombres.setdefault(clave(parte), parte)
+    return list(nombres.values())
+
+
+def etiqueta(generos) -> str:
+    return ", ".join(g.nombre for g in generos)
+
+
+def nombres(session: Session) -> dict:
+    """id_genero -> nombre, para poner nombre a las consultas que agrupan por id."""
+    def calcular():
+        return dict(session.exec(select(Genero.id_genero, Genero.nombre)).all())
+
+    return cache.obtener("generos", calcular, dependencias=("genero",))
+
+
+def listar(session: Session):
+    return sorted(nombres(session).items(), key=lambda g: clave(g[1]))
+
+
+def resolver(session: Session, nombres_genero):
+    """Géneros con esos nombres, creando los que no existan (comparando por clave)."""
+    claves = {clave(n): n for n in nombres_genero}
+    existentes = {g.clave: g for g in session.exec(select(Genero).where(Genero.clave.in_(claves))).all()}
+    for c, nombre in claves.items():
+        if c not in existentes:
+            try:
+                with session.begin_nested():
+                    genero = Genero(nombre=nombre, clave=c)
+                    session.add(genero)
+            except IntegrityError:
+                # Lo creó otra petición a la vez
+                genero = session.exec(select(Genero).where(Genero.clave == c)).one()
+            existentes[c] = genero
+    return [existentes[c] for c in claves]
+
+
+def asignar(session: Session, titulo: PeliculaSerie, generos):
+    """Reemplaza los géneros de `titulo` (lista de Genero) y actualiza su etiqueta."""
+    titulo.genero = etiqueta(generos)
+    if titulo.id_titulo is None:
+        session.flush()
+    # Las series por género del título se mueven con él (ver utils/series.py)
+    anteriores = session.exec(select(TituloGenero.id_genero_FK).where(TituloGenero.id_titulo_FK == titulo.id_titulo)).all()
+    series.cambiar_generos(session, titulo.id_titulo, anteriores, [g.id_genero for g in generos])
+    session.exec(delete(TituloGenero).where(TituloGenero.id_titulo_FK == titulo.id_titulo)
+                 .execution_options(etiquetas={"titulo_genero", f"peliculaserie:{titulo.id_titulo}"}))
+    session.add_all([TituloGenero(id_titulo_FK=titulo.id_titulo, id_genero_FK=g.id_genero) for g in generos])
+
+
+def por_ids(session: Session, ids):
+    """Géneros con esos ids, en ese orden (los ids que no existen se ignoran)."""
+    encontrados = {g.id_genero: g for g in session.exec(select(Genero).where(Genero.id_genero.in_(ids))).all()}
+    return [encontrados[i] for i in dict.fromkeys(ids) if i in encontrados]
+
+
+def reconstruir(session: Session, ids):
+    """Vuelve a crear las filas de TituloGenero de títulos restaurados del archivo, a partir de su etiqueta."""
+    for titulo in session.exec(select(PeliculaSerie).where(PeliculaSerie.id_titulo.in_(ids))).all():
+        asignar(session, titulo, resolver(session, separar(titulo.genero)))
+
+
+# ==========================================
+# MIGRACIÓN (sobre una conexión, sin ORM)
+# ==========================================
+
+def normalizar(conn):
+    """Crea los géneros a partir de los textos libres de PeliculaSerie.genero y enlaza cada título.
+
+    Variantes como "Acción" / "accion" quedan en un único género; la etiqueta de cada
+    título (también en el archivo) se reescribe con los nombres normalizados.
+    """
+    ids = dict(conn.execute(select(Genero.clave, Genero.id_genero)).all())
+    nombres_por_id = {i: n for i, n in conn.execute(select(Genero.id_genero, Genero.nombre)).all()}
+
+    def id_genero(nombre: str) -> int:
+        c = clave(nombre)
+        if c not in ids:
+            nuevo = conn.execute(insert(Genero.__table__).values(nombre=nombre, clave=c)).inserted_primary_key[0]
+            ids[c] = nuevo
+            nombres_por_id[nuevo] = nombre
+        return ids[c]
+
+    for nombre in GENEROS_BASE:
+        id_genero(nombre)
+
+    for tabla, enlazar in ((PeliculaSerie.__table__, True), (PeliculaSerieArchivo.__table__, False)):
+        etiquetas = []
+        enlaces = []
+        for id_titulo, texto in conn.execute(select(tabla.c.id_titulo, tabla.c.genero)).all():
+            generos = [id_genero(n) for n in separar(texto)]
+            nueva = ", ".join(nombres_por_id[g] for g in generos)
+            if nueva != texto:
+                etiquetas.append({"b_id": id_titulo, "b_genero": nueva})
+            if enlazar:
+                enlaces += [{"id_titulo_FK": id_titulo, "id_genero_FK": g} for g in generos]
+        if etiquetas:
+            conn.execute(update(tabla).where(tabla.c.id_titulo == bindparam("b_id"))
+                         .values(genero=bindparam("b_genero")), etiquetas)
+        if enlaces:
+            conn.execute(insert(TituloGenero.__table__), enlaces)
+
+
+def sembrar(conn):
+    """Géneros iniciales de una base de datos nueva."""
+    conn.execute(insert(Genero.__table__), [{"nombre": n, "clave": clave(n)} for n in GENEROS_BASE])
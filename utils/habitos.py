@@ -0,0 +1,123 @@
+import os
+from datetime import date, timedelta
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import func, exists
+from sqlmodel import Session, select
+from data.models import PeliculaSerie, Valoracion, Rutina, TituloGenero
+from utils import agenda, generos, series
+from utils.cache import cache
+
+load_dotenv()
+
+# Semanas del informe: las últimas HABITOS_SEMANAS_ATRAS (incluida la actual) y las próximas planeadas
+HABITOS_SEMANAS_ATRAS = int(os.getenv("HABITOS_SEMANAS_ATRAS", "12"))
+HABITOS_SEMANAS_ADELANTE = int(os.getenv("HABITOS_SEMANAS_ADELANTE", "4"))
+
+
+def _rachas(completadas: np.ndarray) -> dict:
+    """Racha actual (desde la última rutina terminada hacia atrás) y máxima de rutinas completadas seguidas."""
+    if not len(completadas):
+        return {"actual": 0, "maxima": 0}
+    # Bordes de cada tramo de True: +1 donde empieza, -1 donde termina
+    bordes = np.diff(np.concatenate(([0], completadas.astype(np.int8), [0])))
+    largos = np.flatnonzero(bordes == -1) - np.flatnonzero(bordes == 1)
+    fallidas = np.flatnonzero(~completadas)
+    actual = len(completadas) - (fallidas[-1] + 1 if len(fallidas) else 0)
+    return {"actual": int(actual), "maxima": int(largos.max(initial=0))}
+
+
+def _semanas(session: Session, id_usuario: int, hoy: date):
+    rutinas = session.exec(
+        select(Rutina.fecha_inicio, Rutina.fecha_fin, PeliculaSerie.duracion)
+        .join(PeliculaSerie, PeliculaSerie.id_titulo == Rutina.id_titulo_FK)
+        .where(Rutina.id_usuario_FK == id_usuario, Rutina.is_active == True)
+    ).all()
+    desde = agenda.lunes(hoy) - timedelta(weeks=HABITOS_SEMANAS_ATRAS - 1)
+    semanas = HABITOS_SEMANAS_ATRAS + HABITOS_SEMANAS_ADELANTE
+    por_dia = agenda.carga(rutinas, desde, desde + timedelta(weeks=semanas, days=-1))
+    por_semana = por_dia.reshape(semanas, 7).sum(axis=1)
+    lista = [{"semana": (desde + timedelta(weeks=i)).isoformat(), "minutos": round(float(minutos), 1),
+              "futura": i >= HABITOS_SEMANAS_ATRAS} for i, minutos in enumerate(por_semana)]
+    return lista, sum(r[2] for r in rutinas), por_semana[:HABITOS_SEMANAS_ATRAS]
+
+
+def _afinidad(session: Session, id_usuario: int):
+    """Por género: valoraciones y promedio del usuario, y minutos planeados en rutinas."""
+    valoradas = session.exec(
+        select(TituloGenero.id_genero_FK, func.count(Valoracion.id_valoracion), func.avg(Valoracion.puntuacion))
+        .join(Valoracion, Valoracion.id_titulo_FK == TituloGenero.id_titulo_FK)
+        .where(Valoracion.id_usuario_FK == id_usuario, Valoracion.is_active == True)
+        .group_by(TituloGenero.id_genero_FK)
+    ).all()
+    planeadas = session.exec(
+        select(TituloGenero.id_genero_FK, func.sum(PeliculaSerie.duracion))
+        .join(Rutina, Rutina.id_titulo_FK == TituloGenero.id_titulo_FK)
+        .join(PeliculaSerie, PeliculaSerie.id_titulo == TituloGenero.id_titulo_FK)
+        .where(Rutina.id_usuario_FK == id_usuario, Rutina.is_active == True)
+        .group_by(TituloGenero.id_genero_FK)
+    ).all()
+
+    filas = {}
+    for id_genero, total, promedio in valoradas:
+        filas[id_genero] = {"valoraciones": total, "promedio": round(promedio, 2), "minutos": 0}
+    for id_genero, minutos in planeadas:
+        filas.setdefault(id_genero, {"valoraciones": 0, "promedio": None, "minutos": 0})["minutos"] = int(minutos)
+
+    # Afinidad: media de la parte de sus valoraciones y de sus minutos planeados que va a cada género
+    total_valoraciones = sum(f["valoraciones"] for f in filas.values())
+    total_minutos = sum(f["minutos"] for f in filas.values())
+    partes = [t for t in (total_valoraciones, total_minutos) if t]
+    nombres = generos.nombres(session)
+    resultado = []
+    for id_genero, fila in filas.items():
+        cuotas = [fila[c] / t for c, t in (("valoraciones", total_valoraciones), ("minutos", total_minutos)) if t]
+        resultado.append({"id_genero": id_genero, "genero": nombres.get(id_genero, ""), **fila,
+                          "afinidad": round(sum(cuotas) / len(partes), 3)})
+    return sorted(resultado, key=lambda f: -f["afinidad"])
+
+
+def informe(session: Session, id_usuario: int) -> dict:
+    """Informe de hábitos de un usuario: minutos planeados por semana, géneros, puntuaciones y rachas.
+
+    Se guarda en caché hasta que cambian sus valoraciones o rutinas (etiqueta usuario:<id>), los
+    géneros o las duraciones de los títulos; el promedio global puede quedar atrasado hasta CACHE_TTL.
+    """
+    def calcular():
+        fecha = date.today()
+        semanas, minutos_totales, pasadas = _semanas(session, id_usuario, fecha)
+
+        total, promedio = session.exec(
+            select(func.count(Valoracion.id_valoracion), func.avg(Valoracion.puntuacion))
+            .where(Valoracion.id_usuario_FK == id_usuario, Valoracion.is_active == True)
+        ).one()
+        promedio_global = series.promedio_global(session)
+
+        # Una rutina terminada está completada si el usuario valoró su título
+        valorada = exists().where(Valoracion.id_usuario_FK == id_usuario, Valoracion.is_active == True,
+                                  Valoracion.id_titulo_FK == Rutina.id_titulo_FK)
+        completadas = np.array(session.exec(
+            select(valorada)
+            .where(Rutina.id_usuario_FK == id_usuario, Rutina.is_active == True, Rutina.fecha_fin < fecha)
+            .order_by(Rutina.fecha_fin, Rutina.id_rutina)
+        ).all(), dtype=bool)
+
+        return {
+            "id_usuario": id_usuario,
+            "semanas": semanas,
+            "minutos_planeados": int(minutos_totales),
+            "minutos_semana_promedio": round(float(pasadas.mean()), 1),
+            "generos": _afinidad(session, id_usuario),
+            "puntuacion": {
+                "valoraciones": total,
+                "promedio_usuario": None if promedio is None else round(promedio, 2),
+                "promedio_global": None if promedio_global is None else round(promedio_global, 2),
+                "diferencia": None if promedio is None or promedio_global is None
+                else round(promedio - promedio_global, 2),
+            },
+            "rachas": {"terminadas": len(completadas), "completadas": int(completadas.sum()),
+                       **_rachas(completadas)},
+        }
+
+    return cache.obtener(("habitos", id_usuario), calcular,
+                         dependencias=(f"usuario:{id_usuario}", "titulo_genero", "peliculaserie"))
@@ -0,0 +1,94 @@
+import hashlib
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+from dotenv import load_dotenv
+from sqlmodel import Session, select
+from data.models import Usuario, PeliculaSerie, Rutina
+from utils.cache import cache
+
+load_dotenv()
+
+# Eventos ya formateados que se reutilizan entre regeneraciones del feed (de todos los usuarios)
+ICS_EVENTOS_CACHE = int(os.getenv("ICS_EVENTOS_CACHE", "10000"))
+
+CABECERA = "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//CineHub//Rutinas//ES\r\nCALSCALE:GREGORIAN\r\n"
+PIE = "END:VCALENDAR\r\n"
+
+
+class Feed(NamedTuple):
+    etag: str
+    partes: List[str]
+    # Para comprobar el token de la URL sin otra consulta (ver auth.verificar_calendario)
+    version: int
+
+
+def _texto(valor: str) -> str:
+    # RFC 5545 §3.3.11: se escapan \ ; , y los saltos de línea
+    return (valor.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\r", "\\n").replace("\n", "\\n"))
+
+
+def _plegar(linea: str) -> str:
+    """Corta las líneas de más de 75 octetos (continuación con un espacio), sin partir caracteres UTF-8."""
+    partes = []
+    actual, octetos = "", 0
+    for caracter in linea:
+        largo = len(caracter.encode("utf-8"))
+        if octetos + largo > 75:
+            partes.append(actual)
+            actual, octetos = " ", 1
+        actual += caracter
+        octetos += largo
+    partes.append(actual)
+    return "\r\n".join(partes) + "\r\n"
+
+
+@lru_cache(maxsize=ICS_EVENTOS_CACHE)
+def _evento(id_rutina: int, nombre: str, inicio: date, fin: date, modificada: Optional[datetime], secuencia: int,
+            titulo: Optional[str], duracion: Optional[int]) -> str:
+    # Eventos de día completo: DTEND es exclusivo. DTSTAMP es la última modificación de la rutina: el feed no
+    # cambia si ella no cambia y, con SEQUENCE, los clientes aplican el cambio al mismo UID.
+    descripcion = nombre if duracion is None else f"{nombre} ({duracion} min)"
+    # Las rutinas anteriores a la columna `modificada` usan su fecha de inicio
+    marca = (modificada or datetime.combine(inicio, time())).astimezone(timezone.utc)
+    return "".join(_plegar(linea) for linea in (
+        "BEGIN:VEVENT",
+        f"UID:rutina-{id_rutina}@cinehub",
+        f"DTSTAMP:{marca:%Y%m%dT%H%M%SZ}",
+        f"LAST-MODIFIED:{marca:%Y%m%dT%H%M%SZ}",
+        f"SEQUENCE:{secuencia}",
+        f"DTSTART;VALUE=DATE:{inicio:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{fin + timedelta(days=1):%Y%m%d}",
+        f"SUMMARY:{_texto(titulo or nombre)}",
+        f"DESCRIPTION:{_texto(descripcion)}",
+        "END:VEVENT",
+    ))
+
+
+def feed(session: Session, id_usuario: int) -> Optional[Feed]:
+    """Rutinas activas del usuario en formato iCalendar, por partes, con su ETag (None si no está activo).
+
+    Se guarda en caché hasta que cambian el usuario o sus rutinas (etiqueta usuario:<id>) o los títulos,
+    así que un cliente que consulta cada pocos minutos no llega a la base de datos. El ETag es el hash
+    del contenido: igual en todos los workers y solo cambia si cambia el feed.
+    """
+    def calcular():
+        usuario = session.get(Usuario, id_usuario)
+        if not usuario or not usuario.is_active:
+            return None
+        filas = session.exec(
+            select(Rutina.id_rutina, Rutina.nombre, Rutina.fecha_inicio, Rutina.fecha_fin, Rutina.modificada,
+                   Rutina.secuencia, PeliculaSerie.titulo, PeliculaSerie.duracion)
+            .outerjoin(PeliculaSerie, (PeliculaSerie.id_titulo == Rutina.id_titulo_FK) & (PeliculaSerie.is_active == True))
+            .where(Rutina.id_usuario_FK == id_usuario, Rutina.is_active == True)
+            .order_by(Rutina.fecha_inicio, Rutina.id_rutina)
+        ).all()
+        partes = [CABECERA, *(_evento(*fila) for fila in filas), PIE]
+        resumen = hashlib.blake2b(digest_size=16)
+        for parte in partes:
+            resumen.update(parte.encode("utf-8"))
+        return Feed(f'"{resumen.hexdigest()}"', partes, usuario.version_calendario)
+
+    return cache.obtener(("ical", id_usuario), calcular, dependencias=(f"usuario:{id_usuario}", "peliculaserie"))
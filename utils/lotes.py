@@ -0,0 +1,153 @@
+from datetime import datetime
+from sqlalchemy import update, exists
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+from data.models import Usuario, PeliculaSerie, Valoracion, Rutina
+from utils import agenda, archivo, valoraciones
+from utils.cache import etiquetas_tabla
+from utils.db import usar_primaria
+
+# Filas que dependen de un usuario o título (para la eliminación en cascada)
+DEPENDIENTES = {
+    Usuario: [(Valoracion, Valoracion.id_usuario_FK), (Rutina, Rutina.id_usuario_FK)],
+    PeliculaSerie: [(Valoracion, Valoracion.id_titulo_FK), (Rutina, Rutina.id_titulo_FK)],
+}
+
+
+def _etiquetas(modelo, ids):
+    # Además de la tabla entera, las filas concretas (las usan los eventos en vivo de utils/eventos.py)
+    return etiquetas_tabla(modelo.__table__) | {f"{modelo.__tablename__}:{i}" for i in ids}
+
+
+def propietarios(session: Session, modelo, ids) -> set:
+    """Usuarios dueños de `ids` (también de los que ya están en el archivo), para comprobar permisos."""
+    if modelo is Usuario:
+        return set(ids)
+    usar_primaria(session)
+    duenos = set()
+    for tabla in (modelo, archivo.ARCHIVOS[modelo]):
+        duenos.update(session.exec(select(tabla.id_usuario_FK).where(archivo.pk(tabla).in_(ids))).all())
+    return duenos
+
+
+def _ejecutar(session: Session, modelo, sentencia, activar: bool) -> int:
+    """Ejecuta el UPDATE de eliminación/restauración; las valoraciones afectadas pasan a los agregados."""
+    if modelo is not Valoracion:
+        return session.exec(sentencia).rowcount
+    filas = session.exec(sentencia.returning(*valoraciones.COLUMNAS_AGREGADOS)).all()
+    if activar:
+        valoraciones.actualizar_agregados(session, agregadas=filas)
+    else:
+        valoraciones.actualizar_agregados(session, quitadas=filas)
+    return len(filas)
+
+
+def _valoraciones_restaurables(session: Session, *condiciones):
+    """IDs de valoraciones inactivas que se pueden reactivar sin romper ux_valoracion_activa.
+
+    Se descartan las que ya tienen otra activa para el mismo usuario y título y, entre
+    varias candidatas del mismo par, solo se conserva la más reciente.
+    """
+    activa = aliased(Valoracion)
+    filas = session.exec(
+        select(Valoracion.id_valoracion, Valoracion.id_usuario_FK, Valoracion.id_titulo_FK)
+        .where(*condiciones, Valoracion.is_active == False, ~exists().where(
+            activa.is_active == True,
+            activa.id_usuario_FK == Valoracion.id_usuario_FK,
+            activa.id_titulo_FK == Valoracion.id_titulo_FK))
+        .order_by(Valoracion.id_valoracion.desc())
+    ).all()
+    elegidas = {}
+    for id_valoracion, id_usuario, id_titulo in filas:
+        elegidas.setdefault((id_usuario, id_titulo), id_valoracion)
+    return list(elegidas.values())
+
+
+def eliminar_lote(session: Session, modelo, ids, cascada: bool = False):
+    """Eliminación lógica de `ids` con un solo UPDATE por tabla, en una transacción.
+
+    Con `cascada`, las valoraciones y rutinas activas del usuario/título se eliminan
+    con la misma marca de tiempo, para poder restaurarlas juntas después.
+    """
+    usar_primaria(session)
+    ahora = datetime.now()
+    afectados = {}
+    sentencia = (
+        update(modelo)
+        .where(archivo.pk(modelo).in_(ids), modelo.is_active == True)
+        .values(is_active=False, deleted_at=ahora)
+        .execution_options(etiquetas=_etiquetas(modelo, ids))
+    )
+    afectados[modelo.__tablename__] = _ejecutar(session, modelo, sentencia, activar=False)
+
+    if cascada:
+        # Solo los padres desactivados en esta llamada, no los que ya estaban en la papelera
+        eliminados = select(archivo.pk(modelo)).where(archivo.pk(modelo).in_(ids), modelo.deleted_at == ahora)
+        for dependiente, fk in DEPENDIENTES.get(modelo, []):
+            sentencia = (
+                update(dependiente)
+                .where(fk.in_(eliminados), dependiente.is_active == True)
+                .values(is_active=False, deleted_at=ahora)
+            )
+            afectados[dependiente.__tablename__] = _ejecutar(session, dependiente, sentencia, activar=False)
+
+    session.commit()
+    return afectados
+
+
+def restaurar_lote(session: Session, modelo, ids, cascada: bool = False):
+    """Restaura `ids` (también desde el archivo) con un solo UPDATE por tabla.
+
+    Con `cascada` solo vuelven las dependientes eliminadas junto con su padre
+    (misma `deleted_at`), no las que se habían eliminado por separado. Las archivadas
+    que chocarían con filas actuales se quedan en el archivo, en afectados["conflictos"],
+    y las rutinas que pasarían del máximo diario (utils/agenda.py) en la papelera, en afectados["excesos"].
+    """
+    # Lo que decide qué se restaura (archivo, valoraciones que chocarían) se lee de la primaria
+    usar_primaria(session)
+    ids = list(ids)
+    afectados = {}
+    conflictos = {}
+    excesos = []
+    archivo.restaurar_desde_archivo(session, modelo, ids, conflictos)
+
+    if cascada:
+        for dependiente, fk in DEPENDIENTES.get(modelo, []):
+            tabla_archivo = archivo.ARCHIVOS[dependiente]
+            archivadas = session.exec(select(archivo.pk(tabla_archivo)).where(
+                getattr(tabla_archivo, fk.key).in_(ids))).all()
+            archivo.restaurar_desde_archivo(session, dependiente, archivadas, conflictos)
+
+            # Debe ir antes de restaurar al padre, que pierde su deleted_at
+            deleted_padre = select(modelo.deleted_at).where(archivo.pk(modelo) == fk).scalar_subquery()
+            condiciones = [fk.in_(ids), dependiente.is_active == False, dependiente.deleted_at == deleted_padre]
+            if dependiente is Valoracion:
+                condiciones = [Valoracion.id_valoracion.in_(_valoraciones_restaurables(session, *condiciones))]
+            elif dependiente is Rutina:
+                candidatas = session.exec(select(Rutina.id_rutina).where(*condiciones)).all()
+                rechazadas = agenda.excesos_al_restaurar(session, candidatas)
+                excesos += rechazadas
+                condiciones = [Rutina.id_rutina.in_(set(candidatas) - set(rechazadas))]
+            sentencia = update(dependiente).where(*condiciones).values(is_active=True, deleted_at=None)
+            afectados[dependiente.__tablename__] = _ejecutar(session, dependiente, sentencia, activar=True)
+
+    if modelo is Valoracion:
+        ids = _valoraciones_restaurables(session, Valoracion.id_valoracion.in_(ids))
+    elif modelo is Rutina:
+        rechazadas = agenda.excesos_al_restaurar(session, ids)
+        excesos += rechazadas
+        ids = list(set(ids) - set(rechazadas))
+    sentencia = (
+        update(modelo)
+        .where(archivo.pk(modelo).in_(ids), modelo.is_active == False)
+        .values(is_active=True, deleted_at=None)
+        .execution_options(etiquetas=_etiquetas(modelo, ids))
+    )
+    afectados[modelo.__tablename__] = _ejecutar(session, modelo, sentencia, activar=True)
+    if conflictos:
+        afectados["conflictos"] = {tabla: sorted(set(ids)) for tabla, ids in conflictos.items()}
+    if excesos:
+        afectados["excesos"] = {"rutina": sorted(excesos)}
+
+    session.commit()
+    return afectados
@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+import httpx
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+from supa.supabase import SUPABASE_URL, SUPABASE_BUCKET
+
+load_dotenv()
+
+POSTERS_DIR = os.getenv("POSTERS_DIR", "cache/posters")
+# Tamaño total del caché en disco; al superarlo se borran los menos usados
+POSTERS_MAX_MB = int(os.getenv("POSTERS_MAX_MB", "256"))
+POSTERS_MAX_IMAGEN_MB = int(os.getenv("POSTERS_MAX_IMAGEN_MB", "10"))
+POSTERS_TIMEOUT = float(os.getenv("POSTERS_TIMEOUT", "10"))
+# Solo se descargan URLs bajo este prefijo (por defecto, las públicas del bucket de Supabase)
+POSTERS_ORIGEN = os.getenv("POSTERS_ORIGEN") or (
+    f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/public/{SUPABASE_BUCKET}/" if SUPABASE_URL and SUPABASE_BUCKET else "")
+
+
+class OrigenNoPermitido(ValueError):
+    pass
+
+
+class Poster(NamedTuple):
+    ruta: Path
+    etag: str
+    tipo: str
+    tamano: int
+
+
+def es_remota(img: Optional[str]) -> bool:
+    return bool(img) and img.startswith(("http://", "https://"))
+
+
+def version(img: str) -> str:
+    return hashlib.sha256(img.encode()).hexdigest()[:10]
+
+
+def url_poster(id_titulo: int, img: Optional[str]) -> Optional[str]:
+    """URL del póster servida por /img/{id}; las locales (static/) y las de otros sitios se dejan igual.
+
+    `v` cambia con la imagen del título, así que el navegador puede guardarla sin revalidar.
+    """
+    if not es_remota(img) or not posters.permitida(img):
+        return img
+    return f"/img/{id_titulo}?v={version(img)}"
+
+
+class CachePosters:
+    """Caché LRU en disco de imágenes remotas, con una sola descarga por imagen a la vez.
+
+    Cada imagen se guarda como <sha256 de la URL> junto a un .json con su ETag y tipo.
+    Con varios workers el directorio es compartido: cada uno adopta lo que descargaron
+    los demás, pero el orden LRU y el límite de tamaño se llevan por proceso.
+    """
+
+    def __init__(self, directorio: str, max_bytes: int, max_imagen: int, origen: str):
+        self.directorio = Path(directorio)
+        self.origen = urlsplit(origen)
+        self.max_bytes = max_bytes
+        self.max_imagen = max_imagen
+        self._entradas = OrderedDict()  # clave -> Poster, de menos a más reciente
+        self._bytes = 0
+        self._en_vuelo = {}  # clave -> tarea de descarga compartida por las peticiones concurrentes
+        self._cliente = None
+        self._carga = None  # tarea que lee lo que quedó en disco, compartida por las primeras peticiones
+        self.aciertos = 0
+        self.fallos = 0
+        self.compartidos = 0
+        self.desalojados = 0
+        self.errores = 0
+
+    def permitida(self, url: str) -> bool:
+        """La URL está bajo el origen configurado: mismo esquema, host y puerto, y dentro de su ruta.
+
+        Así el servidor nunca pide nada que no sea el bucket (ni la red interna ni metadatos del proveedor).
+        """
+        if not self.origen.netloc:
+            return False
+        try:
+            partes = urlsplit(url)
+            puerto = partes.port
+        except ValueError:
+            return False
+        return (partes.scheme == self.origen.scheme and partes.username is None and partes.password is None
+                and partes.hostname == self.origen.hostname and puerto == self.origen.port
+                and partes.path.startswith(self.origen.path) and ".." not in partes.path.split("/"))
+
+    def _rutas(self, clave: str):
+        return self.directorio / clave, self.directorio / f"{clave}.json"
+
+    def _leer(self, clave: str) -> Optional[Poster]:
+        ruta, meta = self._rutas(clave)
+        try:
+            datos = json.loads(meta.read_text(encoding="utf-8"))
+            return Poster(ruta, datos["etag"], datos["tipo"], ruta.stat().st_size)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _escanear(self) -> List[Tuple[str, Poster]]:
+        """Lo que quedó en disco, ordenado por último uso (mtime). Se ejecuta en un hilo."""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        encontradas = []
+        for meta in self.directorio.glob("*.json"):
+            poster = self._leer(meta.stem)
+            try:
+                if poster:
+                    encontradas.append((poster.ruta.stat().st_mtime, meta.stem, poster))
+            except FileNotFoundError:
+                continue
+        return [(clave, poster) for _, clave, poster in sorted(encontradas)]
+
+    async def _cargar(self):
+        if self._carga is None:
+            self._carga = asyncio.ensure_future(self._leer_disco())
+        try:
+            await asyncio.shield(self._carga)
+        except Exception:
+            self._carga = None
+            raise
+
+    async def _leer_disco(self):
+        desalojadas = []
+        for clave, poster in await run_in_threadpool(self._escanear):
+            desalojadas += self._agregar(clave, poster)
+        await run_in_threadpool(self._borrar, desalojadas)
+
+    def _agregar(self, clave: str, poster: Poster) -> List[str]:
+        """Registra la imagen y devuelve las claves desalojadas; sus archivos se borran con `_borrar`."""
+        if clave not in self._entradas:
+            self._bytes += poster.tamano
+        self._entradas[clave] = poster
+        desalojadas = []
+        while self._bytes > self.max_bytes and len(self._entradas) > 1:
+            antigua, desalojado = self._entradas.popitem(last=False)
+            self._bytes -= desalojado.tamano
+            desalojadas.append(antigua)
+            self.desalojados += 1
+        return desalojadas
+
+    def _borrar(self, claves: List[str]):
+        # En un hilo. Una respuesta que ya abrió la imagen (ver `abrir`) la sigue leyendo aunque se borre
+        for clave in claves:
+            ruta, meta = self._rutas(clave)
+            try:
+                # Primero el .json: sin él, otro worker no da por buena la imagen
+                meta.unlink(missing_ok=True)
+                ruta.unlink(missing_ok=True)
+            except OSError:
+                # En Windows no se puede borrar un archivo abierto: se queda fuera del índice hasta el próximo arranque
+                self.errores += 1
+
+    async def obtener(self, url: str) -> Poster:
+        if not self.permitida(url):
+            raise OrigenNoPermitido(f"{url} no está bajo {self.origen.geturl() or 'ningún origen configurado'}")
+        if self._carga is None or not self._carga.done():
+            await self._cargar()
+        clave = hashlib.sha256(url.encode()).hexdigest()
+
+        poster = self._entradas.get(clave)
+        if poster:
+            try:
+                await run_in_threadpool(os.utime, poster.ruta)
+                if clave in self._entradas:
+                    self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return poster
+            except FileNotFoundError:
+                # Otro worker (o este, mientras tanto) la desalojó
+                self._olvidar(clave)
+
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            self.fallos += 1
+            tarea = asyncio.ensure_future(self._llenar(clave, url))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_vuelo.pop(clave, None))
+        else:
+            self.compartidos += 1
+        # shield: si un cliente se desconecta, la descarga sigue para los demás
+        return await asyncio.shield(tarea)
+
+    async def abrir(self, url: str) -> Tuple[Poster, BinaryIO]:
+        """Como `obtener`, con la imagen ya abierta para enviarla.
+
+        Si se desaloja mientras se envía, el descriptor abierto la sigue leyendo hasta el final.
+        """
+        clave = hashlib.sha256(url.encode()).hexdigest()
+        for intento in range(2):
+            poster = await self.obtener(url)
+            try:
+                return poster, await run_in_threadpool(open, poster.ruta, "rb")
+            except FileNotFoundError:
+                # Desalojada entre `obtener` y abrirla: se vuelve a pedir una vez
+                self._olvidar(clave)
+                if intento:
+                    raise
+
+    def _olvidar(self, clave: str):
+        poster = self._entradas.pop(clave, None)
+        if poster:
+            self._bytes -= poster.tamano
+
+    async def _llenar(self, clave: str, url: str) -> Poster:
+        poster = await run_in_threadpool(self._leer, clave)
+        if poster is None:
+            try:
+                poster = await self._descargar(clave, url)
+            except Exception:
+                self.errores += 1
+                raise
+        await run_in_threadpool(self._borrar, self._agregar(clave, poster))
+        return poster
+
+    async def _descargar(self, clave: str, url: str) -> Poster:
+        if self._cliente is None:
+            # Sin seguir redirecciones: una respuesta 3xx del bucket podría apuntar fuera de él
+            self._cliente = httpx.AsyncClient(timeout=POSTERS_TIMEOUT, follow_redirects=False)
+        ruta, meta = self._rutas(clave)
+        huella = hashlib.sha256()
+        tamano = 0
+        with tempfile.NamedTemporaryFile(dir=self.directorio, delete=False) as temporal:
+            try:
+                async with self._cliente.stream("GET", url) as respuesta:
+                    respuesta.raise_for_status()
+                    tipo = respuesta.headers.get("content-type", "").split(";")[0]
+                    if not tipo.startswith("image/"):
+                        raise ValueError(f"{url} no es una imagen ({tipo})")
+                    async for trozo in respuesta.aiter_bytes():
+                        tamano += len(trozo)
+                        if tamano > self.max_imagen:
+                            raise ValueError(f"{url} supera {self.max_imagen} bytes")
+                        huella.update(trozo)
+                        temporal.write(trozo)
+            except BaseException:
+                temporal.close()
+                os.unlink(temporal.name)
+                raise
+        os.replace(temporal.name, ruta)
+
+        poster = Poster(ruta, f'"{huella.hexdigest()[:32]}"', tipo, tamano)
+        temporal_meta = meta.with_name(f"{meta.name}.{os.getpid()}")
+        temporal_meta.write_text(json.dumps({"etag": poster.etag, "tipo": tipo, "url": url}), encoding="utf-8")
+        os.replace(temporal_meta, meta)
+        return poster
+
+    def metricas(self):
+        return {"imagenes": len(self._entradas), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos, "fallos": self.fallos, "compartidos": self.compartidos,
+                "desalojados": self.desalojados, "errores": self.errores, "descargando": len(self._en_vuelo)}
+
+
+posters = CachePosters(POSTERS_DIR, POSTERS_MAX_MB * 1024 * 1024, POSTERS_MAX_IMAGEN_MB * 1024 * 1024, POSTERS_ORIGEN)
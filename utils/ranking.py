@@ -0,0 +1,166 @@
+import os
+import threading
+from bisect import bisect_left, insort
+from typing import NamedTuple, Optional
+from dotenv import load_dotenv
+from sqlmodel import Session, select
+from sqlalchemy import func
+from data.models import PeliculaSerie, Valoracion, TituloGenero
+from utils.cache import cache
+from utils.db import engine
+
+load_dotenv()
+
+# Promedio ponderado (bayesiano): (VOTOS_PREVIOS * MEDIA_PREVIA + suma) / (VOTOS_PREVIOS + total)
+# Sin RANKING_MEDIA_PREVIA se usa la media global, fijada en cada recarga completa del ranking
+RANKING_MEDIA_PREVIA = os.getenv("RANKING_MEDIA_PREVIA")
+RANKING_VOTOS_PREVIOS = float(os.getenv("RANKING_VOTOS_PREVIOS", "5"))
+# Valoraciones necesarias para entrar en el ranking
+RANKING_MIN_VOTOS = int(os.getenv("RANKING_MIN_VOTOS", "1"))
+# Media previa mientras no hay ninguna valoración (mitad de la escala de 0 a 5)
+MEDIA_SIN_DATOS = 2.5
+
+
+class Entrada(NamedTuple):
+    id_titulo: int
+    titulo: str
+    img: Optional[str]
+    suma: float
+    total: int
+    generos: tuple
+
+
+def _filas(session: Session, ids=None):
+    totales = select(Valoracion.id_titulo_FK, func.sum(Valoracion.puntuacion).label("suma"),
+                     func.count(Valoracion.id_valoracion).label("total")) \
+        .where(Valoracion.is_active == True).group_by(Valoracion.id_titulo_FK)
+    query = select(PeliculaSerie.id_titulo, PeliculaSerie.titulo, PeliculaSerie.img)
+    pares = select(TituloGenero.id_titulo_FK, TituloGenero.id_genero_FK)
+    if ids is None:
+        query = query.where(PeliculaSerie.is_active == True)
+        pares = pares.join(PeliculaSerie, PeliculaSerie.id_titulo == TituloGenero.id_titulo_FK) \
+            .where(PeliculaSerie.is_active == True)
+    else:
+        # Los ids que no vuelven (desactivados o archivados) salen del ranking
+        totales = totales.where(Valoracion.id_titulo_FK.in_(ids))
+        query = query.where(PeliculaSerie.id_titulo.in_(ids), PeliculaSerie.is_active == True)
+        pares = pares.where(TituloGenero.id_titulo_FK.in_(ids))
+    totales = totales.subquery()
+    query = query.add_columns(totales.c.suma, totales.c.total) \
+        .join(totales, totales.c.id_titulo_FK == PeliculaSerie.id_titulo)
+
+    generos = {}
+    for id_titulo, id_genero in session.exec(pares).all():
+        generos.setdefault(id_titulo, []).append(id_genero)
+    return [Entrada(fila[0], fila[1], fila[2], float(fila[3]), fila[4], tuple(generos.get(fila[0], ())))
+            for fila in session.exec(query).all()]
+
+
+class Ranking:
+    """Ranking de títulos por promedio ponderado, en listas ordenadas en memoria (global y por género).
+
+    Como el catálogo (utils/catalogo.py), un commit que toca títulos concretos o sus valoraciones
+    solo deja pendientes esos ids: en la siguiente lectura se vuelven a leer y se recolocan.
+    Leer el top N es cortar las N primeras claves de la lista, sin agrupar valoraciones.
+    """
+
+    def __init__(self, votos_previos: float = RANKING_VOTOS_PREVIOS, min_votos: int = RANKING_MIN_VOTOS,
+                 media_previa: Optional[float] = None):
+        self.votos_previos = votos_previos
+        self.min_votos = min_votos
+        self.media_fija = media_previa
+        self.media_previa = MEDIA_SIN_DATOS if media_previa is None else media_previa
+        self._entradas = {}  # id_titulo -> Entrada
+        self._claves = {}  # id_titulo -> clave en los índices
+        self._indice = []  # claves (-puntaje, -total, id_titulo), de mejor a peor
+        self._por_genero = {}  # id_genero -> claves, mismo orden
+        self._pendientes = set()
+        self._recargar = True
+        self._lock = threading.Lock()
+        self._lock_pendientes = threading.Lock()
+        self.recargas = 0
+        self.parciales = 0
+
+    def puntaje(self, suma: float, total: int) -> float:
+        return (self.votos_previos * self.media_previa + suma) / (self.votos_previos + total)
+
+    def al_invalidar(self, etiquetas):
+        if etiquetas is None or "peliculaserie:*" in etiquetas:
+            self._recargar = True
+            return
+        # Las valoraciones llevan la etiqueta de su título (ver utils/cache.py)
+        ids = {int(e.split(":", 1)[1]) for e in etiquetas if e.startswith("peliculaserie:")}
+        if ids:
+            with self._lock_pendientes:
+                self._pendientes.update(ids)
+
+    def _quitar(self, id_titulo: int):
+        clave = self._claves.pop(id_titulo, None)
+        if clave is None:
+            return
+        for indice in [self._indice] + [self._por_genero[g] for g in self._entradas[id_titulo].generos]:
+            del indice[bisect_left(indice, clave)]
+        del self._entradas[id_titulo]
+
+    def _poner(self, entrada: Entrada):
+        if entrada.total < self.min_votos:
+            return
+        clave = (-self.puntaje(entrada.suma, entrada.total), -entrada.total, entrada.id_titulo)
+        self._entradas[entrada.id_titulo] = entrada
+        self._claves[entrada.id_titulo] = clave
+        insort(self._indice, clave)
+        for id_genero in entrada.generos:
+            insort(self._por_genero.setdefault(id_genero, []), clave)
+
+    def _actualizar(self):
+        """Aplica los cambios pendientes (con self._lock tomado)."""
+        if not (self._recargar or self._pendientes):
+            return
+        # Siempre contra la primaria: una réplica atrasada dejaría valores viejos como buenos
+        with Session(engine) as session:
+            if self._recargar:
+                self._recargar = False
+                with self._lock_pendientes:
+                    self._pendientes = set()
+                entradas = _filas(session)
+                if self.media_fija is None and entradas:
+                    self.media_previa = sum(e.suma for e in entradas) / sum(e.total for e in entradas)
+                self._entradas, self._claves, self._indice, self._por_genero = {}, {}, [], {}
+                for entrada in entradas:
+                    self._poner(entrada)
+                self.recargas += 1
+            elif self._pendientes:
+                with self._lock_pendientes:
+                    ids, self._pendientes = self._pendientes, set()
+                entradas = _filas(session, ids)
+                for id_titulo in ids:
+                    self._quitar(id_titulo)
+                for entrada in entradas:
+                    self._poner(entrada)
+                self.parciales += 1
+
+    def top(self, limite: int = 5, id_genero: Optional[int] = None):
+        """Los `limite` mejores títulos activos, en total o de un género."""
+        with self._lock:
+            self._actualizar()
+            indice = self._indice if id_genero is None else self._por_genero.get(id_genero, [])
+            entradas = [self._entradas[clave[2]] for clave in indice[:limite]]
+            puntajes = [-clave[0] for clave in indice[:limite]]
+        return [{
+            "id_titulo": entrada.id_titulo,
+            "titulo": entrada.titulo,
+            "img": entrada.img,
+            "promedio_puntuacion": round(entrada.suma / entrada.total, 1),
+            "puntaje": round(puntaje, 2),
+            "total_valoraciones": entrada.total,
+        } for entrada, puntaje in zip(entradas, puntajes)]
+
+    def metricas(self):
+        return {"titulos": len(self._indice), "generos": len(self._por_genero),
+                "media_previa": round(self.media_previa, 3), "votos_previos": self.votos_previos,
+                "min_votos": self.min_votos, "recargas": self.recargas, "parciales": self.parciales,
+                "pendientes": len(self._pendientes)}
+
+
+ranking = Ranking(media_previa=None if RANKING_MEDIA_PREVIA is None else float(RANKING_MEDIA_PREVIA))
+cache.oyentes.append(ranking.al_invalidar)
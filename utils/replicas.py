@@ -0,0 +1,110 @@
+import itertools
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from utils import slow_queries
+
+load_dotenv()
+
+# URLs de las réplicas de solo lectura separadas por comas (vacío = todo va a la primaria)
+REPLICA_URLS = [url.strip() for url in os.getenv("REPLICA_URLS", "").split(",") if url.strip()]
+# Retraso máximo tolerado antes de dejar de leer de una réplica
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+# Cada cuánto se vuelve a medir el retraso de cada réplica
+REPLICA_CHEQUEO_SEGUNDOS = float(os.getenv("REPLICA_CHEQUEO_SEGUNDOS", "10"))
+# Tras una escritura, las lecturas de ese navegador van a la primaria durante este tiempo
+LECTURA_PRIMARIA_SEGUNDOS = int(os.getenv("LECTURA_PRIMARIA_SEGUNDOS", "10"))
+COOKIE_PRIMARIA = "leer_primaria"
+
+# En PostgreSQL, una réplica al día (WAL recibido == aplicado) no tiene retraso aunque
+# la última transacción reproducida sea antigua. En la primaria ambas funciones devuelven NULL.
+_SQL_RETRASO = {
+    "postgresql": """
+        SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+    """,
+}
+
+
+def opciones_pool(url: str, pool_size: int, max_overflow: int) -> dict:
+    # SQLite en memoria usa SingletonThreadPool, que no acepta pool_size ni max_overflow
+    url = make_url(url)
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        return {"pool_size": pool_size, "max_overflow": max_overflow}
+    return {}
+
+
+class Replica:
+    def __init__(self, url: str, pool_size: int, max_overflow: int):
+        self.engine = create_engine(url, pool_pre_ping=True, **opciones_pool(url, pool_size, max_overflow))
+        self.retraso = None  # None = sin medir o caída
+        self.medido_en = 0.0
+        slow_queries.instalar(self.engine)
+        event.listen(self.engine, "handle_error", self._al_fallar)
+
+    def _al_fallar(self, contexto):
+        # Conexión perdida (o imposible de abrir): se deja de usar hasta el próximo chequeo
+        if contexto.is_disconnect or contexto.connection is None:
+            self.retraso = None
+            self.medido_en = time.monotonic()
+
+    def medir(self):
+        sql = _SQL_RETRASO.get(self.engine.dialect.name)
+        try:
+            with self.engine.connect() as conn:
+                self.retraso = float(conn.execute(text(sql)).scalar() or 0) if sql else 0.0
+        except Exception:
+            self.retraso = None
+        self.medido_en = time.monotonic()
+
+    def disponible(self):
+        # Las mediciones las hace el hilo de Replicas.iniciar; si se atrasan (réplica colgada), no se usa
+        if time.monotonic() - self.medido_en > 3 * REPLICA_CHEQUEO_SEGUNDOS:
+            return False
+        return self.retraso is not None and self.retraso <= REPLICA_MAX_LAG
+
+    def estado(self):
+        return {"url": self.engine.url.render_as_string(hide_password=True),
+                "disponible": self.disponible(), "retraso": self.retraso}
+
+
+class Replicas:
+    """Réplicas de lectura repartidas por turnos, saltando las caídas o atrasadas."""
+
+    def __init__(self, urls, pool_size: int, max_overflow: int):
+        self.replicas = [Replica(url, pool_size, max_overflow) for url in urls]
+        self._turno = itertools.count()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def iniciar(self):
+        """Mide el retraso de las réplicas en un hilo aparte, nunca durante una petición."""
+        if not self.replicas or self._hilo is not None:
+            return
+        self._hilo = threading.Thread(target=self._medir_siempre, name="replicas", daemon=True)
+        self._hilo.start()
+
+    def _medir_siempre(self):
+        while True:
+            for replica in self.replicas:
+                replica.medir()
+            time.sleep(REPLICA_CHEQUEO_SEGUNDOS)
+
+    def elegir(self):
+        """Engine de una réplica disponible, o None para usar la primaria."""
+        if not self.replicas:
+            return None
+        with self._lock:
+            inicio = next(self._turno)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(inicio + i) % len(self.replicas)]
+            if replica.disponible():
+                return replica.engine
+        return None
+
+    def estado(self):
+        return [replica.estado() for replica in self.replicas]
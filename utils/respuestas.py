@@ -0,0 +1,36 @@
+import re
+from fastapi import Request
+from fastapi.responses import ORJSONResponse
+from sqlmodel import Session, select
+
+# Cada valor de If-None-Match: "*" o una etiqueta entre comillas, débil (W/) o fuerte
+_ETIQUETA = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+def columnas(modelo, esquema):
+    """Columnas de `modelo` que corresponden a los campos del esquema de lectura."""
+    return [getattr(modelo, campo) for campo in esquema.model_fields]
+
+
+def listar(session: Session, modelo, esquema, *condiciones) -> ORJSONResponse:
+    """Lista JSON construida directamente de las tuplas de la consulta.
+
+    No se crean objetos ORM ni se revalida con pydantic: orjson serializa los
+    diccionarios (fechas incluidas) tal como salen de la base de datos.
+    """
+    campos = list(esquema.model_fields)
+    filas = session.exec(select(*columnas(modelo, esquema)).where(*condiciones)).all()
+    return ORJSONResponse([dict(zip(campos, fila)) for fila in filas])
+
+
+def sin_cambios(request: Request, etag: str) -> bool:
+    """True si el If-None-Match de la petición coincide con `etag` (se responde 304).
+
+    Acepta listas separadas por comas y "*"; la comparación es débil (RFC 9110 §13.1.2),
+    así que W/"x" y "x" coinciden.
+    """
+    propia = etag.removeprefix("W/")
+    for etiqueta in _ETIQUETA.findall(request.headers.get("if-none-match", "")):
+        if etiqueta == "*" or etiqueta.removeprefix("W/") == propia:
+            return True
+    return False
@@ -0,0 +1,177 @@
+import math
+import os
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlmodel import Session, select
+from data.models import Valoracion, TituloGenero, ResumenValoracion
+from utils.cache import cache
+
+load_dotenv()
+
+GRANOS = ("dia", "semana", "mes")
+# Años que puede abarcar una consulta según el grano (unos 1000-1200 puntos como mucho)
+SERIES_MAX_ANIOS = {"dia": 3, "semana": 20, "mes": 100}
+# Valoraciones leídas por lote al rellenar las series desde cero
+SERIES_LOTE = int(os.getenv("SERIES_LOTE", "5000"))
+
+_ETIQUETAS = {"resumen_valoracion"}
+_TABLA = ResumenValoracion.__table__
+
+
+def inicio_periodo(grano: str, fecha: date) -> date:
+    if grano == "semana":
+        return fecha - timedelta(days=fecha.weekday())
+    if grano == "mes":
+        return fecha.replace(day=1)
+    return fecha
+
+
+def siguiente_periodo(grano: str, periodo: date) -> date:
+    if grano == "semana":
+        return periodo + timedelta(days=7)
+    if grano == "mes":
+        return (periodo + timedelta(days=32)).replace(day=1)
+    return periodo + timedelta(days=1)
+
+
+def _consulta_generos(ids):
+    return select(TituloGenero.id_titulo_FK, TituloGenero.id_genero_FK).where(TituloGenero.id_titulo_FK.in_(ids))
+
+
+def _generos(pares):
+    generos = defaultdict(list)
+    for id_titulo, id_genero in pares:
+        generos[id_titulo].append(id_genero)
+    return generos
+
+
+def _acumular(deltas, filas, signo: int, generos):
+    """Suma (o resta) cada valoración (id_titulo, fecha, puntuacion) en las filas que le corresponden."""
+    for id_titulo, fecha, puntuacion in filas:
+        claves = [(0, 0), (id_titulo, 0)] + [(0, g) for g in generos.get(id_titulo, ())]
+        for grano in GRANOS:
+            periodo = inicio_periodo(grano, fecha)
+            for t, g in claves:
+                delta = deltas[(grano, t, g, periodo)]
+                delta[0] += signo
+                delta[1] += signo * puntuacion
+                delta[2] += signo * puntuacion * puntuacion
+
+
+def _upsert(dialecto: str, deltas):
+    """INSERT ... ON CONFLICT que suma los deltas a las filas existentes, y sus parámetros."""
+    insert = insert_postgresql if dialecto == "postgresql" else insert_sqlite
+    sentencia = insert(_TABLA)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=[_TABLA.c.grano, _TABLA.c.id_titulo, _TABLA.c.id_genero, _TABLA.c.periodo],
+        set_={c: _TABLA.c[c] + sentencia.excluded[c] for c in ("total", "suma", "suma_cuadrados")})
+    filas = [{"grano": grano, "id_titulo": t, "id_genero": g, "periodo": periodo,
+              "total": total, "suma": suma, "suma_cuadrados": cuadrados}
+             for (grano, t, g, periodo), (total, suma, cuadrados) in deltas.items()]
+    return sentencia.execution_options(etiquetas=_ETIQUETAS), filas
+
+
+def _guardar(session: Session, deltas):
+    if deltas:
+        sentencia, filas = _upsert(session.get_bind().dialect.name, deltas)
+        session.exec(sentencia, params=filas)
+
+
+def registrar(session: Session, quitadas=(), agregadas=()):
+    """Lleva a las series las valoraciones activas que salen y entran (filas id_titulo, fecha, puntuacion)."""
+    if not quitadas and not agregadas:
+        return
+    generos = _generos(session.exec(_consulta_generos({fila[0] for fila in [*quitadas, *agregadas]})).all())
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    _acumular(deltas, agregadas, 1, generos)
+    _acumular(deltas, quitadas, -1, generos)
+    _guardar(session, deltas)
+
+
+def cambiar_generos(session: Session, id_titulo: int, anteriores, nuevos):
+    """Pasa las series de un título de sus géneros anteriores a los nuevos, a partir de las suyas propias."""
+    quitar, poner = set(anteriores) - set(nuevos), set(nuevos) - set(anteriores)
+    if not quitar and not poner:
+        return
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    for grano, periodo, total, suma, cuadrados in session.exec(
+            select(ResumenValoracion.grano, ResumenValoracion.periodo, ResumenValoracion.total,
+                   ResumenValoracion.suma, ResumenValoracion.suma_cuadrados)
+            .where(ResumenValoracion.id_titulo == id_titulo, ResumenValoracion.total != 0)).all():
+        for signo, generos in ((-1, quitar), (1, poner)):
+            for g in generos:
+                delta = deltas[(grano, 0, g, periodo)]
+                delta[0] += signo * total
+                delta[1] += signo * suma
+                delta[2] += signo * cuadrados
+    _guardar(session, deltas)
+
+
+def serie(session: Session, grano: str, desde: date, hasta: date,
+          id_titulo: Optional[int] = None, id_genero: Optional[int] = None):
+    """Un punto por periodo entre `desde` y `hasta` (también los vacíos), leído solo de las series."""
+    def calcular():
+        return session.exec(
+            select(ResumenValoracion.periodo, ResumenValoracion.total, ResumenValoracion.suma,
+                   ResumenValoracion.suma_cuadrados)
+            .where(ResumenValoracion.grano == grano, ResumenValoracion.id_titulo == (id_titulo or 0),
+                   ResumenValoracion.id_genero == (id_genero or 0),
+                   ResumenValoracion.periodo >= inicio_periodo(grano, desde), ResumenValoracion.periodo <= hasta)
+        ).all()
+
+    filas = {fila[0]: fila for fila in cache.obtener(
+        ("serie", grano, desde, hasta, id_titulo, id_genero), calcular, dependencias=("resumen_valoracion",))}
+    puntos = []
+    periodo = inicio_periodo(grano, desde)
+    while periodo <= hasta:
+        _, total, suma, cuadrados = filas.get(periodo, (periodo, 0, 0.0, 0.0))
+        promedio = suma / total if total else None
+        puntos.append({
+            "periodo": periodo.isoformat(),
+            "total": total,
+            "promedio": None if promedio is None else round(promedio, 2),
+            # Desviación típica de la población: sqrt(E[x²] - E[x]²)
+            "desviacion": None if promedio is None else round(math.sqrt(max(cuadrados / total - promedio ** 2, 0)), 2),
+        })
+        periodo = siguiente_periodo(grano, periodo)
+    return puntos
+
+
+def promedio_global(session: Session) -> Optional[float]:
+    """Promedio de todas las valoraciones activas, sumando las series mensuales."""
+    total, suma = session.exec(select(func.sum(ResumenValoracion.total), func.sum(ResumenValoracion.suma)).where(
+        ResumenValoracion.grano == "mes", ResumenValoracion.id_titulo == 0, ResumenValoracion.id_genero == 0)).one()
+    return suma / total if total else None
+
+
+def rellenar(conn, lote: int = SERIES_LOTE, confirmar: bool = False) -> int:
+    """Calcula las series desde cero recorriendo las valoraciones activas en lotes de `lote`.
+
+    Con `confirmar` se hace commit tras cada lote (para no mantener una transacción enorme);
+    en ese caso conviene hacerlo sin escrituras de valoraciones en curso.
+    """
+    conn.execute(_TABLA.delete())
+    if confirmar:
+        conn.commit()
+    ultimo = 0
+    procesadas = 0
+    while True:
+        filas = conn.execute(
+            select(Valoracion.id_valoracion, Valoracion.id_titulo_FK, Valoracion.fecha, Valoracion.puntuacion)
+            .where(Valoracion.is_active == True, Valoracion.id_valoracion > ultimo)
+            .order_by(Valoracion.id_valoracion).limit(lote)).all()
+        if not filas:
+            return procesadas
+        ultimo = filas[-1][0]
+        deltas = defaultdict(lambda: [0, 0.0, 0.0])
+        generos = _generos(conn.execute(_consulta_generos({fila[1] for fila in filas})).all())
+        _acumular(deltas, [fila[1:] for fila in filas], 1, generos)
+        conn.execute(*_upsert(conn.dialect.name, deltas))
+        if confirmar:
+            conn.commit()
+        procesadas += len(filas)
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+load_dotenv()
+
+# Configuración por variables de entorno
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "logs/slow_queries.log")
+SLOW_QUERY_LOG_BYTES = int(os.getenv("SLOW_QUERY_LOG_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "3"))
+# Parámetros cuyo nombre contiene alguna de estas palabras se guardan como "***"
+SLOW_QUERY_OCULTAR = tuple(p.strip().lower() for p in os.getenv(
+    "SLOW_QUERY_OCULTAR", "clave,correo,jti,token,password").split(",") if p.strip())
+
+# Ruta de la petición en curso (la fija el middleware de main.py)
+ruta_actual: ContextVar[str] = ContextVar("ruta_actual", default="-")
+
+_logger = logging.getLogger("cinehub.consultas_lentas")
+_lock_logger = threading.Lock()
+_MAX_PARAM = 1000
+# EXPLAIN ANALYZE repetiría el bloqueo con los de la petición ya tomados
+_BLOQUEA = re.compile(r"\bFOR\s+(NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b", re.IGNORECASE)
+_OCULTO = "***"
+
+
+def _configurar_logger():
+    # Se abre con la primera consulta lenta: importar el módulo no crea logs/ ni abre archivos
+    with _lock_logger:
+        if _logger.handlers:
+            return
+        Path(SLOW_QUERY_LOG).parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                      backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+
+
+def _sensible(nombre: str, valor) -> bool:
+    # Por el nombre del parámetro y, por si el nombre no lo delata (lower(correo) -> lower_1),
+    # por la pinta del valor: correos y hashes bcrypt
+    if any(palabra in nombre.lower() for palabra in SLOW_QUERY_OCULTAR):
+        return True
+    return isinstance(valor, str) and ("@" in valor or valor.startswith("$2"))
+
+
+def _serializar_parametros(context, parameters):
+    """Parámetros por nombre, con los sensibles sustituidos por "***", para reproducir el plan."""
+    compilados = getattr(context, "compiled_parameters", None)
+    if compilados:
+        nombrados = compilados[0]
+    elif isinstance(parameters, dict):
+        nombrados = parameters
+    else:
+        # SQL sin compilar y parámetros posicionales: no se sabe a qué columna va cada uno
+        nombrados = None
+    if nombrados is None:
+        valores = [_OCULTO] * len(parameters or ())
+    else:
+        valores = {n: _OCULTO if _sensible(n, v) else v for n, v in nombrados.items()}
+    texto = json.dumps(valores, default=str, ensure_ascii=False)
+    return texto if len(texto) <= _MAX_PARAM else texto[:_MAX_PARAM] + "..."
+
+
+def _explicar(dialecto, cursor, statement, parameters):
+    # Solo se explican lecturas sin bloqueos: EXPLAIN ANALYZE vuelve a ejecutar la sentencia
+    if not statement.lstrip().upper().startswith("SELECT") or _BLOQUEA.search(statement):
+        return None
+    if dialecto == "postgresql":
+        prefijo = "EXPLAIN (ANALYZE, BUFFERS) "
+    elif dialecto == "sqlite":
+        prefijo = "EXPLAIN QUERY PLAN "
+    else:
+        return None
+
+    # Cursor DBAPI aparte para no disparar de nuevo los eventos del engine
+    explain_cursor = cursor.connection.cursor()
+    # En PostgreSQL, dentro de un savepoint: si EXPLAIN falla (o lo cancela un timeout)
+    # la transacción de la petición no queda abortada
+    savepoint = dialecto == "postgresql"
+    try:
+        if savepoint:
+            explain_cursor.execute("SAVEPOINT explicar_consulta_lenta")
+        try:
+            explain_cursor.execute(prefijo + statement, parameters)
+            filas = explain_cursor.fetchall()
+        finally:
+            if savepoint:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT explicar_consulta_lenta")
+                explain_cursor.execute("RELEASE SAVEPOINT explicar_consulta_lenta")
+    except Exception as e:
+        return f"EXPLAIN no disponible: {e}"
+    finally:
+        explain_cursor.close()
+    return "\n".join(" | ".join(str(c) for c in fila) for fila in filas)
+
+
+def instalar(engine):
+    """Registra el medidor de consultas lentas sobre un engine."""
+    dialecto = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info["inicio_consulta"].pop()
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        if duracion_ms < SLOW_QUERY_MS:
+            return
+
+        plan = None
+        if not executemany and random.random() < SLOW_QUERY_EXPLAIN_RATE:
+            plan = _explicar(dialecto, cursor, statement, parameters)
+
+        _configurar_logger()
+        _logger.info(json.dumps({
+            "ts": time.time(),
+            "ms": round(duracion_ms, 2),
+            "ruta": ruta_actual.get(),
+            "sql": statement,
+            "params": None if executemany else _serializar_parametros(context, parameters),
+            "plan": plan,
+        }, ensure_ascii=False))
+
+
+def _leer_entradas():
+    # Se leen el archivo actual y los rotados: reúne lo registrado por todos los workers
+    archivos = [SLOW_QUERY_LOG] + [f"{SLOW_QUERY_LOG}.{i}" for i in range(1, SLOW_QUERY_LOG_BACKUPS + 1)]
+    for archivo in archivos:
+        if not os.path.exists(archivo):
+            continue
+        with open(archivo, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    yield json.loads(linea)
+                except ValueError:
+                    continue
+
+
+def peores_consultas(limite: int = 20):
+    """Agrupa el registro por sentencia y devuelve las de mayor tiempo acumulado."""
+    grupos = defaultdict(lambda: {"veces": 0, "total_ms": 0.0, "max_ms": 0.0, "ultima": None, "plan": None})
+    for entrada in _leer_entradas():
+        grupo = grupos[entrada["sql"]]
+        grupo["veces"] += 1
+        grupo["total_ms"] += entrada["ms"]
+        if entrada["ms"] >= grupo["max_ms"]:
+            grupo["max_ms"] = entrada["ms"]
+            grupo["ultima"] = entrada
+        if entrada.get("plan"):
+            grupo["plan"] = entrada["plan"]
+
+    resultado = []
+    for sql, grupo in grupos.items():
+        resultado.append({
+            "sql": sql,
+            "veces": grupo["veces"],
+            "total_ms": round(grupo["total_ms"], 2),
+            "max_ms": grupo["max_ms"],
+            "promedio_ms": round(grupo["total_ms"] / grupo["veces"], 2),
+            "ruta": grupo["ultima"]["ruta"],
+            "params": grupo["ultima"].get("params"),
+            "plan": grupo["plan"],
+        })
+    resultado.sort(key=lambda g: g["total_ms"], reverse=True)
+    return resultado[:limite]
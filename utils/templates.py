@@ -0,0 +1,21 @@
+import json
+from pathlib import Path
+from fastapi.templating import Jinja2Templates
+from utils.posters import url_poster
+
+# Entorno Jinja compartido por main.py y los routers: así las plantillas
+# se compilan una sola vez por proceso (ver calentamiento en main.py)
+templates = Jinja2Templates(directory="templates")
+
+# Generado por build_static.py; sin él se sirven los archivos originales
+_MANIFIESTO = Path("static/dist/manifest.json")
+manifiesto = json.loads(_MANIFIESTO.read_text(encoding="utf-8")) if _MANIFIESTO.exists() else {}
+
+
+def static_url(ruta: str) -> str:
+    """URL de un archivo de static/, versionada con su hash si se ejecutó build_static.py."""
+    return f"/static/{manifiesto.get(ruta, ruta)}"
+
+
+templates.env.globals["static_url"] = static_url
+templates.env.globals["poster_url"] = url_poster
@@ -0,0 +1,141 @@
+import os
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session as SessionOrm
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlmodel import Session, select
+from data.models import PeliculaSerie, Valoracion, TituloGenero, Tendencia
+from utils.cache import cache
+
+load_dotenv()
+
+# Vidas medias en días: una valoración de hace `vida_media` días pesa la mitad que una de hoy
+TENDENCIA_VIDAS_MEDIAS = [int(v) for v in os.getenv("TENDENCIA_VIDAS_MEDIAS", "1,7,30").split(",")]
+# Por debajo de este puntaje un título ya no se considera en tendencia
+TENDENCIA_MINIMO = float(os.getenv("TENDENCIA_MINIMO", "0.05"))
+
+# Decaimiento "hacia delante": cada valoración suma 2^((fecha - origen) / vida_media), que no cambia
+# con el tiempo, y al leer se multiplica por 2^((origen - ahora) / vida_media). Para que los pesos no
+# se desborden, el origen avanza cada PERIODO_VIDAS vidas medias y las filas se reescalan una vez.
+ORIGEN_BASE = date(2000, 1, 1)
+PERIODO_VIDAS = 64
+
+# Etiqueta propia: sin ella cada escritura invalidaría "peliculaserie:*" (su llave foránea) y
+# obligaría a recargar el catálogo y el ranking en cada valoración
+_ETIQUETAS = {"tendencia"}
+
+# Vida media -> origen con el que este worker ya comprobó (y confirmó) que las filas están reescaladas
+_al_dia = {}
+
+
+def origen(vida_media: int, hoy: Optional[date] = None) -> date:
+    periodo = PERIODO_VIDAS * vida_media
+    dias = ((hoy or date.today()) - ORIGEN_BASE).days
+    return date.fromordinal(ORIGEN_BASE.toordinal() + dias // periodo * periodo)
+
+
+def _peso(fecha: date, inicio: date, vida_media: int) -> float:
+    # Las fechas futuras cuentan como el final del periodo (acota el exponente)
+    dias = min((fecha - inicio).days, PERIODO_VIDAS * vida_media)
+    return 2.0 ** (dias / vida_media)
+
+
+def _reescalar(session: Session, vida_media: int, nuevo: date):
+    """Pasa las filas de `vida_media` al origen `nuevo` (una vez por periodo)."""
+    if _al_dia.get(vida_media) == nuevo or session.info.get("tendencias_al_dia", {}).get(vida_media) == nuevo:
+        return
+    anteriores = session.exec(select(Tendencia.origen).distinct()
+                              .where(Tendencia.vida_media == vida_media, Tendencia.origen != nuevo)).all()
+    for anterior in anteriores:
+        factor = 2.0 ** ((anterior - nuevo).days / vida_media)
+        session.exec(update(Tendencia)
+                     .where(Tendencia.vida_media == vida_media, Tendencia.origen == anterior)
+                     .values(puntaje=Tendencia.puntaje * factor, origen=nuevo)
+                     .execution_options(etiquetas=_ETIQUETAS))
+    # Solo se da por hecho si la transacción se confirma
+    session.info.setdefault("tendencias_al_dia", {})[vida_media] = nuevo
+
+
+@event.listens_for(SessionOrm, "after_commit")
+def _confirmar(session):
+    _al_dia.update(session.info.pop("tendencias_al_dia", {}))
+
+
+@event.listens_for(SessionOrm, "after_rollback")
+def _descartar(session):
+    session.info.pop("tendencias_al_dia", None)
+
+
+def registrar(session: Session, quitadas=(), agregadas=()):
+    """Suma o resta el peso de cada valoración (id_titulo, fecha, ...) en la transacción de `session`.
+
+    Cuesta lo mismo haya una o un millón de valoraciones anteriores: no se vuelven a leer.
+    """
+    if not quitadas and not agregadas:
+        return
+    filas = []
+    for vida_media in TENDENCIA_VIDAS_MEDIAS:
+        inicio = origen(vida_media)
+        _reescalar(session, vida_media, inicio)
+        deltas = defaultdict(float)
+        for fila in agregadas:
+            deltas[fila[0]] += _peso(fila[1], inicio, vida_media)
+        for fila in quitadas:
+            deltas[fila[0]] -= _peso(fila[1], inicio, vida_media)
+        filas += [{"id_titulo_FK": id_titulo, "vida_media": vida_media, "puntaje": delta, "origen": inicio}
+                  for id_titulo, delta in deltas.items()]
+
+    insert = insert_postgresql if session.get_bind().dialect.name == "postgresql" else insert_sqlite
+    sentencia = insert(Tendencia.__table__)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=[Tendencia.id_titulo_FK, Tendencia.vida_media],
+        set_={"puntaje": Tendencia.__table__.c.puntaje + sentencia.excluded.puntaje})
+    session.exec(sentencia.execution_options(etiquetas=_ETIQUETAS), params=filas)
+
+
+def tendencias(session: Session, vida_media: int, limite: int = 10, id_genero: Optional[int] = None):
+    """Títulos activos con más valoraciones recientes, sin recorrer las valoraciones."""
+    def calcular():
+        query = (
+            select(PeliculaSerie.id_titulo, PeliculaSerie.titulo, PeliculaSerie.img, Tendencia.puntaje, Tendencia.origen)
+            .join(Tendencia, Tendencia.id_titulo_FK == PeliculaSerie.id_titulo)
+            .where(Tendencia.vida_media == vida_media, Tendencia.puntaje > 0, PeliculaSerie.is_active == True)
+            .order_by(Tendencia.puntaje.desc())
+            .limit(limite)
+        )
+        if id_genero is not None:
+            query = query.join(TituloGenero, TituloGenero.id_titulo_FK == PeliculaSerie.id_titulo) \
+                .where(TituloGenero.id_genero_FK == id_genero)
+        return session.exec(query).all()
+
+    ahora = datetime.now()
+    resultado = []
+    for id_titulo, titulo, img, puntaje, inicio in cache.obtener(
+            ("tendencias", vida_media, limite, id_genero), calcular, dependencias=("tendencia", "peliculaserie")):
+        dias = (ahora - datetime.combine(inicio, datetime.min.time())).total_seconds() / 86400
+        actual = puntaje * 2.0 ** (-dias / vida_media)
+        if actual >= TENDENCIA_MINIMO:
+            resultado.append({"id_titulo": id_titulo, "titulo": titulo, "img": img, "puntaje": round(actual, 3)})
+    return resultado
+
+
+def reconstruir(conn):
+    """Calcula las tendencias desde cero a partir de las valoraciones activas (migración)."""
+    conn.execute(Tendencia.__table__.delete())
+    por_dia = conn.execute(select(Valoracion.id_titulo_FK, Valoracion.fecha, func.count(Valoracion.id_valoracion))
+                           .where(Valoracion.is_active == True)
+                           .group_by(Valoracion.id_titulo_FK, Valoracion.fecha)).all()
+    filas = []
+    for vida_media in TENDENCIA_VIDAS_MEDIAS:
+        inicio = origen(vida_media)
+        puntajes = defaultdict(float)
+        for id_titulo, fecha, total in por_dia:
+            puntajes[id_titulo] += total * _peso(fecha, inicio, vida_media)
+        filas += [{"id_titulo_FK": id_titulo, "vida_media": vida_media, "puntaje": puntaje, "origen": inicio}
+                  for id_titulo, puntaje in puntajes.items()]
+    if filas:
+        conn.execute(Tendencia.__table__.insert(), filas)
@@ -0,0 +1,84 @@
+from datetime import date
+from sqlalchemy import literal, exists
+from sqlalchemy.dialects.postgresql import insert as insert_postgresql
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlmodel import Session, select
+from data.models import Usuario, PeliculaSerie, Valoracion, ValoracionRead, VALORACION_ACTIVA
+from utils.respuestas import columnas
+from utils.cache import registrar_etiquetas
+from utils import tendencias, series
+
+# Columnas del índice único parcial ux_valoracion_activa (ver data/models.py)
+_CONFLICTO = dict(index_elements=[Valoracion.id_usuario_FK, Valoracion.id_titulo_FK], index_where=VALORACION_ACTIVA)
+# Lo que necesitan de cada valoración los agregados que se mantienen al escribir
+COLUMNAS_AGREGADOS = (Valoracion.id_titulo_FK, Valoracion.fecha, Valoracion.puntuacion)
+
+
+def actualizar_agregados(session: Session, quitadas=(), agregadas=()):
+    """Refleja en los agregados (tendencias y series) las valoraciones activas que salen y entran.
+
+    Cada fila es (id_titulo, fecha, puntuacion); se llama antes del commit, en la misma transacción.
+    """
+    tendencias.registrar(session, quitadas, agregadas)
+    series.registrar(session, quitadas, agregadas)
+
+
+def _insertar(session: Session, id_usuario: int, id_titulo: int, puntuacion: float, comentario: str, fecha: date):
+    """INSERT ... SELECT de una valoración activa, solo si el usuario y el título existen y están activos."""
+    insert = insert_postgresql if session.get_bind().dialect.name == "postgresql" else insert_sqlite
+    origen = select(
+        literal(id_usuario), literal(id_titulo), literal(puntuacion), literal(comentario), literal(fecha), literal(True)
+    ).where(
+        exists().where(Usuario.id_usuario == id_usuario, Usuario.is_active == True),
+        exists().where(PeliculaSerie.id_titulo == id_titulo, PeliculaSerie.is_active == True),
+    )
+    return insert(Valoracion).from_select(
+        ["id_usuario_FK", "id_titulo_FK", "puntuacion", "comentario", "fecha", "is_active"], origen)
+
+
+def _etiquetas(id_usuario: int, id_titulo: int):
+    return {"valoracion", "valoracion:*", f"usuario:{id_usuario}", f"peliculaserie:{id_titulo}"}
+
+
+def crear_valoracion(session: Session, id_usuario: int, id_titulo: int, puntuacion: float, comentario: str, fecha: date):
+    """Crea la valoración activa en una sola sentencia (ON CONFLICT DO NOTHING).
+
+    Devuelve el id nuevo, o None si ya existía una activa para ese usuario y título
+    (o si alguno de los dos no está activo).
+    """
+    sentencia = _insertar(session, id_usuario, id_titulo, puntuacion, comentario, fecha) \
+        .on_conflict_do_nothing(**_CONFLICTO) \
+        .returning(Valoracion.id_valoracion)
+    id_valoracion = session.exec(sentencia.execution_options(etiquetas=_etiquetas(id_usuario, id_titulo))).scalar()
+    if id_valoracion is not None:
+        registrar_etiquetas(session, {f"valoracion:{id_valoracion}"})
+        actualizar_agregados(session, agregadas=[(id_titulo, fecha, puntuacion)])
+    session.commit()
+    return id_valoracion
+
+
+def guardar_valoracion(session: Session, id_usuario: int, id_titulo: int, puntuacion: float, comentario: str, fecha: date):
+    """Crea o actualiza la valoración activa del usuario para el título en una sola sentencia.
+
+    Devuelve la fila guardada (campos de ValoracionRead), o None si el usuario o el título no están activos.
+    """
+    # Se bloquea al usuario hasta el commit (como en agenda.exceso): si aún no hay valoración activa,
+    # el FOR UPDATE de abajo no bloquea nada y dos guardados a la vez leerían los dos que no había
+    # anterior; el segundo tomaría la rama DO UPDATE sin restar la puntuación del primero
+    session.exec(select(Usuario.id_usuario).where(Usuario.id_usuario == id_usuario).with_for_update()).first()
+    # La anterior se resta de los agregados
+    anterior = session.exec(select(*COLUMNAS_AGREGADOS).where(
+        Valoracion.id_usuario_FK == id_usuario, Valoracion.id_titulo_FK == id_titulo, Valoracion.is_active == True,
+    ).with_for_update()).first()
+    sentencia = _insertar(session, id_usuario, id_titulo, puntuacion, comentario, fecha)
+    sentencia = sentencia.on_conflict_do_update(**_CONFLICTO, set_={
+        "puntuacion": sentencia.excluded.puntuacion,
+        "comentario": sentencia.excluded.comentario,
+        "fecha": sentencia.excluded.fecha,
+    }).returning(*columnas(Valoracion, ValoracionRead))
+    fila = session.exec(sentencia.execution_options(etiquetas=_etiquetas(id_usuario, id_titulo))).first()
+    if fila is not None:
+        registrar_etiquetas(session, {f"valoracion:{fila.id_valoracion}"})
+        actualizar_agregados(session, [anterior] if anterior else [], [(id_titulo, fila.fecha, fila.puntuacion)])
+    session.commit()
+    return fila